@@ -6,6 +6,8 @@ import logging
 # https://www.gradio.app/guides/quickstart
 import gradio as gr
 
+from sse_client import ask_question_stream
+
 # ---------------- Logging ----------------
 logging.basicConfig(
     level=logging.INFO,
@@ -93,10 +95,19 @@ with gr.Blocks(title="Media Assist API") as demo:
 
     # ---- Events ----
     def handle_question(question, model):
+        # A generator: Gradio re-renders the answer on every yield, so it grows as it streams
         if not question.strip():
-            return "❗ Please enter a question.", ""
-        answer, conv_id = ask_question(question, model)
-        return answer, conv_id
+            yield "❗ Please enter a question.", ""
+            return
+        answer, conv_id = "", str(uuid.uuid4())
+        for event, data in ask_question_stream(BASE_URL, question):
+            if event == "token":
+                answer += data["text"]
+            elif event == "done":
+                conv_id = data["conversation_id"]
+            elif event == "error":
+                answer += f"\n\n{data['error']}"
+            yield answer, conv_id
 
     ask_btn.click(
         handle_question,
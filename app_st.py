@@ -6,6 +6,8 @@ import logging
 # https://docs.streamlit.io/get-started/tutorials/create-an-app
 import streamlit as st
 
+from sse_client import ask_question_stream
+
 # ---------------- Logging ----------------
 logging.basicConfig(
     level=logging.INFO,
@@ -53,6 +55,17 @@ def ask_question(url, question, model="phi3:latest"):
         logger.exception("Error calling API")
         return {"answer": f"❌ API error: {e}"}
 
+# Answer text of the stream, keeping the conversation ID of its final event
+def stream_answer(url, question):
+    st.session_state.conversation_id = str(uuid.uuid4())
+    for event, data in ask_question_stream(url, question):
+        if event == "token":
+            yield data["text"]
+        elif event == "done":
+            st.session_state.conversation_id = data["conversation_id"]
+        elif event == "error":
+            yield f"\n\n{data['error']}"
+
 # Function to send feedback to the API
 def send_feedback(url, conversation_id, feedback):
     """Send feedback score to backend."""
@@ -97,18 +110,18 @@ st.session_state.question = st.text_input(
 )
 if st.button("Get Answer", type="primary"):
     if st.session_state.question.strip():
-        # with st.spinner(f"Querying {st.session_state.model}..."):
-        with st.spinner("Querying API..."):
-            response = ask_question(BASE_URL, st.session_state.question, st.session_state.model)
-        st.session_state.answer = response.get("answer", "No answer provided")
-        st.session_state.conversation_id = response.get("conversation_id", str(uuid.uuid4()))
+        # Render the answer as it streams; later reruns show it from the session state
+        st.subheader("Answer:")
+        st.session_state.answer = st.write_stream(stream_answer(BASE_URL, st.session_state.question))
+        st.session_state.streamed = True
     else:
         st.warning("❗ Please enter a question.")
 
 # Main: Show answer + feedback
 if st.session_state.answer:
-    st.subheader("Answer:")
-    st.write(st.session_state.answer)
+    if not st.session_state.pop("streamed", False):  # already shown while streaming
+        st.subheader("Answer:")
+        st.write(st.session_state.answer)
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -0,0 +1,149 @@
+import threading
+from time import monotonic
+from collections import OrderedDict
+
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+import logging
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+from config import SETTINGS
+
+
+class SemanticAnswerCache:
+    """
+    Answers of earlier questions, reused for paraphrases that retrieve the same documents.
+
+    A lookup is a hit when an earlier question retrieved exactly the same document ids
+    (so the prompt context is the same) and its vector has a cosine similarity of at least
+    ``threshold`` with the new question. Entries are evicted least recently used beyond
+    ``maxsize`` and expire after ``ttl`` seconds. The whole cache is dropped when
+    ``version()`` changes, e.g. when the index gains, updates or loses documents.
+
+    Attributes:
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that fell through to the model.
+        invalidations (int): Times the cache was dropped.
+    """
+
+    def __init__(self, vectorize, version=None, threshold=SETTINGS.ANSWER_CACHE_THRESHOLD,
+                 maxsize=SETTINGS.ANSWER_CACHE_SIZE, ttl=SETTINGS.ANSWER_CACHE_TTL or None):
+        """
+        Args:
+            vectorize (callable): List of questions -> sparse matrix with one row per question.
+            version (callable): Returns the current version of what the answers depend on.
+            threshold (float): Minimum cosine similarity of a paraphrase, in (0, 1].
+            maxsize (int): Maximum number of cached answers.
+            ttl (float): Seconds an answer stays valid, or None.
+        """
+        self.vectorize = vectorize
+        self.version = version
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # entry id -> (doc_ids, question vector, answer, created)
+        self._entries = OrderedDict()
+        # doc_ids -> ids of the entries that retrieved them
+        self._by_docs = {}
+        self._next_id = 0
+        self._version = version() if version is not None else None
+        self._lock = threading.Lock()
+
+    def _vector(self, question):
+        return normalize(sp.csr_matrix(self.vectorize([question])))
+
+    def _check_version(self):
+        if self.version is None:
+            return
+        version = self.version()
+        if version != self._version:
+            self._version = version
+            if self._entries:
+                self.invalidations += 1
+                logger.info("Index changed: dropped %d cached answers", len(self._entries))
+            self._entries.clear()
+            self._by_docs.clear()
+
+    def _remove(self, entry_id):
+        doc_ids = self._entries.pop(entry_id)[0]
+        ids = self._by_docs[doc_ids]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_docs[doc_ids]
+
+    def lookup(self, question, doc_ids):
+        """
+        The cached answer for a paraphrase of ``question`` that retrieved ``doc_ids``.
+
+        Args:
+            question (str): The incoming question.
+            doc_ids (sequence): Ids of the documents it retrieved, in rank order.
+
+        Returns:
+            tuple or None: (answer, similarity) of the most similar cached question, or None on a miss.
+        """
+        doc_ids = tuple(doc_ids)
+        with self._lock:
+            self._check_version()
+            # Vectorized under the lock, so the vector matches the version of the entries
+            vector = self._vector(question)
+            now = monotonic()
+            best, best_similarity = None, self.threshold
+            for entry_id in list(self._by_docs.get(doc_ids, ())):
+                entry = self._entries[entry_id]
+                if self.ttl is not None and now - entry[3] >= self.ttl:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(vector.multiply(entry[1]).sum())
+                if similarity >= best_similarity:
+                    best, best_similarity = entry_id, similarity
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][2], best_similarity
+
+    def store(self, question, doc_ids, answer):
+        """Caches the answer generated for ``question`` from the documents ``doc_ids``."""
+        doc_ids = tuple(doc_ids)
+        with self._lock:
+            self._check_version()
+            vector = self._vector(question)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (doc_ids, vector, answer, monotonic())
+            self._by_docs.setdefault(doc_ids, []).append(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_docs.clear()
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        """Counters and occupancy: {'hits', 'misses', 'hit_rate', 'invalidations', 'size', 'maxsize'}."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
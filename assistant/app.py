@@ -1,12 +1,14 @@
 import os
+import json
 import uuid
 import logging
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 
 import db
+import judge
 from config import SETTINGS
-from rag import rag
+from rag import rag, rag_stream, answer_cache, RELEVANCE_PENDING
 
 # ---------------- Logging ----------------
 logging.basicConfig(
@@ -18,6 +20,16 @@ logger = logging.getLogger(__name__)
 # ---------------- Flask App ----------------
 app = Flask(__name__)
 
+# Answers are judged off the request path; every app process drains the shared queue.
+# Streamed answers are always queued, so the workers run even when /question judges inline.
+# They start with the first request a process serves, so importing the app starts no threads.
+judge_workers = judge.JudgeWorkers()
+
+
+@app.before_request
+def start_judge_workers():
+    judge_workers.start()
+
 
 @app.route("/")
 def home():
@@ -69,6 +81,9 @@ def handle_question():
             logger.exception("Error saving conversation to DB")
             return jsonify({"error": "Database error"}), 500
 
+        if answer_data["relevance"] == RELEVANCE_PENDING:
+            judge_workers.notify()
+
         return jsonify(result), 200
 
     except Exception as e:
@@ -76,6 +91,70 @@ def handle_question():
         return jsonify({"error": str(e)}), 500
 
 
+def sse(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/question/stream", methods=["POST"])
+def handle_question_stream():
+    """
+    Streams the answer as server-sent events: a 'token' event ({"text": ...}) per piece of
+    the answer, then 'done' with the conversation_id and token stats once the conversation
+    is saved, or 'error'. Judging runs in the background workers after the stream closes.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    logger.info(f"Incoming streaming question request: {data}")
+
+    question = data.get("question")
+    if not question:
+        return jsonify({"error": "Question must be a non-empty string"}), 400
+
+    def events():
+        conversation_id = str(uuid.uuid4())
+        try:
+            for event, payload in rag_stream(question):
+                if event == "token":
+                    yield sse("token", {"text": payload})
+                else:
+                    answer_data = payload
+        except Exception:
+            logger.exception("Error calling rag_stream()")
+            yield sse("error", {"error": "RAG runner not available"})
+            return
+
+        try:
+            db.save_conversation(
+                conversation_id=conversation_id,
+                question=question,
+                answer_data=answer_data,
+            )
+        except Exception:
+            logger.exception("Error saving conversation to DB")
+            yield sse("error", {"error": "Database error"})
+            return
+
+        yield sse("done", {
+            "conversation_id": conversation_id,
+            "question": question,
+            "response_time": answer_data["response_time"],
+            "first_token_time": answer_data["first_token_time"],
+            "prompt_tokens": answer_data["prompt_tokens"],
+            "completion_tokens": answer_data["completion_tokens"],
+            "total_tokens": answer_data["total_tokens"],
+            "cached": answer_data["cached"],
+        })
+        if answer_data["relevance"] == RELEVANCE_PENDING:
+            judge_workers.notify()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/feedback", methods=["POST"])
 def handle_feedback():
     try:
@@ -108,6 +187,12 @@ def handle_feedback():
         logger.exception("Error saving feedback to DB")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/cache")
+def cache_stats():
+    """Hit rate and occupancy of the semantic answer cache of this process."""
+    return jsonify(answer_cache.info() if answer_cache is not None else {"enabled": False}), 200
+
+
 @app.route("/health")
 def health():
     # ✅ Check flask health check
@@ -0,0 +1,236 @@
+"""
+Asyncio variant of app.py with the same routes and JSON contracts.
+
+A request waiting on the LLM holds no thread: the model is called with AsyncOpenAI, the
+database through an asyncpg pool, and only the CPU-bound search runs on a small thread
+pool. One process serves hundreds of concurrent LLM-bound requests.
+
+uvicorn app_async:app --host 0.0.0.0 --port 5000
+"""
+import json
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, request, jsonify
+
+import db_async
+import judge
+import rag
+from config import SETTINGS
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# ---------------- Quart App ----------------
+app = Quart(__name__)
+# Streamed answers may take as long as a slow local model (gunicorn --timeout of app.py)
+app.config["RESPONSE_TIMEOUT"] = 1200
+
+# Search and answer-cache calls run here. On this corpus Index.search is mostly query tokenization
+# and SciPy call overhead under the GIL (the sparse products are a small share), so more threads
+# add no throughput; two let one search run while the other waits on a dense query embedding
+search_executor = ThreadPoolExecutor(max_workers=SETTINGS.ASYNC_SEARCH_WORKERS, thread_name_prefix="search")
+# Background judging is off the request path and keeps its own threads (see judge.py)
+judge_workers = judge.JudgeWorkers()
+
+
+@app.before_serving
+async def startup():
+    await db_async.open_pool()
+    judge_workers.start()
+
+
+@app.after_serving
+async def shutdown():
+    judge_workers.stop(timeout=5)
+    search_executor.shutdown(wait=False, cancel_futures=True)
+    await db_async.close_pool()
+
+
+@app.route("/")
+async def home():
+    return jsonify({
+        "message": "Welcome to the Media Assist API",
+        "status": "ok"
+    }), 200
+
+
+@app.route("/question", methods=["POST"])
+async def handle_question():
+    try:
+        conversation_id = str(uuid.uuid4())
+
+        data = await request.get_json(force=True, silent=True) or {}
+        logger.info(f"Incoming question request: {data}")
+
+        question = data.get("question")
+        if not question:
+            return jsonify({"error": "Question must be a non-empty string"}), 400
+
+        # Call RAG model
+        try:
+            answer_data = await rag.rag_async(question, search_executor)
+            if not isinstance(answer_data, dict) or "answer" not in answer_data:
+                logger.error(f"Invalid rag_async() response: {answer_data}")
+                return jsonify({"error": "Invalid response from RAG"}), 502
+        except Exception:
+            logger.exception("Error calling rag_async()")
+            return jsonify({"error": "RAG runner not available"}), 503
+
+        result = {
+            "conversation_id": conversation_id,
+            "question": question,
+            "answer": answer_data["answer"],
+        }
+
+        # Save conversation to DB
+        try:
+            await db_async.save_conversation(
+                conversation_id=conversation_id,
+                question=question,
+                answer_data=answer_data,
+            )
+        except Exception:
+            logger.exception("Error saving conversation to DB")
+            return jsonify({"error": "Database error"}), 500
+
+        if answer_data["relevance"] == rag.RELEVANCE_PENDING:
+            judge_workers.notify()
+
+        return jsonify(result), 200
+
+    except Exception as e:
+        logger.exception("Unexpected error in /question")
+        return jsonify({"error": str(e)}), 500
+
+
+def sse(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/question/stream", methods=["POST"])
+async def handle_question_stream():
+    """Server-sent events as in app.py: 'token' per piece of the answer, then 'done' or 'error'."""
+    data = await request.get_json(force=True, silent=True) or {}
+    logger.info(f"Incoming streaming question request: {data}")
+
+    question = data.get("question")
+    if not question:
+        return jsonify({"error": "Question must be a non-empty string"}), 400
+
+    async def events():
+        conversation_id = str(uuid.uuid4())
+        try:
+            async for event, payload in rag.rag_stream_async(question, search_executor):
+                if event == "token":
+                    yield sse("token", {"text": payload})
+                else:
+                    answer_data = payload
+        except Exception:
+            logger.exception("Error calling rag_stream_async()")
+            yield sse("error", {"error": "RAG runner not available"})
+            return
+
+        try:
+            await db_async.save_conversation(
+                conversation_id=conversation_id,
+                question=question,
+                answer_data=answer_data,
+            )
+        except Exception:
+            logger.exception("Error saving conversation to DB")
+            yield sse("error", {"error": "Database error"})
+            return
+
+        yield sse("done", {
+            "conversation_id": conversation_id,
+            "question": question,
+            "response_time": answer_data["response_time"],
+            "first_token_time": answer_data["first_token_time"],
+            "prompt_tokens": answer_data["prompt_tokens"],
+            "completion_tokens": answer_data["completion_tokens"],
+            "total_tokens": answer_data["total_tokens"],
+            "cached": answer_data["cached"],
+        })
+        if answer_data["relevance"] == rag.RELEVANCE_PENDING:
+            judge_workers.notify()
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/feedback", methods=["POST"])
+async def handle_feedback():
+    try:
+        data = await request.get_json(force=True, silent=True) or {}
+        logger.info(f"Incoming feedback: {data}")
+
+        conversation_id = data.get("conversation_id")
+        feedback_raw = data.get("feedback")
+
+        # Validate feedback value
+        try:
+            feedback = int(feedback_raw)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Feedback must be an integer (1 or -1)."}), 400
+
+        if not conversation_id or feedback not in [1, -1]:
+            return jsonify({"error": "Invalid input"}), 400
+
+        # Save feedback in DB
+        await db_async.save_feedback(
+            conversation_id=conversation_id,
+            feedback=feedback,
+        )
+        result = {
+            "message": f"✅ Feedback received for conversation {conversation_id}: {feedback}"
+        }
+        return jsonify(result), 200
+
+    except Exception as e:
+        logger.exception("Error saving feedback to DB")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/cache")
+async def cache_stats():
+    """Hit rate and occupancy of the semantic answer cache of this process."""
+    cache = rag.answer_cache
+    return jsonify(cache.info() if cache is not None else {"enabled": False}), 200
+
+
+@app.route("/health")
+async def health():
+    status = {"quart": "ok"}
+
+    try:
+        await db_async.ping()
+        status["postgres"] = "ok"
+    except Exception as e:
+        status["postgres"] = f"error: {str(e)}"
+
+    # Listing the models is enough to know the LLM endpoint answers
+    try:
+        models = await rag.async_client.models.list()
+        logger.info(f"LLM models: {[m.id for m in models.data]}")
+        status["ollama"] = "ok"
+    except Exception as e:
+        status["ollama"] = f"error: {str(e)}"
+
+    http_status = 200 if all(v == "ok" for v in status.values()) else 503
+    return jsonify(status), http_status
+
+
+if __name__ == "__main__":
+    print("🔄 Quart starting...")
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,492 @@
+"""
+Micro-benchmarks for the retrieval tier.
+
+python benchmark.py fused                 # fused scoring vs per-field cosine path
+python benchmark.py fused --scale 50      # replicate the corpus 50x
+python benchmark.py fused --scale 50 --categories 10   # only 1 in 10 documents passes the filter
+python benchmark.py batch                 # search_batch vs a loop over search
+python benchmark.py topk                  # partial top-k selection at 100k and 1M documents
+python benchmark.py collapse --groups 50  # top hit per group vs post-filtering a sorted list
+python benchmark.py sharded --scale 200 --shards 4   # scatter-gather over worker processes
+python benchmark.py memory --scale 50     # resident size of dict vs columnar storage
+python benchmark.py cache --scale 50      # repetitive traffic with and without query/result caches
+python benchmark.py ingest --scale 50     # peak memory of json.load + fit vs streaming fit_stream
+python benchmark.py lexicon --terms 1000000   # array-backed Lexicon vs a dict vocabulary, per-query batches
+python benchmark.py fit --scale 100       # fit scaling over 1, 2, 4, ... worker processes up to the CPU count
+"""
+import json
+import argparse
+import logging
+from time import perf_counter
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+import minsearch
+import sharding
+# Same boost weights and filter rag.search sends on every request
+from config import SETTINGS, SEARCH_BOOST as BOOST, SEARCH_FILTER as FILTER
+
+GROUND_TRUTH_PATH = "../Data/ground-truth-data.csv"
+
+QUERIES = [
+    "how can i report copyright violation",
+    "I want to cancel my subscription",
+    "where do I find content about history documentaries",
+    "report inappropriate adult content",
+    "what are your guidelines for reporting fake news",
+]
+
+
+def load_documents(data_path=SETTINGS.DATA_PATH, scale=1, categories=1):
+    """
+    Load documents and replicate them ``scale`` times to emulate a larger corpus.
+
+    With ``categories`` > 1 the replicas are spread over that many categories, and only
+    every ``categories``-th replica keeps the 'CONTENT' category that rag.search filters on.
+    """
+    with open(data_path, 'rt', encoding='utf-8') as f_in:
+        documents = json.load(f_in)
+    if categories == 1:
+        return documents * scale
+    return [
+        {**doc, 'category': 'CONTENT' if i % categories == 0 else f'OTHER_{i % categories}'}
+        for i in range(scale)
+        for doc in documents
+    ]
+
+
+def build_index(documents, storage='dicts', **cache_params):
+    return minsearch.Index(
+        text_fields=['intent', 'question', 'response'],
+        keyword_fields=['id', 'category'],
+        storage=storage,
+        **cache_params,
+    ).fit(documents)
+
+
+def timeit(fn, repeat):
+    """Return the mean wall time of ``fn`` in milliseconds."""
+    fn()  # warm-up
+    t0 = perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (perf_counter() - t0) / repeat * 1e3
+
+
+def per_field_search(index, query, filter_dict, boost_dict, num_results):
+    """The original scoring path: one cosine_similarity per field plus pandas filters."""
+    scores = np.zeros(len(index.docs))
+    for field, matrix in index.text_matrices.items():
+        query_vec = index.vectorize([query], field)
+        scores += cosine_similarity(query_vec, matrix).flatten() * boost_dict.get(field, 1)
+    for field, value in filter_dict.items():
+        if field in index.keyword_fields:
+            scores = scores * (index.keyword_df[field] == value).to_numpy()
+    non_zero_indices = np.where(scores > 0)[0]
+    sorted_indices = non_zero_indices[np.argsort(-scores[non_zero_indices])]
+    return [index.docs[i] for i in sorted_indices[:num_results]]
+
+
+def bench_fused(args):
+    documents = load_documents(scale=args.scale, categories=args.categories)
+    index = build_index(documents)
+    logger.info("Indexed %d documents, postings shape %s, nnz %d",
+                len(documents), index.postings.shape, index.postings.nnz)
+
+    for query in QUERIES:
+        expected = per_field_search(index, query, FILTER, BOOST, 5)
+        actual = index.search(query, filter_dict=FILTER, boost_dict=BOOST, num_results=5)
+        assert [d['id'] for d in actual] == [d['id'] for d in expected], query
+
+    def run(search):
+        return lambda: [search(q) for q in QUERIES]
+
+    baseline = timeit(run(lambda q: per_field_search(index, q, FILTER, BOOST, 5)), args.repeat)
+    fused = timeit(run(lambda q: index.search(q, filter_dict=FILTER, boost_dict=BOOST, num_results=5)), args.repeat)
+    per_query = len(QUERIES)
+    print(f"per-field cosine: {baseline / per_query:8.3f} ms/query")
+    print(f"fused postings:   {fused / per_query:8.3f} ms/query  ({baseline / fused:.1f}x)")
+
+
+def bench_batch(args):
+    import pandas as pd
+
+    index = build_index(load_documents(scale=args.scale))
+    queries = pd.read_csv(GROUND_TRUTH_PATH)['question'].tolist()
+    logger.info("Scoring %d ground-truth questions against %d documents", len(queries), len(index.docs))
+
+    def loop():
+        return [index.search(q, filter_dict=FILTER, boost_dict=BOOST, num_results=5) for q in queries]
+
+    def batch():
+        return index.search_batch(queries, filter_dict=FILTER, boost_dict=BOOST, num_results=5)
+
+    assert [[d['id'] for d in r] for r in loop()] == [[d['id'] for d in r] for r in batch()]
+
+    looped = timeit(loop, args.repeat)
+    batched = timeit(batch, args.repeat)
+    print(f"loop over search: {len(queries) / looped * 1e3:10.0f} queries/s")
+    print(f"search_batch:     {len(queries) / batched * 1e3:10.0f} queries/s  ({looped / batched:.1f}x)")
+
+
+def full_sort_top_k(scores, k):
+    """The original selection: argsort every non-zero score."""
+    non_zero_indices = np.where(scores > 0)[0]
+    return non_zero_indices[np.argsort(-scores[non_zero_indices])][:k]
+
+
+def bench_topk(args):
+    rng = np.random.default_rng(42)
+    for size in args.sizes:
+        # Broad query: almost every document gets a non-zero score
+        scores = rng.random(size)
+        scores[rng.random(size) < 0.05] = 0.0
+        assert np.array_equal(full_sort_top_k(scores, args.k), minsearch.top_k(scores, args.k))
+
+        sort = timeit(lambda: full_sort_top_k(scores, args.k), args.repeat)
+        partial = timeit(lambda: minsearch.top_k(scores, args.k), args.repeat)
+        print(f"{size:>9,d} docs  argsort: {sort:8.3f} ms  top_k: {partial:8.3f} ms  ({sort / partial:.1f}x)")
+
+
+def post_filter_collapse(scores, groups, k, group_size):
+    """Collapsing after the fact: sort every non-zero score, then walk the list in Python."""
+    counts = {}
+    kept = []
+    for i in full_sort_top_k(scores, len(scores)):
+        if counts.get(groups[i], 0) < group_size:
+            counts[groups[i]] = counts.get(groups[i], 0) + 1
+            kept.append(i)
+            if len(kept) == k:
+                break
+    return np.array(kept, dtype=np.intp)
+
+
+def bench_collapse(args):
+    rng = np.random.default_rng(42)
+    for size in args.sizes:
+        scores = rng.random(size)
+        scores[rng.random(size) < 0.05] = 0.0
+        # Skewed group sizes, like a few intents holding most documents
+        groups = np.minimum(rng.zipf(1.5, size), args.groups) - 1
+        expected = post_filter_collapse(scores, groups, args.k, args.group_size)
+        assert np.array_equal(expected, minsearch.top_k_collapsed(scores, groups, args.k, args.group_size))
+
+        post = timeit(lambda: post_filter_collapse(scores, groups, args.k, args.group_size), args.repeat)
+        vectorized = timeit(lambda: minsearch.top_k_collapsed(scores, groups, args.k, args.group_size), args.repeat)
+        print(f"{size:>9,d} docs  post-filter: {post:8.3f} ms  top_k_collapsed: {vectorized:8.3f} ms  "
+              f"({post / vectorized:.1f}x)")
+
+
+def bench_sharded(args):
+    import pandas as pd
+
+    documents = load_documents(scale=args.scale)
+    queries = pd.read_csv(GROUND_TRUTH_PATH)['question'].tolist()[:args.queries]
+    index = build_index(documents)
+    logger.info("Scoring %d questions against %d documents in %d shards", len(queries), len(documents), args.shards)
+
+    with sharding.ShardedIndex(
+        text_fields=['intent', 'question', 'response'],
+        keyword_fields=['id', 'category'],
+        n_shards=args.shards,
+    ).fit(documents) as sharded:
+        def single():
+            return index.search_batch(queries, filter_dict=FILTER, boost_dict=BOOST, num_results=5, output_ids=True)
+
+        def scattered():
+            return sharded.search_batch(queries, filter_dict=FILTER, boost_dict=BOOST, num_results=5, output_ids=True)
+
+        assert [[d['_id'] for d in r] for r in single()] == [[d['_id'] for d in r] for r in scattered()]
+
+        base = timeit(single, args.repeat)
+        fanned = timeit(scattered, args.repeat)
+    print(f"single index:     {len(queries) / base * 1e3:10.0f} queries/s")
+    print(f"{args.shards} shards:         {len(queries) / fanned * 1e3:10.0f} queries/s  ({base / fanned:.1f}x)")
+
+
+def bench_memory(args):
+    import gc
+    import tracemalloc
+
+    sizes = {}
+    for storage in minsearch.STORAGE_MODES:
+        gc.collect()
+        tracemalloc.start()
+        # Fresh copies, so the dict index owns its documents like one loaded from disk
+        documents = json.loads(json.dumps(load_documents(scale=args.scale)))
+        index = build_index(documents, storage=storage)
+        del documents
+        gc.collect()
+        sizes[storage] = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+
+        results = index.search(QUERIES[0], filter_dict=FILTER, boost_dict=BOOST, num_results=5)
+        logger.info("%s: %d documents, top hit %s", storage, len(index.docs), results[0]['id'])
+        del index, results
+
+    print(f"dicts:    {sizes['dicts']:8.1f} MiB")
+    print(f"columnar: {sizes['columnar']:8.1f} MiB  ({sizes['dicts'] / sizes['columnar']:.1f}x smaller)")
+
+
+def bench_cache(args):
+    import pandas as pd
+
+    documents = load_documents(scale=args.scale)
+    uncached = build_index(documents)
+    cached = build_index(documents, query_cache_size=args.cache_size, result_cache_size=args.cache_size)
+
+    # Skewed traffic: a few hot questions make up most requests
+    questions = pd.read_csv(GROUND_TRUTH_PATH)['question'].tolist()
+    rng = np.random.default_rng(42)
+    ranks = np.minimum(rng.zipf(1.3, args.requests), len(questions)) - 1
+    traffic = [questions[i] for i in ranks]
+    logger.info("%d requests, %d distinct questions, %d documents",
+                len(traffic), len(set(traffic)), len(documents))
+
+    def serve(index):
+        return lambda: [index.search(q, filter_dict=FILTER, boost_dict=BOOST, num_results=5) for q in traffic]
+
+    assert serve(uncached)() == serve(cached)()
+    plain = timeit(serve(uncached), args.repeat)
+    hot = timeit(serve(cached), args.repeat)
+    print(f"no cache:  {len(traffic) / plain * 1e3:10.0f} queries/s")
+    print(f"cached:    {len(traffic) / hot * 1e3:10.0f} queries/s  ({plain / hot:.1f}x)")
+    print(cached.cache_info)
+
+
+def bench_ingest(args):
+    import os
+    import gc
+    import tempfile
+    import tracemalloc
+
+    import ingest
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'documents.json')
+        with open(data_path, 'wt', encoding='utf-8') as f_out:
+            json.dump(load_documents(scale=args.scale), f_out)
+        logger.info("Wrote %.1f MiB of documents", os.path.getsize(data_path) / 2**20)
+
+        def whole():
+            with open(data_path, 'rt', encoding='utf-8') as f_in:
+                return build_index(json.load(f_in), storage=args.storage)
+
+        def streamed():
+            return minsearch.Index(
+                text_fields=['intent', 'question', 'response'],
+                keyword_fields=['id', 'category'],
+                storage=args.storage,
+            ).fit_stream(ingest.iter_documents(data_path), chunk_size=args.chunk_size)
+
+        peaks = {}
+        for name, build in [('json.load + fit', whole), ('fit_stream', streamed)]:
+            gc.collect()
+            tracemalloc.start()
+            t0 = perf_counter()
+            index = build()
+            elapsed = perf_counter() - t0
+            peaks[name] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            print(f"{name:16s} peak {peaks[name]:8.1f} MiB  {elapsed:6.2f} s  ({len(index.docs)} documents)")
+            del index
+    print(f"peak reduction: {peaks['json.load + fit'] / peaks['fit_stream']:.1f}x")
+
+
+def bench_lexicon(args):
+    import gc
+    import tracemalloc
+
+    # Distinct word n-grams of the corpus vocabulary, as an n-gram index would hold them
+    words = build_index(load_documents()).lexicon.terms
+    rng = np.random.default_rng(42)
+    terms = set(words)
+    for n in (2, 3):
+        if len(terms) >= args.terms:
+            break
+        grams = rng.integers(0, len(words), size=(min(args.terms - len(terms), len(words) ** n // 2), n))
+        terms.update(" ".join(words[i] for i in gram) for gram in grams.tolist())
+    terms = sorted(terms)[:args.terms]
+    terms = sorted(terms)
+    logger.info("Lexicon of %d terms", len(terms))
+
+    gc.collect()
+    tracemalloc.start()
+    vocabulary = {term: i for i, term in enumerate(terms)}
+    dict_size = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+    tracemalloc.start()
+    lexicon = minsearch.Lexicon.from_terms(terms)
+    lexicon_size = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+    # The term strings themselves are shared with the dict, count them once for it
+    strings_size = sum(len(term) + 49 for term in terms) / 2**20
+    print(f"dict vocabulary: {dict_size + strings_size:8.1f} MiB")
+    print(f"Lexicon arrays:  {lexicon_size:8.1f} MiB  ({(dict_size + strings_size) / lexicon_size:.1f}x smaller)")
+
+    # Query-sized batches with Zipf-distributed term frequencies, like real traffic, and 20% unknown tokens
+    ranks = rng.permutation(len(terms))[np.minimum(rng.zipf(1.2, size=args.tokens), len(terms)) - 1]
+    tokens = [terms[i] for i in ranks.tolist()] + [f"unknown {i}" for i in range(args.tokens // 4)]
+    rng.shuffle(tokens)
+    batches = [tokens[i:i + args.batch] for i in range(0, len(tokens), args.batch)]
+    expected = [np.array([vocabulary.get(t, -1) for t in batch]) for batch in batches]
+    assert all(np.array_equal(ids, lexicon.search(batch)) for ids, batch in zip(expected, batches))
+    assert all(np.array_equal(ids, lexicon.lookup(batch)) for ids, batch in zip(expected, batches))
+    logger.info("%d distinct of %d tokens", len(set(tokens)), len(tokens))
+
+    def dict_lookup():
+        return [np.array([vocabulary.get(t, -1) for t in batch], dtype=np.int64) for batch in batches]
+
+    def lexicon_search():
+        return [lexicon.search(batch) for batch in batches]
+
+    def lexicon_lookup():
+        return [lexicon.lookup(batch) for batch in batches]
+
+    def cold_lookup():
+        lexicon._cache.clear()
+        return lexicon_lookup()
+
+    looked_up = timeit(dict_lookup, args.repeat)
+    searched = timeit(lexicon_search, args.repeat)
+    cold = timeit(cold_lookup, args.repeat)
+    cached = timeit(lexicon_lookup, args.repeat)
+    print(f"dict lookup:            {looked_up / len(tokens) * 1e6:8.0f} ns/token  (batches of {args.batch} tokens)")
+    print(f"Lexicon binary search:  {searched / len(tokens) * 1e6:8.0f} ns/token  ({looked_up / searched:.2f}x)")
+    print(f"Lexicon lookup, cold:   {cold / len(tokens) * 1e6:8.0f} ns/token  ({looked_up / cold:.2f}x)")
+    print(f"Lexicon lookup, warm:   {cached / len(tokens) * 1e6:8.0f} ns/token  ({looked_up / cached:.2f}x, "
+          f"{len(lexicon._cache)} cached tokens)")
+
+
+def distinct_replicas(documents, scale):
+    """
+    ``scale`` copies of the corpus in which every copy renames about two thirds of its longer
+    words, so copies share the common vocabulary but are not exact duplicates of each other.
+    """
+    import re
+    import zlib
+
+    def rename(text, replica):
+        def word(match):
+            w = match.group(0)
+            return f"{w}x{replica}" if len(w) > 3 and zlib.crc32(f"{w}{replica}".encode()) % 3 else w
+        return re.sub(r"\w+", word, text)
+
+    return [
+        {**doc, **{field: rename(doc[field], replica) for field in ('intent', 'question', 'response')}}
+        if replica else doc
+        for replica in range(scale)
+        for doc in documents
+    ]
+
+
+def bench_fit(args):
+    import os
+
+    documents = distinct_replicas(load_documents(), args.scale)
+    params = dict(text_fields=['intent', 'question', 'response'], keyword_fields=['id', 'category'])
+
+    n_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    logger.info("%d CPUs available", n_cpus)
+    # Powers of two up to the CPU count, and the CPU count itself
+    jobs = args.jobs or sorted({1 << i for i in range(n_cpus.bit_length()) if 1 << i <= n_cpus} | {n_cpus})
+    if max(jobs) > n_cpus:
+        logger.warning("n_jobs above the %d available CPUs measure oversubscription, not scaling", n_cpus)
+
+    serial = None
+    for n_jobs in jobs:
+        t0 = perf_counter()
+        index = minsearch.Index(**params).fit(documents, n_jobs=n_jobs, chunk_size=args.chunk_size)
+        elapsed = perf_counter() - t0
+        if serial is None:
+            serial = (index, elapsed)
+        else:
+            expected = serial[0]
+            assert index.lexicon.terms == expected.lexicon.terms
+            assert (index.postings != expected.postings).nnz == 0
+        speedup = serial[1] / elapsed
+        print(f"{len(documents):>9,d} docs  n_jobs={n_jobs:<3d} {elapsed:7.2f} s  ({speedup:.1f}x, "
+              f"{speedup / n_jobs:.0%} parallel efficiency)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fused = subparsers.add_parser("fused", help="Fused single-matmul scoring vs per-field cosine")
+    fused.add_argument("--scale", type=int, default=1, help="Replicate the corpus N times")
+    fused.add_argument("--categories", type=int, default=1, help="Spread the replicas over N categories")
+    fused.add_argument("--repeat", type=int, default=50)
+    fused.set_defaults(func=bench_fused)
+
+    batch = subparsers.add_parser("batch", help="search_batch vs a loop over search")
+    batch.add_argument("--scale", type=int, default=1, help="Replicate the corpus N times")
+    batch.add_argument("--repeat", type=int, default=3)
+    batch.set_defaults(func=bench_batch)
+
+    topk = subparsers.add_parser("topk", help="Partial top-k selection vs full argsort")
+    topk.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    topk.add_argument("-k", type=int, default=5)
+    topk.add_argument("--repeat", type=int, default=20)
+    topk.set_defaults(func=bench_topk)
+
+    collapse = subparsers.add_parser("collapse", help="Collapsed top-k selection vs post-filtering")
+    collapse.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    collapse.add_argument("--groups", type=int, default=50, help="Distinct collapse_field values")
+    collapse.add_argument("-k", type=int, default=3)
+    collapse.add_argument("--group-size", type=int, default=1)
+    collapse.add_argument("--repeat", type=int, default=10)
+    collapse.set_defaults(func=bench_collapse)
+
+    sharded = subparsers.add_parser("sharded", help="ShardedIndex scatter-gather vs a single index")
+    sharded.add_argument("--scale", type=int, default=50, help="Replicate the corpus N times")
+    sharded.add_argument("--shards", type=int, default=4)
+    sharded.add_argument("--queries", type=int, default=256, help="Ground-truth questions per batch")
+    sharded.add_argument("--repeat", type=int, default=3)
+    sharded.set_defaults(func=bench_sharded)
+
+    memory = subparsers.add_parser("memory", help="Resident size of dict vs columnar document storage")
+    memory.add_argument("--scale", type=int, default=50, help="Replicate the corpus N times")
+    memory.set_defaults(func=bench_memory)
+
+    cache = subparsers.add_parser("cache", help="Query-vector and result caches on skewed traffic")
+    cache.add_argument("--scale", type=int, default=1, help="Replicate the corpus N times")
+    cache.add_argument("--requests", type=int, default=2000)
+    cache.add_argument("--cache-size", type=int, default=1024)
+    cache.add_argument("--repeat", type=int, default=3)
+    cache.set_defaults(func=bench_cache)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Peak memory of whole-file vs streaming ingestion")
+    ingest_parser.add_argument("--scale", type=int, default=50, help="Replicate the corpus N times")
+    ingest_parser.add_argument("--storage", choices=minsearch.STORAGE_MODES, default='columnar')
+    ingest_parser.add_argument("--chunk-size", type=int, default=5000)
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    lexicon = subparsers.add_parser("lexicon", help="Array-backed Lexicon vs a dict vocabulary")
+    lexicon.add_argument("--terms", type=int, default=1_000_000)
+    lexicon.add_argument("--tokens", type=int, default=100_000, help="Tokens looked up per run")
+    lexicon.add_argument("--batch", type=int, default=10, help="Tokens per lookup call, about one query")
+    lexicon.add_argument("--repeat", type=int, default=3)
+    lexicon.set_defaults(func=bench_lexicon)
+
+    fit = subparsers.add_parser("fit", help="Index.fit scaling across worker processes vs serial")
+    fit.add_argument("--scale", type=int, default=100, help="Corpus replication factor")
+    fit.add_argument("--jobs", type=int, nargs="+",
+                     help="n_jobs values, the first is the baseline; defaults to 1, 2, 4, ... up to the CPU count")
+    fit.add_argument("--chunk-size", type=int, default=5000)
+    fit.set_defaults(func=bench_fit)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
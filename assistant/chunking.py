@@ -0,0 +1,110 @@
+import re
+import logging
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+from config import SETTINGS
+
+CHUNK_FIELD = 'response'     # long free-text field split into passages
+PARENT_FIELD = 'id'          # passages keep their document's id, so filters and evaluation see parents
+PASSAGE_FIELDS = ('chunk', 'passage_id')
+
+# Words and single punctuation marks; close to what subword tokenizers count for English prose
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def split_passages(text, max_tokens=SETTINGS.CHUNK_MAX_TOKENS, overlap_tokens=SETTINGS.CHUNK_OVERLAP_TOKENS):
+    """
+    Split ``text`` into windows of at most ``max_tokens`` tokens, consecutive windows sharing
+    ``overlap_tokens`` tokens. Passages are slices of the original text, whitespace included.
+
+    Returns:
+        list of str: One passage per window; ``[text]`` if it fits in one window.
+    """
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    if max_tokens <= 0 or len(spans) <= max_tokens:
+        return [text]
+
+    step = max(max_tokens - overlap_tokens, 1)
+    passages = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + max_tokens]
+        passages.append(text[window[0][0]:window[-1][1]])
+        if start + max_tokens >= len(spans):
+            break
+    return passages
+
+
+def chunk_documents(docs, field=CHUNK_FIELD, max_tokens=SETTINGS.CHUNK_MAX_TOKENS,
+                    overlap_tokens=SETTINGS.CHUNK_OVERLAP_TOKENS):
+    """
+    Yield the passages of each document: a copy of the document with ``field`` replaced by
+    the passage text, its 0-based 'chunk' number and a unique 'passage_id'.
+
+    Documents that fit in one window yield a single passage, so every indexed entry has the
+    same fields whether or not it was split.
+    """
+    n_docs = n_passages = 0
+    for doc in docs:
+        n_docs += 1
+        for chunk, passage in enumerate(split_passages(doc.get(field, ''), max_tokens, overlap_tokens)):
+            n_passages += 1
+            yield {**doc, field: passage, 'chunk': chunk, 'passage_id': f"{doc[PARENT_FIELD]}-{chunk}"}
+    logger.info("Chunked %d documents into %d passages", n_docs, n_passages)
+
+
+def join_passages(first, second, overlap_tokens=SETTINGS.CHUNK_OVERLAP_TOKENS):
+    """
+    Join two consecutive passages of a document, dropping the tokens ``second`` repeats
+    from the end of ``first``.
+
+    The overlap is at most ``overlap_tokens`` tokens; the longest such token run that ends
+    ``first`` and starts ``second`` is cut, and the text after it (whitespace included) is
+    appended, so the result is the original slice of the document.
+    """
+    first_tokens = TOKEN_PATTERN.findall(first)
+    second_spans = [match.span() for match in TOKEN_PATTERN.finditer(second)]
+    second_tokens = [second[start:stop] for start, stop in second_spans]
+    for n in range(min(overlap_tokens, len(first_tokens), len(second_tokens)), 0, -1):
+        if first_tokens[-n:] == second_tokens[:n]:
+            return first + second[second_spans[n - 1][1]:]
+    return first + " " + second
+
+
+def collapse_passages(passages, num_results, field=CHUNK_FIELD, overlap_tokens=SETTINGS.CHUNK_OVERLAP_TOKENS):
+    """
+    Group ranked passages by parent document, keeping the first ``num_results`` parents.
+
+    Each result is the parent's best-ranked passage with ``field`` holding only the
+    parent's matching passages, in document order, so the prompt gets the relevant parts
+    of a long document rather than all of it. Consecutive passages are merged without
+    their shared ``overlap_tokens``; gaps between the others are marked with "...".
+    """
+    groups = {}
+    for passage in passages:
+        parent = passage[PARENT_FIELD]
+        if parent not in groups:
+            if len(groups) == num_results:
+                continue
+            groups[parent] = []
+        groups[parent].append(passage)
+
+    results = []
+    for group in groups.values():
+        doc = {key: value for key, value in group[0].items() if key not in PASSAGE_FIELDS}
+        if len(group) > 1:
+            group = sorted(group, key=lambda p: p['chunk'])
+            text = group[0][field]
+            for previous, passage in zip(group, group[1:]):
+                if passage['chunk'] == previous['chunk'] + 1:
+                    text = join_passages(text, passage[field], overlap_tokens)
+                else:
+                    text += "\n...\n" + passage[field]
+            doc[field] = text
+        results.append(doc)
+    return results
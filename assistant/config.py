@@ -51,6 +51,7 @@ class Settings(BaseModel):
     # General
     DATA_PATH: str = Field(default=os.getenv("DATA_PATH", "../Data/documents-with-ids.json"))
     DATA_URL: str = Field(default="https://huggingface.co/datasets/bitext/Bitext-media-llm-chatbot-training-dataset/resolve/main/bitext-media-llm-chatbot-training-dataset.csv")
+    INDEX_SNAPSHOT_PATH: str = Field(default=os.getenv("INDEX_SNAPSHOT_PATH", "../Data/index-snapshot"))  # "" disables snapshots
 
     RUN_TIMEZONE_CHECK: str = os.getenv("RUN_TIMEZONE_CHECK", "0")
     TZ_INFO: str = Field(default=os.getenv("TZ", "Europe/Istanbul"))
@@ -105,10 +106,56 @@ class Settings(BaseModel):
     SE_SLOWMO_MS: int = int(os.getenv("SE_SLOWMO_MS", 200))
     DEFAULT_MAX_PAGES: int = int(os.getenv("DEFAULT_MAX_PAGES", 1))
 
+    # Retrieval
+    SEARCH_SCORING: str = os.getenv("SEARCH_SCORING", "tfidf")  # tfidf or bm25
+    BM25_K1: float = float(os.getenv("BM25_K1", 1.2))
+    BM25_B: float = float(os.getenv("BM25_B", 0.75))
+    INGEST_CHUNK_SIZE: int = int(os.getenv("INGEST_CHUNK_SIZE", 10000))  # documents vectorized together while streaming
+    INGEST_N_JOBS: int = int(os.getenv("INGEST_N_JOBS", 1))  # processes tokenizing chunks, -1 uses every CPU
+    INDEX_STORAGE: str = os.getenv("INDEX_STORAGE", "dicts")  # dicts or columnar (float32, lazy document views)
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", 1024))  # normalized query -> query vectors, 0 disables
+    RESULT_CACHE_SIZE: int = int(os.getenv("RESULT_CACHE_SIZE", 1024))  # search -> ranked ids, 0 disables
+    SEARCH_CACHE_TTL: float = float(os.getenv("SEARCH_CACHE_TTL", 0))  # seconds, 0 keeps entries until evicted
+    SEARCH_ENGINE: str = os.getenv("SEARCH_ENGINE", "minsearch")  # minsearch, dense or hybrid
+    SEARCH_NUM_RESULTS: int = int(os.getenv("SEARCH_NUM_RESULTS", 5))  # documents put in the prompt context
+    SEARCH_COLLAPSE_FIELD: str = os.getenv("SEARCH_COLLAPSE_FIELD", "")  # e.g. intent: diverse results, "" disables
+    SEARCH_COLLAPSE_SIZE: int = int(os.getenv("SEARCH_COLLAPSE_SIZE", 1))  # passages kept per collapse_field value
+    HYBRID_FUSION: str = os.getenv("HYBRID_FUSION", "rrf")  # rrf or weighted
+    HYBRID_LEXICAL_WEIGHT: float = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 1.0))
+    HYBRID_DENSE_WEIGHT: float = float(os.getenv("HYBRID_DENSE_WEIGHT", 1.0))
+    HYBRID_POOL_SIZE: int = int(os.getenv("HYBRID_POOL_SIZE", 20))  # candidates taken from each retriever
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", 60))
+    EMBEDDER: str = os.getenv("EMBEDDER", "fastembed")  # fastembed (local), openai (provider API) or hashing (tests)
+    DENSE_INDEX_PATH: str = Field(default=os.getenv("DENSE_INDEX_PATH", "../Data/dense-index"))  # "" disables caching embeddings
+
     # Chunking
     CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", 512))
     CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", 64))
 
+    # Near-duplicate collapsing
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", 0))  # Jaccard similarity of responses, e.g. 0.8; 0 disables
+    DEDUP_NUM_PERM: int = int(os.getenv("DEDUP_NUM_PERM", 128))  # MinHash signature length
+    DEDUP_SHINGLE_SIZE: int = int(os.getenv("DEDUP_SHINGLE_SIZE", 3))  # words per shingle
+
+    # Answer evaluation (LLM-as-judge)
+    EVAL_ASYNC: bool = os.getenv("EVAL_ASYNC", "true").lower() == "true"  # judge in background workers, false judges inside the request
+    EVAL_SAMPLE_RATE: float = float(os.getenv("EVAL_SAMPLE_RATE", 1.0))  # fraction of answers judged, the rest are marked SKIPPED
+    EVAL_WORKERS: int = int(os.getenv("EVAL_WORKERS", 2))  # judge threads per app process, 0 leaves the queue to `python judge.py`
+    EVAL_BATCH_SIZE: int = int(os.getenv("EVAL_BATCH_SIZE", 8))  # answers judged per LLM call, 1 judges them one by one
+    EVAL_POLL_INTERVAL: float = float(os.getenv("EVAL_POLL_INTERVAL", 5))  # seconds an idle worker waits before polling the queue
+    EVAL_MAX_BACKOFF: float = float(os.getenv("EVAL_MAX_BACKOFF", 300))  # longest pause of a worker whose evaluations keep failing
+    EVAL_MAX_ATTEMPTS: int = int(os.getenv("EVAL_MAX_ATTEMPTS", 3))  # judge calls per answer before it is marked FAILED
+    EVAL_CLAIM_TIMEOUT: float = float(os.getenv("EVAL_CLAIM_TIMEOUT", 600))  # seconds before answers claimed by a dead worker are queued again
+
+    # Semantic answer cache: paraphrases retrieving the same documents reuse an earlier answer
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", 1024))  # cached answers, 0 disables
+    ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.9))  # cosine similarity of TF-IDF question vectors
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", 3600))  # seconds, 0 keeps answers until evicted
+
+    # Async service (app_async.py)
+    ASYNC_SEARCH_WORKERS: int = int(os.getenv("ASYNC_SEARCH_WORKERS", 2))  # threads running search and the answer cache off the event loop
+    ASYNC_DB_POOL_SIZE: int = int(os.getenv("ASYNC_DB_POOL_SIZE", 10))  # asyncpg connections per process
+
     # Features
     ENABLE_FAISS: bool = os.getenv("ENABLE_FAISS", "false").lower() == "true"
 
@@ -152,3 +199,13 @@ DB_CONFIG = {
     "user": SETTINGS.POSTGRES_USER,
     "password": SETTINGS.POSTGRES_PASSWORD,
 }
+
+# ✅ Field boosts (tuned in notebooks/rag-test.ipynb) and filter of every rag.search request;
+# benchmark.py and the tests score with the same ones
+SEARCH_BOOST = {
+    'intent': 0.022894885883346205,
+    'question': 5.120311766582832,
+    'response': 5.035355456071596,
+    'category': 9.847893877170346,
+}
+SEARCH_FILTER = {'category': 'CONTENT'}
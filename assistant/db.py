@@ -95,9 +95,16 @@ def init_db():
                     eval_prompt_tokens INTEGER NOT NULL,
                     eval_completion_tokens INTEGER NOT NULL,
                     eval_total_tokens INTEGER NOT NULL,
+                    eval_attempts INTEGER NOT NULL DEFAULT 0,
+                    eval_claimed_at TIMESTAMP WITH TIME ZONE,
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
+            # Queue of answers awaiting the background judge
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS conversations_pending_idx
+                ON conversations (timestamp) WHERE relevance IN ('PENDING', 'JUDGING')
+            """)
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS feedback (
                     id SERIAL PRIMARY KEY,
@@ -111,6 +118,26 @@ def init_db():
         conn.close()
 
 
+# Bring the schema of an existing database up to date, keeping its data
+def migrate_db():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                ALTER TABLE conversations
+                ADD COLUMN IF NOT EXISTS eval_attempts INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS eval_claimed_at TIMESTAMP WITH TIME ZONE
+            """)
+            cur.execute("DROP INDEX IF EXISTS conversations_pending_idx")
+            cur.execute("""
+                CREATE INDEX conversations_pending_idx
+                ON conversations (timestamp) WHERE relevance IN ('PENDING', 'JUDGING')
+            """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
 # Save conversation data to the database
 def save_conversation(conversation_id, question, answer_data, timestamp=None):
     if timestamp is None:
@@ -149,6 +176,119 @@ def save_conversation(conversation_id, question, answer_data, timestamp=None):
         conn.close()
 
 
+# Claim conversations awaiting evaluation
+def claim_conversations(limit=1, pending="PENDING", judging="JUDGING", failed="FAILED",
+                        max_attempts=SETTINGS.EVAL_MAX_ATTEMPTS, claim_timeout=SETTINGS.EVAL_CLAIM_TIMEOUT):
+    """
+    Claims up to ``limit`` of the oldest conversations whose relevance is ``pending``.
+
+    The claimed rows are set to ``judging`` with one more attempt counted, and the claim is
+    committed before returning: no transaction or lock is held while the judge runs, and
+    concurrent workers, in this process or others, claim disjoint rows (SKIP LOCKED).
+    Rows left ``judging`` for ``claim_timeout`` seconds by a worker that died are claimed
+    again, or set to ``failed`` once they used up ``max_attempts``.
+
+    Returns:
+        list: Rows holding 'id', 'question', 'response' and 'eval_attempts'.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(
+                """
+                UPDATE conversations
+                SET relevance = %s, relevance_explanation = 'Evaluation abandoned by a worker'
+                WHERE relevance = %s AND eval_attempts >= %s
+                  AND eval_claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """,
+                (failed, judging, max_attempts, claim_timeout),
+            )
+            cur.execute(
+                """
+                UPDATE conversations
+                SET relevance = %s, eval_attempts = eval_attempts + 1,
+                    eval_claimed_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id
+                    FROM conversations
+                    WHERE relevance = %s
+                       OR (relevance = %s AND eval_claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                    ORDER BY timestamp
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, question, response, eval_attempts
+                """,
+                (judging, pending, judging, claim_timeout, limit),
+            )
+            rows = cur.fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+# Hand back conversations the judge failed on
+def release_conversations(conversation_ids, error, pending="PENDING", judging="JUDGING", failed="FAILED",
+                          max_attempts=SETTINGS.EVAL_MAX_ATTEMPTS):
+    """
+    Queues claimed conversations again after a failed judge call, or sets them to ``failed``
+    with ``error`` as explanation once they used up ``max_attempts``.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE conversations
+                SET relevance = CASE WHEN eval_attempts >= %s THEN %s ELSE %s END,
+                    relevance_explanation = CASE WHEN eval_attempts >= %s THEN %s
+                                                 ELSE relevance_explanation END
+                WHERE id = ANY(%s) AND relevance = %s
+                """,
+                (max_attempts, failed, pending, max_attempts, error, list(conversation_ids), judging),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Store the judge's verdict on a claimed conversation
+def save_relevance(cur, conversation_id, relevance, relevance_explanation, token_stats):
+    cur.execute(
+        """
+        UPDATE conversations
+        SET relevance = %s, relevance_explanation = %s,
+            eval_prompt_tokens = %s, eval_completion_tokens = %s, eval_total_tokens = %s
+        WHERE id = %s
+        """,
+        (
+            relevance,
+            relevance_explanation,
+            token_stats["prompt_tokens"],
+            token_stats["completion_tokens"],
+            token_stats["total_tokens"],
+            conversation_id,
+        ),
+    )
+
+
+# Store the judge's verdicts on claimed conversations, in one transaction
+def save_relevances(verdicts):
+    """
+    Args:
+        verdicts (list): (conversation_id, relevance, relevance_explanation, token_stats) tuples.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for verdict in verdicts:
+                save_relevance(cur, *verdict)
+        conn.commit()
+    finally:
+        conn.close()
+
+
 # Save feedback data to the database
 def save_feedback(conversation_id, feedback, timestamp=None):
     if timestamp is None:
@@ -0,0 +1,90 @@
+"""
+Non-blocking counterparts of the db.py writes used by the asyncio service (app_async.py),
+on an asyncpg connection pool shared by all requests of the process.
+"""
+from datetime import datetime
+
+import asyncpg
+
+import logging
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+from config import SETTINGS, DB_CONFIG
+from db import tz
+
+# The pool of this process, created by open_pool
+_pool = None
+
+
+async def open_pool(max_size=SETTINGS.ASYNC_DB_POOL_SIZE):
+    """Creates the connection pool; call once the event loop runs."""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=max_size)
+        logger.info("Opened Postgres pool (max %d connections)", max_size)
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# Save conversation data to the database
+async def save_conversation(conversation_id, question, answer_data, timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now(tz)
+
+    await _pool.execute(
+        """
+        INSERT INTO conversations
+        (id, question, response, model_used, response_time, relevance,
+        relevance_explanation, prompt_tokens, completion_tokens, total_tokens,
+        eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, timestamp)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+        """,
+        conversation_id,
+        question,
+        answer_data["answer"],
+        answer_data["model_used"],
+        answer_data["response_time"],
+        answer_data["relevance"],
+        answer_data["relevance_explanation"],
+        answer_data["prompt_tokens"],
+        answer_data["completion_tokens"],
+        answer_data["total_tokens"],
+        answer_data["eval_prompt_tokens"],
+        answer_data["eval_completion_tokens"],
+        answer_data["eval_total_tokens"],
+        timestamp,
+    )
+
+
+# Save feedback data to the database
+async def save_feedback(conversation_id, feedback, timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now(tz)
+
+    await _pool.execute(
+        """
+        INSERT INTO feedback
+        (conversation_id, feedback, timestamp)
+        VALUES ($1, $2, COALESCE($3, CURRENT_TIMESTAMP))
+        """,
+        conversation_id,
+        feedback,
+        timestamp,
+    )
+
+
+async def ping():
+    """Round trip to Postgres, for the health check."""
+    return await _pool.fetchval("SELECT 1;")
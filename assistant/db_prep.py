@@ -1,3 +1,4 @@
+import argparse
 import logging
 # ---------------- Logging ----------------
 logging.basicConfig(
@@ -10,6 +11,20 @@ import db  # your module with init_db
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Initialize the database schema")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Update the schema of an existing database instead of recreating it")
+    args = parser.parse_args()
+
+    if args.migrate:
+        logger.info("Starting database migration...")
+        try:
+            db.migrate_db()
+            logger.info("Database migrated successfully.")
+        except Exception as e:
+            logger.error("Database migration failed: %s", e)
+        return
+
     logger.info("Starting database initialization...")
     try:
         db.init_db()
@@ -0,0 +1,170 @@
+import re
+import zlib
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+from config import SETTINGS
+
+ALIAS_FIELD = 'aliases'  # ids of the near-duplicates a canonical document stands for
+# Mersenne prime 2^31 - 1: with 32-bit shingle hashes, a * x + b stays within uint64
+PRIME = (1 << 31) - 1
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text, size=SETTINGS.DEDUP_SHINGLE_SIZE):
+    """
+    32-bit hashes of the overlapping ``size``-word shingles of ``text``, lowercased.
+    Texts shorter than ``size`` words give one shingle of all their words, texts without
+    words none.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles: ``num_perm`` universal hash functions
+    ``(a * x + b) mod PRIME``, each keeping its minimum over a text's shingles. The
+    fraction of equal positions of two signatures estimates the Jaccard similarity of
+    the shingle sets.
+    """
+
+    def __init__(self, num_perm=SETTINGS.DEDUP_NUM_PERM, shingle_size=SETTINGS.DEDUP_SHINGLE_SIZE, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        """
+        MinHash signature of ``text`` as a uint32 array of length ``num_perm``, or None
+        for a text without words, which is similar to nothing.
+        """
+        hashes = shingles(text, self.shingle_size)
+        if not len(hashes):
+            return None
+        # shingles x permutations, reduced over the shingles
+        return ((np.outer(hashes, self._a) + self._b) % PRIME).min(axis=0).astype(np.uint32)
+
+
+def lsh_params(threshold, num_perm):
+    """
+    Bands and rows per band (``bands * rows <= num_perm``) whose banding S-curve
+    ``1 - (1 - s^rows)^bands`` rises at ``(1 / bands)^(1 / rows)``, closest to ``threshold``.
+    """
+    candidates = [(bands, num_perm // bands) for bands in range(1, num_perm + 1)]
+    return min(candidates, key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold))
+
+
+class MinHashLSH:
+    """
+    Locality-sensitive hashing of MinHash signatures: each signature is cut into bands
+    and every band is a bucket key, so documents whose signatures agree on a whole band
+    become candidates. Pairs above the Jaccard threshold share a band with high
+    probability, dissimilar pairs rarely do.
+    """
+
+    def __init__(self, threshold, num_perm=SETTINGS.DEDUP_NUM_PERM):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._buckets = defaultdict(list)
+        self._signatures = {}
+
+    def _band_keys(self, signature, group):
+        for band in range(self.bands):
+            yield group, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def insert(self, key, signature, group=None):
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature, group):
+            self._buckets[band_key].append(key)
+
+    def query(self, signature, group=None):
+        """
+        The most similar inserted key in ``group`` whose estimated Jaccard similarity is
+        at least ``threshold``, or None.
+        """
+        candidates = {key for band_key in self._band_keys(signature, group) for key in self._buckets.get(band_key, ())}
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = np.mean(self._signatures[key] == signature)
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+
+def find_near_duplicates(docs, threshold=0.8, text_fields=('response',), group_field='intent',
+                         id_field='id', num_perm=SETTINGS.DEDUP_NUM_PERM, shingle_size=SETTINGS.DEDUP_SHINGLE_SIZE):
+    """
+    Groups near-duplicate documents in one pass over ``docs``.
+
+    The first document of each group is its canonical document; a later document becomes
+    an alias of the most similar canonical one whose estimated Jaccard similarity of
+    ``text_fields`` word shingles reaches ``threshold``. Documents without words in
+    ``text_fields`` are never near-duplicates. Only canonical signatures are kept, so
+    memory grows with the deduplicated corpus.
+
+    Args:
+        docs (iterable of dict): Documents, e.g. streamed from disk.
+        threshold (float): Minimum Jaccard similarity of near-duplicates, in (0, 1].
+        text_fields (tuple): Fields compared.
+        group_field (str): Only documents with equal values of this field are compared
+                           (e.g. the same intent); None compares all documents.
+        id_field (str): Field identifying a document.
+        num_perm (int): MinHash signature length; longer is more accurate and slower.
+        shingle_size (int): Words per shingle.
+
+    Returns:
+        dict: Canonical document id -> list of the ids of its near-duplicates.
+    """
+    hasher = MinHasher(num_perm, shingle_size)
+    lsh = MinHashLSH(threshold, num_perm)
+    aliases = defaultdict(list)
+    n_docs = 0
+    for doc in docs:
+        n_docs += 1
+        signature = hasher.signature(" ".join(doc.get(field, '') for field in text_fields))
+        if signature is None:
+            continue
+        group = doc.get(group_field) if group_field else None
+        canonical = lsh.query(signature, group)
+        if canonical is None:
+            lsh.insert(doc[id_field], signature, group)
+        else:
+            aliases[canonical].append(doc[id_field])
+
+    n_aliases = sum(len(ids) for ids in aliases.values())
+    logger.info(
+        "Near-duplicates (Jaccard >= %.2f, %d bands x %d rows): %d -> %d documents, %d collapsed (%.1f%% smaller)",
+        threshold, lsh.bands, lsh.rows, n_docs, n_docs - n_aliases, n_aliases, 100 * n_aliases / max(n_docs, 1),
+    )
+    return dict(aliases)
+
+
+def collapse_duplicates(docs, aliases, id_field='id'):
+    """
+    Yield the canonical documents of ``docs``, dropping their near-duplicates.
+
+    Every canonical document gets an ``ALIAS_FIELD`` list with the ids it stands for
+    (empty if none), so the id of a dropped document can be mapped to the document that
+    replaced it. The dropped ids are not indexed: a filter on ``id_field`` only matches
+    canonical ids.
+    """
+    dropped = {alias for ids in aliases.values() for alias in ids}
+    for doc in docs:
+        if doc[id_field] in dropped:
+            continue
+        yield {**doc, ALIAS_FIELD: aliases.get(doc[id_field], [])}
@@ -0,0 +1,337 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import minsearch
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# On-disk format written by DenseIndex.save; bump the version on layout changes
+SNAPSHOT_FORMAT = "dense-index"
+SNAPSHOT_VERSION = 1
+
+
+# ---------------- Embedders ----------------
+class HashingEmbedder:
+    """
+    Deterministic local embedder: signed feature hashing of word uni/bigrams, L2-normalized.
+
+    Needs no model download or network and gives the same vectors in every process,
+    which makes it the embedder for tests and offline experiments.
+    """
+
+    def __init__(self, dim=384):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        self._vectorizer = HashingVectorizer(n_features=dim, ngram_range=(1, 2), alternate_sign=True, norm='l2')
+
+    def embed_documents(self, texts):
+        return self._vectorizer.transform(texts).toarray().astype(np.float32)
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+class FastEmbedEmbedder:
+    """Local ONNX embedding model via fastembed; downloads the model on first use."""
+
+    def __init__(self, model_name, batch_size=256):
+        from fastembed import TextEmbedding
+
+        self.name = model_name
+        self.batch_size = batch_size
+        self._model = TextEmbedding(model_name=model_name)
+
+    def embed_documents(self, texts):
+        return np.vstack(list(self._model.passage_embed(texts, batch_size=self.batch_size))).astype(np.float32)
+
+    def embed_queries(self, texts):
+        return np.vstack(list(self._model.query_embed(texts, batch_size=self.batch_size))).astype(np.float32)
+
+
+class OpenAIEmbedder:
+    """Embeddings endpoint of an OpenAI-compatible provider (OpenAI, Ollama, HF router)."""
+
+    def __init__(self, client, model_name, batch_size=256):
+        self.name = model_name
+        self.batch_size = batch_size
+        self._client = client
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self._client.embeddings.create(model=self.name, input=texts[start:start + self.batch_size])
+            vectors.extend(item.embedding for item in response.data)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+def get_embedder(name, model_name=None, client=None):
+    """
+    Creates an embedder by name.
+
+    Args:
+        name (str): 'hashing', 'fastembed' or 'openai'.
+        model_name (str): Model for 'fastembed' and 'openai'.
+        client (openai.OpenAI): Client for 'openai'.
+    """
+    if name == 'hashing':
+        return HashingEmbedder()
+    if name == 'fastembed':
+        return FastEmbedEmbedder(model_name)
+    if name == 'openai':
+        return OpenAIEmbedder(client, model_name)
+    raise ValueError(f"Unknown embedder {name!r}, expected 'hashing', 'fastembed' or 'openai'")
+
+
+# ---------------- Dense index ----------------
+class DenseIndex:
+    """
+    Exact inner-product vector search over document embeddings, with the same
+    filter_dict / output_ids semantics as ``minsearch.Index``.
+
+    Embeddings are L2-normalized and stored as one contiguous float32 matrix, so inner
+    product equals cosine similarity and a batch of queries is scored with one matrix
+    product. With ``use_faiss=True`` an exact FAISS ``IndexFlatIP`` serves the searches.
+
+    Attributes:
+        embedder: Object with ``embed_documents(texts)`` and ``embed_queries(texts)``.
+        text_fields (list): Fields concatenated into the text that is embedded.
+        keyword_fields (list): Fields available to ``filter_dict``.
+        embeddings (np.ndarray): n_docs x dim float32 matrix.
+        keyword_index (dict): Per keyword field, a dict mapping each value to the sorted row ids holding it.
+        docs (list): List of documents indexed.
+    """
+
+    def __init__(self, embedder, text_fields, keyword_fields, use_faiss=False):
+        self.embedder = embedder
+        self.text_fields = text_fields
+        self.keyword_fields = keyword_fields
+        self.use_faiss = use_faiss
+        self.embeddings = None
+        self.keyword_index = {}
+        self.docs = []
+        self._faiss_index = None
+        self._filter_cache = OrderedDict()
+        self._collapse_codes = {}
+
+    def _texts(self, docs):
+        return [" ".join(doc.get(field, '') for field in self.text_fields).strip() for doc in docs]
+
+    def fit(self, docs, embeddings=None):
+        """
+        Embeds and indexes the documents.
+
+        Args:
+            docs (list of dict): Documents to index.
+            embeddings (np.ndarray): Optional precomputed document embeddings.
+        """
+        self.docs = list(docs)
+        if embeddings is None and self.docs:
+            embeddings = self.embedder.embed_documents(self._texts(self.docs))
+        elif embeddings is not None:
+            embeddings = np.array(embeddings, dtype=np.float32)
+        if embeddings is not None:
+            _normalize_rows(embeddings)
+        self._set_embeddings(embeddings)
+        return self
+
+    def _set_embeddings(self, embeddings):
+        """Installs L2-normalized embeddings and rebuilds the derived structures."""
+        self._filter_cache.clear()
+        self._collapse_codes = {}
+        self._faiss_index = None
+        self.embeddings = embeddings
+        self.keyword_index = minsearch.build_keyword_index(pd.DataFrame({
+            field: [doc.get(field, '') for doc in self.docs] for field in self.keyword_fields
+        }))
+        if embeddings is None:
+            return
+
+        if self.use_faiss:
+            try:
+                import faiss
+            except ImportError:
+                logger.warning("ENABLE_FAISS is set but faiss is not installed, using NumPy search")
+                return
+            self._faiss_index = faiss.IndexFlatIP(embeddings.shape[1])
+            self._faiss_index.add(embeddings)
+
+    def search(self, query, filter_dict=None, boost_dict=None, num_results=10, output_ids=False, output_scores=False,
+               collapse_field=None, collapse_size=1):
+        """
+        Searches the index with the given query and filters.
+
+        Args:
+            query (str): The search query string.
+            filter_dict (dict): Keyword filters, as in ``minsearch.Index.search``.
+            boost_dict (dict): Accepted for interface parity with ``minsearch.Index``; unused.
+            num_results (int): The number of top results to return. Defaults to 10.
+            output_ids (bool): If True, adds an '_id' field to each document containing its index.
+            output_scores (bool): If True, adds a '_score' field with the cosine similarity.
+            collapse_field (str): Field whose values group the results, as in ``minsearch.Index.search``.
+            collapse_size (int): Documents kept per group. Defaults to 1.
+
+        Returns:
+            list of dict: Documents ranked by cosine similarity.
+        """
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_ids, output_scores,
+                                 collapse_field=collapse_field, collapse_size=collapse_size)[0]
+
+    def search_batch(self, queries, filter_dict=None, boost_dict=None, num_results=10, output_ids=False,
+                     output_scores=False, batch_size=256, collapse_field=None, collapse_size=1):
+        """Searches the index with several queries at once; returns one ranked list per query."""
+        queries = list(queries)
+        if not self.docs or not queries:
+            return [[] for _ in queries]
+
+        candidates = minsearch.resolve_filter(self.keyword_index, len(self.docs), filter_dict or {})
+        if candidates is not None and len(candidates) == 0:
+            return [[] for _ in queries]
+
+        results = []
+        for start in range(0, len(queries), batch_size):
+            query_vecs = self.embedder.embed_queries(queries[start:start + batch_size])
+            query_vecs = _normalize_rows(np.array(query_vecs, dtype=np.float32))
+
+            if collapse_field:
+                # FAISS cannot group hits, so collapsed searches score the embeddings directly
+                top = self._numpy_search(query_vecs, filter_dict, candidates, num_results, collapse_field, collapse_size)
+            elif self._faiss_index is not None:
+                top = self._faiss_search(query_vecs, candidates, num_results)
+            else:
+                top = self._numpy_search(query_vecs, filter_dict, candidates, num_results)
+            results.extend(
+                minsearch.format_results(self.docs, indices, output_ids, scores if output_scores else None)
+                for indices, scores in top
+            )
+        return results
+
+    def _numpy_search(self, query_vecs, filter_dict, candidates, num_results, collapse_field=None, collapse_size=1):
+        if candidates is None:
+            matrix = self.embeddings
+        else:
+            matrix = self._candidate_matrix(filter_dict, candidates)
+        groups = None
+        if collapse_field:
+            groups = self._group_codes(collapse_field)
+            groups = groups if candidates is None else groups[candidates]
+        scores = query_vecs @ matrix.T
+        top = []
+        for row in scores:
+            if groups is None:
+                columns = minsearch.top_k(row, num_results)
+            else:
+                columns = minsearch.top_k_collapsed(row, groups, num_results, collapse_size)
+            top.append((columns if candidates is None else candidates[columns], row[columns]))
+        return top
+
+    def _group_codes(self, field):
+        """Integer group of every row by its ``field`` value, as in ``minsearch.Index``."""
+        if field not in self._collapse_codes:
+            values = pd.Series([doc.get(field) for doc in self.docs], dtype=object)
+            self._collapse_codes[field] = pd.factorize(values, use_na_sentinel=False)[0]
+        return self._collapse_codes[field]
+
+    def _candidate_matrix(self, filter_dict, candidates):
+        """Embedding rows of the candidates, cached per distinct filter."""
+        key = minsearch._filter_key(filter_dict)
+        if key not in self._filter_cache:
+            self._filter_cache[key] = self.embeddings[candidates]
+            if len(self._filter_cache) > minsearch.FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+        self._filter_cache.move_to_end(key)
+        return self._filter_cache[key]
+
+    def _faiss_search(self, query_vecs, candidates, num_results):
+        import faiss
+
+        params = None
+        if candidates is not None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(candidates.astype(np.int64)))
+        scores, indices = self._faiss_index.search(query_vecs, num_results, params=params)
+        # Same contract as minsearch.top_k: positive scores only, -1 pads missing hits
+        top = []
+        for row_scores, row_ids in zip(scores, indices):
+            keep = (row_ids >= 0) & (row_scores > 0)
+            top.append((row_ids[keep], row_scores[keep]))
+        return top
+
+    def save(self, path, metadata=None):
+        """
+        Writes the embeddings (``embeddings.npy``), documents and a manifest to ``path``.
+        Keyword posting lists are rebuilt from the documents on load.
+        """
+        if self.embeddings is None:
+            raise ValueError("Cannot save an index that has not been fitted")
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+        try:
+            np.save(os.path.join(tmp_path, 'embeddings.npy'), self.embeddings, allow_pickle=False)
+            with open(os.path.join(tmp_path, 'docs.json'), 'wt', encoding='utf-8') as f_out:
+                json.dump(self.docs, f_out, ensure_ascii=False)
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'version': SNAPSHOT_VERSION,
+                'embedder': self.embedder.name,
+                'text_fields': self.text_fields,
+                'keyword_fields': self.keyword_fields,
+                'metadata': metadata or {},
+            }
+            with open(os.path.join(tmp_path, 'manifest.json'), 'wt', encoding='utf-8') as f_out:
+                json.dump(manifest, f_out, ensure_ascii=False, indent=2)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def read_manifest(path):
+        """Reads and validates the manifest of a snapshot written by ``save``."""
+        with open(os.path.join(path, 'manifest.json'), 'rt', encoding='utf-8') as f_in:
+            manifest = json.load(f_in)
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported dense index snapshot at {path}")
+        return manifest
+
+    @classmethod
+    def load(cls, path, embedder, use_faiss=False, mmap=True):
+        """Loads an index written by ``save``; ``embedder`` must be the one that built it."""
+        manifest = cls.read_manifest(path)
+        if manifest['embedder'] != embedder.name:
+            raise ValueError(f"Snapshot at {path} was built with {manifest['embedder']}, not {embedder.name}")
+
+        index = cls(embedder, manifest['text_fields'], manifest['keyword_fields'], use_faiss=use_faiss)
+        with open(os.path.join(path, 'docs.json'), 'rt', encoding='utf-8') as f_in:
+            index.docs = json.load(f_in)
+        # Saved embeddings are already normalized
+        index._set_embeddings(np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r' if mmap else None))
+        return index
+
+
+def _normalize_rows(matrix):
+    """L2-normalizes the rows of a float32 matrix in place; all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
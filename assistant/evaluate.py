@@ -0,0 +1,180 @@
+"""
+Offline retrieval evaluation against the ground-truth questions.
+
+python evaluate.py                          # hit rate / MRR of rag.search_batch
+python evaluate.py --num-results 10
+python evaluate.py --tune-hybrid --num-results 3   # grid-search the hybrid fusion weights
+python evaluate.py --judge ../Data/rag-eval-gpt-oss-120b.csv --output judged.csv   # LLM-as-judge relevance
+"""
+import argparse
+import logging
+from time import time
+
+import pandas as pd
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+import rag
+import hybrid
+import ingest
+import chunking
+import dedup
+from config import SETTINGS
+
+GROUND_TRUTH_PATH = "../Data/ground-truth-data.csv"
+
+# Dense weights tried by --tune-hybrid, relative to a lexical weight of 1
+DENSE_WEIGHT_GRID = [0.0, 0.25, 0.5, 1.0, 2.0, 4.0]
+
+
+def load_ground_truth(file_path=GROUND_TRUTH_PATH):
+    """Load the ground-truth questions as a list of {'question', 'category', 'id'} records."""
+    return pd.read_csv(file_path).to_dict(orient='records')
+
+
+# Compute Hit Rate: % of queries for which the correct document was retrieved
+def hit_rate(relevance_total):
+    cnt = 0
+    for line in relevance_total:
+        if True in line:  # If any retrieved doc matches the correct ID
+            cnt = cnt + 1
+    return cnt / len(relevance_total)
+
+
+# Compute Mean Reciprocal Rank (MRR)
+def mrr(relevance_total):
+    total_score = 0.0
+    for line in relevance_total:
+        for rank in range(len(line)):
+            if line[rank] == True:  # True means relevant doc found at this rank
+                total_score = total_score + 1 / (rank + 1)
+    return total_score / len(relevance_total)
+
+
+def evaluate(ground_truth, search_batch_function):
+    """Score every ground-truth question with one batched search call."""
+    results = search_batch_function([q['question'] for q in ground_truth])
+
+    relevance_total = []
+    for q, docs in zip(ground_truth, results):
+        # A near-duplicate collapsed at ingest is found through its canonical document
+        relevance_total.append([d['id'] == q['id'] or q['id'] in d.get(dedup.ALIAS_FIELD, ()) for d in docs])
+
+    return {
+        'hit_rate': hit_rate(relevance_total),
+        'mrr': mrr(relevance_total),
+    }
+
+
+def tune_hybrid(ground_truth, num_results, pool_size=SETTINGS.HYBRID_POOL_SIZE, rrf_k=SETTINGS.HYBRID_RRF_K):
+    """
+    Grid-search the fusion method and dense weight of the hybrid retriever.
+
+    Both retrievers run once over all questions; every grid point only re-fuses the cached pools.
+
+    Returns:
+        list of dict: One row per (method, dense weight) with its metrics, best first.
+    """
+    dense_index = rag.dense_index or ingest.load_dense_index()
+    retriever = hybrid.HybridRetriever(
+        {'lexical': rag.index, 'dense': dense_index}, pool_size=pool_size, id_field='passage_id'
+    )
+    pools = retriever.candidate_pools(
+        [q['question'] for q in ground_truth], filter_dict=rag.SEARCH_FILTER, boost_dict=rag.SEARCH_BOOST
+    )
+
+    rows = []
+    for method in hybrid.FUSION_METHODS:
+        for dense_weight in DENSE_WEIGHT_GRID:
+            def search_batch_function(queries):
+                return [
+                    chunking.collapse_passages(
+                        hybrid.fuse(
+                            {name: pool[i] for name, pool in pools.items()},
+                            weights={'lexical': 1.0, 'dense': dense_weight},
+                            method=method,
+                            rrf_k=rrf_k,
+                            num_results=num_results * rag.PASSAGES_PER_RESULT,
+                            id_field='passage_id',
+                        ),
+                        num_results,
+                    )
+                    for i in range(len(queries))
+                ]
+            rows.append({'method': method, 'dense_weight': dense_weight,
+                         **evaluate(ground_truth, search_batch_function)})
+    return sorted(rows, key=lambda row: (row['hit_rate'], row['mrr']), reverse=True)
+
+
+def judge_answers(records, batch_size=SETTINGS.EVAL_BATCH_SIZE):
+    """
+    LLM-as-judge relevance of generated answers, ``batch_size`` answers per judge call.
+
+    Args:
+        records (list of dict): Rows with 'question' and 'answer'.
+        batch_size (int): Answers per call; 1 judges them one by one.
+
+    Returns:
+        list of dict: The records with 'relevance', 'explanation' and the eval_* token counts.
+    """
+    rows = []
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        verdicts = rag.evaluate_relevance_batch([(r['question'], r['answer']) for r in batch])
+        for record, (relevance, token_stats) in zip(batch, verdicts):
+            rows.append({
+                **record,
+                'relevance': relevance.get("Relevance", "UNKNOWN"),
+                'explanation': relevance.get("Explanation", "Failed to parse evaluation"),
+                **{f'eval_{key}': value for key, value in token_stats.items()},
+            })
+        logger.info("Judged %d/%d answers", len(rows), len(records))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval on the ground-truth data")
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--num-results", type=int, default=SETTINGS.SEARCH_NUM_RESULTS)
+    parser.add_argument("--tune-hybrid", action="store_true",
+                        help="Grid-search HYBRID_FUSION and HYBRID_DENSE_WEIGHT instead of evaluating rag.search")
+    parser.add_argument("--judge", metavar="CSV",
+                        help="Judge the relevance of the 'answer' column of a CSV with 'question' and 'answer'")
+    parser.add_argument("--batch-size", type=int, default=SETTINGS.EVAL_BATCH_SIZE, help="Answers per judge call")
+    parser.add_argument("--output", help="CSV written with the --judge verdicts")
+    args = parser.parse_args()
+
+    if args.judge:
+        records = pd.read_csv(args.judge)[['question', 'answer']].to_dict(orient='records')
+        t0 = time()
+        judged = pd.DataFrame(judge_answers(records, args.batch_size))
+        logger.info("Judged %d answers in %.2fs", len(judged), time() - t0)
+        print(judged['relevance'].value_counts().to_string())
+        print(judged[['eval_prompt_tokens', 'eval_completion_tokens', 'eval_total_tokens']].sum().to_string())
+        if args.output:
+            judged.to_csv(args.output, index=False)
+        return
+
+    ground_truth = load_ground_truth(args.ground_truth)
+    logger.info("Loaded %d ground-truth questions", len(ground_truth))
+
+    if args.tune_hybrid:
+        rows = tune_hybrid(ground_truth, args.num_results)
+        print(pd.DataFrame(rows).to_string(index=False))
+        best = rows[0]
+        print(f"HYBRID_FUSION={best['method']} HYBRID_LEXICAL_WEIGHT=1.0 HYBRID_DENSE_WEIGHT={best['dense_weight']}")
+        return
+
+    t0 = time()
+    metrics = evaluate(ground_truth, lambda queries: rag.search_batch(queries, num_results=args.num_results))
+    logger.info("Evaluated in %.2fs", time() - t0)
+    print(metrics)
+
+
+if __name__ == "__main__":
+    main()
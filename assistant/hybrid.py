@@ -0,0 +1,172 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import minsearch
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ('rrf', 'weighted')
+# Rank offset of reciprocal-rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+POOL_SIZE = 20
+
+
+class HybridRetriever:
+    """
+    Runs several retrievers (e.g. ``minsearch.Index`` and ``dense.DenseIndex``) concurrently
+    and fuses their ranked candidate pools into one list.
+
+    Every retriever returns only its top ``pool_size`` documents; pools are merged on
+    ``id_field`` with either reciprocal-rank fusion or a weighted blend of min-max
+    normalized scores.
+
+    Attributes:
+        retrievers (dict): Name -> object with the ``search_batch`` interface of ``minsearch.Index``.
+        weights (dict): Name -> fusion weight; retrievers without a weight get 1.
+        method (str): 'rrf' or 'weighted'.
+        rrf_k (int): Rank offset for 'rrf'.
+        pool_size (int): Candidates requested from each retriever.
+        id_field (str): Document field identifying the same document across retrievers.
+    """
+
+    def __init__(self, retrievers, weights=None, method='rrf', rrf_k=RRF_K, pool_size=POOL_SIZE, id_field='id'):
+        if method not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method {method!r}, expected one of {FUSION_METHODS}")
+        self.retrievers = retrievers
+        self.weights = weights or {}
+        self.method = method
+        self.rrf_k = rrf_k
+        self.pool_size = pool_size
+        self.id_field = id_field
+        # Lexical search on short queries is mostly Python work under the GIL; the threads overlap it
+        # with the dense query embedding, whose ONNX inference or provider API call releases the GIL
+        self._executor = ThreadPoolExecutor(max_workers=len(retrievers), thread_name_prefix='retriever')
+
+    def search(self, query, filter_dict=None, boost_dict=None, num_results=10, output_ids=False, output_scores=False,
+               collapse_field=None, collapse_size=1):
+        """
+        Searches every retriever and returns the fused ranking.
+
+        Args:
+            query (str): The search query string.
+            filter_dict (dict): Keyword filters, passed to every retriever.
+            boost_dict (dict): Field boosts, passed to every retriever.
+            num_results (int): The number of fused results to return. Defaults to 10.
+            output_ids (bool): If True, keeps the '_id' field of the first retriever that returned the document.
+            output_scores (bool): If True, adds the fused score as '_score'.
+            collapse_field (str): Field whose values group the results, as in ``minsearch.Index.search``;
+                                  every pool is collapsed, then the fused ranking.
+            collapse_size (int): Documents kept per group. Defaults to 1.
+
+        Returns:
+            list of dict: Documents ranked by fused score.
+        """
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_ids, output_scores,
+                                 collapse_field, collapse_size)[0]
+
+    def search_batch(self, queries, filter_dict=None, boost_dict=None, num_results=10, output_ids=False,
+                     output_scores=False, collapse_field=None, collapse_size=1):
+        """Searches several queries at once; returns one fused ranking per query."""
+        queries = list(queries)
+        pools = self.candidate_pools(queries, filter_dict, boost_dict, collapse_field, collapse_size)
+        return [
+            fuse(
+                {name: pool[i] for name, pool in pools.items()},
+                weights=self.weights,
+                method=self.method,
+                rrf_k=self.rrf_k,
+                num_results=num_results,
+                id_field=self.id_field,
+                output_ids=output_ids,
+                output_scores=output_scores,
+                collapse_field=collapse_field,
+                collapse_size=collapse_size,
+            )
+            for i in range(len(queries))
+        ]
+
+    def candidate_pools(self, queries, filter_dict=None, boost_dict=None, collapse_field=None, collapse_size=1):
+        """
+        Runs all retrievers concurrently.
+
+        Returns:
+            dict: Retriever name -> one scored candidate list per query.
+        """
+        futures = {
+            name: self._executor.submit(
+                retriever.search_batch,
+                queries,
+                filter_dict=filter_dict,
+                boost_dict=boost_dict,
+                num_results=self.pool_size,
+                output_ids=True,
+                output_scores=True,
+                collapse_field=collapse_field,
+                collapse_size=collapse_size,
+            )
+            for name, retriever in self.retrievers.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def fuse(pools, weights=None, method='rrf', rrf_k=RRF_K, num_results=10, id_field='id', output_ids=False,
+         output_scores=False, collapse_field=None, collapse_size=1):
+    """
+    Fuses the ranked candidate lists of several retrievers for one query.
+
+    Args:
+        pools (dict): Retriever name -> ranked documents carrying '_id' and '_score'.
+        weights (dict): Retriever name -> weight; missing names get 1.
+        method (str): 'rrf' sums ``weight / (rrf_k + rank)``; 'weighted' sums ``weight * score``
+                      with each pool's scores min-max normalized to [0, 1].
+        rrf_k (int): Rank offset for 'rrf'.
+        num_results (int): The number of fused results to return.
+        id_field (str): Document field used to match documents across pools.
+        output_ids (bool): Keep the '_id' field on the results.
+        output_scores (bool): Set '_score' to the fused score.
+        collapse_field (str): Keep only the best ``collapse_size`` fused documents per value of this field.
+        collapse_size (int): Documents kept per ``collapse_field`` value.
+
+    Returns:
+        list of dict: Fused ranking, ties broken by first appearance.
+    """
+    weights = weights or {}
+    fused = {}
+    docs = {}
+    for name, results in pools.items():
+        weight = weights.get(name, 1.0)
+        if not results or weight == 0:
+            continue
+        if method == 'rrf':
+            contributions = [weight / (rrf_k + rank) for rank in range(1, len(results) + 1)]
+        else:
+            scores = [doc['_score'] for doc in results]
+            low, high = min(scores), max(scores)
+            span = high - low
+            contributions = [weight * ((score - low) / span if span > 0 else 1.0) for score in scores]
+        for doc, contribution in zip(results, contributions):
+            key = doc[id_field]
+            fused[key] = fused.get(key, 0.0) + contribution
+            docs.setdefault(key, doc)
+
+    # sorted() is stable, so equal scores keep the order documents were first seen in
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    if collapse_field:
+        ranked = minsearch.collapse_results(ranked, collapse_field, collapse_size, key=docs.get)
+    ranked = ranked[:num_results]
+    results = []
+    for key in ranked:
+        doc = dict(docs[key])
+        if output_scores:
+            doc['_score'] = fused[key]
+        else:
+            doc.pop('_score', None)
+        if not output_ids:
+            doc.pop('_id', None)
+        results.append(doc)
+    return results
@@ -1,5 +1,7 @@
 import os
+import re
 import json
+import hashlib
 
 import logging
 # ---------------- Logging ----------------
@@ -12,6 +14,9 @@ logger = logging.getLogger(__name__)
 
 import pandas as pd
 import minsearch  # your module with Index
+import dense
+import chunking
+import dedup
 
 from config import SETTINGS
 
@@ -22,8 +27,97 @@ if not os.path.exists(SETTINGS.DATA_PATH):
 logger.info("Data file size: %d bytes", os.path.getsize(SETTINGS.DATA_PATH))
 
 
-def load_index(data_path=SETTINGS.DATA_PATH):
-    """Load documents from JSON and create a MinSearch index."""
+TEXT_FIELDS = ['intent', 'question', 'response']  # full-text searchable fields
+KEYWORD_FIELDS = ['id', 'category']                # exact match fields
+BM25_PARAMS = {'k1': SETTINGS.BM25_K1, 'b': SETTINGS.BM25_B}
+CACHE_PARAMS = {
+    'query_cache_size': SETTINGS.QUERY_CACHE_SIZE,
+    'result_cache_size': SETTINGS.RESULT_CACHE_SIZE,
+    'cache_ttl': SETTINGS.SEARCH_CACHE_TTL or None,
+}
+DENSE_TEXT_FIELDS = ['question', 'response']      # concatenated into the embedded text
+# Passages are what gets indexed; snapshots built with other chunk settings are stale
+CHUNKING = {
+    'field': chunking.CHUNK_FIELD,
+    'max_tokens': SETTINGS.CHUNK_MAX_TOKENS,
+    'overlap_tokens': SETTINGS.CHUNK_OVERLAP_TOKENS,
+}
+# Near-duplicate responses of one intent are indexed once; threshold 0 indexes every document
+DEDUP = {
+    'threshold': SETTINGS.DEDUP_THRESHOLD,
+    'text_fields': ['response'],
+    'group_field': 'intent',
+    'num_perm': SETTINGS.DEDUP_NUM_PERM,
+    'shingle_size': SETTINGS.DEDUP_SHINGLE_SIZE,
+}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f_in:
+        for chunk in iter(lambda: f_in.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Whitespace and array separators between streamed JSON values
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_documents(data_path=SETTINGS.DATA_PATH, buffer_size=1 << 20):
+    """
+    Yield documents one at a time from a JSON array or an NDJSON file.
+
+    The file is read in ``buffer_size`` blocks and decoded value by value, so memory stays
+    bounded by the largest document rather than the file size.
+    """
+    decoder = json.JSONDecoder()
+    with open(data_path, 'rt', encoding='utf-8') as f_in:
+        buffer = f_in.read(buffer_size)
+        pos = _SEPARATORS.match(buffer).end()
+        # Leading whitespace may fill whole blocks before the '[' of an array
+        while pos == len(buffer):
+            chunk = f_in.read(buffer_size)
+            if not chunk:
+                break
+            buffer = chunk
+            pos = _SEPARATORS.match(buffer).end()
+        in_array = buffer[pos:pos + 1] == '['
+        if in_array:
+            pos += 1
+
+        count = 0
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                chunk = f_in.read(buffer_size)
+                if not chunk:
+                    break
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if in_array and buffer[pos] == ']':
+                break
+            try:
+                doc, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The value may continue past the buffer
+                chunk = f_in.read(buffer_size)
+                if not chunk:
+                    logger.error("Failed to decode JSON in %s after %d documents", data_path, count)
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield doc
+            count += 1
+            pos = end
+            if pos > buffer_size:
+                buffer, pos = buffer[pos:], 0
+    logger.info("Streamed %d documents", count)
+
+
+def read_documents(data_path=SETTINGS.DATA_PATH):
+    """Load the document list from JSON."""
     try:
         with open(data_path, 'rt', encoding='utf-8') as f_in:
             documents = json.load(f_in)
@@ -34,24 +128,153 @@ def load_index(data_path=SETTINGS.DATA_PATH):
     except Exception as e:
         logger.error("Error reading data file: %s", e)
         raise
+    return documents
+
+
+def canonical_documents(data_path=SETTINGS.DATA_PATH):
+    """
+    Stream the documents of ``data_path`` without their near-duplicates (see ``dedup``).
+
+    The file is streamed twice: once to group near-duplicates, once to yield the canonical
+    documents, each listing the ids it stands for in its 'aliases' field.
+    """
+    if not DEDUP['threshold']:
+        return iter_documents(data_path)
+    aliases = dedup.find_near_duplicates(iter_documents(data_path), **DEDUP)
+    return dedup.collapse_duplicates(iter_documents(data_path), aliases)
+
+
+def chunk_documents(documents):
+    """Split documents into the passages that get indexed (see ``chunking.chunk_documents``)."""
+    return chunking.chunk_documents(
+        documents, field=CHUNKING['field'], max_tokens=CHUNKING['max_tokens'], overlap_tokens=CHUNKING['overlap_tokens']
+    )
+
+
+def load_snapshot(snapshot_path, content_hash):
+    """Return the snapshot index if it was built from the same data and fields, else None."""
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return None
+    try:
+        manifest = minsearch.Index.read_manifest(snapshot_path)
+        if (manifest['metadata'].get('content_hash') != content_hash
+                or manifest['metadata'].get('chunking') != CHUNKING
+                or manifest['metadata'].get('dedup') != DEDUP
+                or manifest['text_fields'] != TEXT_FIELDS
+                or manifest['keyword_fields'] != KEYWORD_FIELDS
+                or manifest['scoring'] != SETTINGS.SEARCH_SCORING
+                or manifest.get('storage', 'dicts') != SETTINGS.INDEX_STORAGE
+                or (SETTINGS.SEARCH_SCORING == 'bm25'
+                    and any(params != BM25_PARAMS for params in manifest['bm25_params'].values()))):
+            logger.info("Index snapshot at %s is stale, rebuilding", snapshot_path)
+            return None
+        return minsearch.Index.load(snapshot_path, mmap=True)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Ignoring unreadable index snapshot at %s: %s", snapshot_path, e)
+        return None
+
+
+def load_index(data_path=SETTINGS.DATA_PATH, snapshot_path=SETTINGS.INDEX_SNAPSHOT_PATH):
+    """
+    Load documents from JSON and create a MinSearch index.
+
+    If ``snapshot_path`` holds a snapshot whose content hash matches ``data_path``, the index
+    is memory-mapped from it instead of being refitted; otherwise the fitted index is saved there.
+    """
+    content_hash = file_hash(data_path)
+    index = load_snapshot(snapshot_path, content_hash)
+    if index is not None:
+        logger.info("Loaded %d documents from index snapshot %s", len(index.docs), snapshot_path)
+        index.configure_cache(**CACHE_PARAMS)
+        return index
 
     # Create a MinSearch index with specified text and keyword fields
     index = minsearch.Index(
-        text_fields=['intent', 'question', 'response'],  # full-text searchable fields
-        keyword_fields=['id', 'category'],               # exact match fields
+        text_fields=TEXT_FIELDS,
+        keyword_fields=KEYWORD_FIELDS,
+        scoring=SETTINGS.SEARCH_SCORING,  # tfidf or bm25
+        bm25_params=BM25_PARAMS,
+        storage=SETTINGS.INDEX_STORAGE,  # dicts or columnar
+        **CACHE_PARAMS,
     )
 
-    # Fit the index to our document list
-    index.fit(documents)
+    # Fit the index while streaming the canonical documents from disk
+    index.fit_stream(chunk_documents(canonical_documents(data_path)), chunk_size=SETTINGS.INGEST_CHUNK_SIZE,
+                     n_jobs=SETTINGS.INGEST_N_JOBS)
     logger.info("MinSearch index created successfully")
 
+    if snapshot_path and len(index.docs):
+        try:
+            index.save(snapshot_path, metadata={'content_hash': content_hash, 'chunking': CHUNKING, 'dedup': DEDUP})
+            logger.info("Saved index snapshot to %s", snapshot_path)
+        except OSError as e:
+            logger.warning("Could not save index snapshot to %s: %s", snapshot_path, e)
+
     return index
 
+
+def get_embedder(name=SETTINGS.EMBEDDER):
+    """Create the configured document/query embedder."""
+    if name == 'openai':
+        from openai import OpenAI
+
+        client = OpenAI(base_url=SETTINGS.BASE_URL, api_key=SETTINGS.API_KEY)
+        return dense.get_embedder('openai', SETTINGS.MODEL_EMBED, client=client)
+    # fastembed runs the HF model locally; hashing needs no model
+    return dense.get_embedder(name, SETTINGS.HF_MODEL_EMBED)
+
+
+def load_dense_index(data_path=SETTINGS.DATA_PATH, snapshot_path=SETTINGS.DENSE_INDEX_PATH, embedder=None):
+    """
+    Embed the documents and create a dense vector index.
+
+    Embeddings are cached at ``snapshot_path`` and reused while the data file's content hash
+    and the embedder are unchanged.
+    """
+    if embedder is None:
+        embedder = get_embedder()
+    content_hash = file_hash(data_path)
+
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            manifest = dense.DenseIndex.read_manifest(snapshot_path)
+            if (manifest['metadata'].get('content_hash') == content_hash
+                    and manifest['metadata'].get('chunking') == CHUNKING
+                    and manifest['metadata'].get('dedup') == DEDUP
+                    and manifest['embedder'] == embedder.name
+                    and manifest['text_fields'] == DENSE_TEXT_FIELDS
+                    and manifest['keyword_fields'] == KEYWORD_FIELDS):
+                index = dense.DenseIndex.load(snapshot_path, embedder, use_faiss=SETTINGS.ENABLE_FAISS)
+                logger.info("Loaded %d embeddings from %s", len(index.docs), snapshot_path)
+                return index
+            logger.info("Dense index at %s is stale, re-embedding", snapshot_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable dense index at %s: %s", snapshot_path, e)
+
+    documents = list(chunk_documents(canonical_documents(data_path)))
+    index = dense.DenseIndex(
+        embedder,
+        text_fields=DENSE_TEXT_FIELDS,
+        keyword_fields=KEYWORD_FIELDS,
+        use_faiss=SETTINGS.ENABLE_FAISS,
+    )
+    index.fit(documents)
+    logger.info("Dense index created with %s embeddings", embedder.name)
+
+    if snapshot_path and documents:
+        try:
+            index.save(snapshot_path, metadata={'content_hash': content_hash, 'chunking': CHUNKING, 'dedup': DEDUP})
+        except OSError as e:
+            logger.warning("Could not save dense index to %s: %s", snapshot_path, e)
+
+    return index
+
+
 if __name__ == "__main__":
     idx = load_index()
     logger.info("Index ready for querying")
 
-    # Print first 3 documents for inspection
+    # Print the first document for inspection
     sample_docs = idx.docs[:1] if hasattr(idx, "docs") else []
     print("Sample documents in index:")
     for doc in sample_docs:
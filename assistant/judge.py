@@ -0,0 +1,171 @@
+"""
+Background LLM-as-judge evaluation of answered questions.
+
+/question stores each answer with relevance PENDING (see rag.deferred_relevance); the
+workers here drain those rows from the conversations table, judge them with
+rag.evaluate_relevance_batch and fill in relevance, relevance_explanation and the eval_* tokens.
+
+python judge.py                 # run EVAL_WORKERS judges until interrupted
+python judge.py --once          # judge what is queued now, then exit
+"""
+import argparse
+import threading
+import logging
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+import db
+import rag
+from config import SETTINGS
+
+
+def evaluate_pending(limit=SETTINGS.EVAL_BATCH_SIZE):
+    """
+    Judges up to ``limit`` of the oldest pending conversations, in one batch judge call,
+    and stores the verdicts.
+
+    The rows are claimed (JUDGING) and committed before the judge is called, so no
+    transaction stays open across the LLM call. If the judge fails, the rows are queued
+    again, or marked FAILED after EVAL_MAX_ATTEMPTS tries, and the error is raised.
+
+    Returns:
+        int: Number of conversations judged; 0 when the queue is empty.
+    """
+    rows = db.claim_conversations(
+        limit,
+        pending=rag.RELEVANCE_PENDING,
+        judging=rag.RELEVANCE_JUDGING,
+        failed=rag.RELEVANCE_FAILED,
+    )
+    if not rows:
+        return 0
+    try:
+        verdicts = rag.evaluate_relevance_batch([(row["question"], row["response"]) for row in rows])
+    except Exception as e:
+        db.release_conversations(
+            [row["id"] for row in rows],
+            f"Evaluation failed: {e}",
+            pending=rag.RELEVANCE_PENDING,
+            judging=rag.RELEVANCE_JUDGING,
+            failed=rag.RELEVANCE_FAILED,
+        )
+        raise
+    db.save_relevances([
+        (
+            row["id"],
+            relevance.get("Relevance", "UNKNOWN"),
+            relevance.get("Explanation", "Failed to parse evaluation"),
+            token_stats,
+        )
+        for row, (relevance, token_stats) in zip(rows, verdicts)
+    ])
+    return len(rows)
+
+
+class JudgeWorkers:
+    """
+    A bounded pool of daemon threads draining the queue of pending conversations.
+
+    Rows are claimed with SKIP LOCKED, so any number of pools (one per app process, or
+    ``python judge.py``) can drain the same queue. The queue is the table itself: answers
+    saved while no worker runs are judged once one starts, and answers claimed by a worker
+    that died are queued again after EVAL_CLAIM_TIMEOUT.
+    """
+
+    def __init__(self, n_workers=SETTINGS.EVAL_WORKERS, poll_interval=SETTINGS.EVAL_POLL_INTERVAL,
+                 max_backoff=SETTINGS.EVAL_MAX_BACKOFF):
+        """
+        Args:
+            n_workers (int): Concurrent judge calls.
+            poll_interval (float): Seconds an idle worker waits before polling the queue again.
+            max_backoff (float): Longest pause of a worker whose evaluations keep failing; the
+                                 pause doubles from ``poll_interval`` with every failure in a row.
+        """
+        self.n_workers = n_workers
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Starts the worker threads; does nothing once they run, so it can be called per request."""
+        with self._lock:
+            if len(self._threads) >= self.n_workers:
+                return self
+            while len(self._threads) < self.n_workers:
+                thread = threading.Thread(target=self._run, name=f"judge-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info("Started %d judge workers", len(self._threads))
+        return self
+
+    def notify(self):
+        """Wakes idle workers, e.g. right after a pending conversation was saved."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+        self._stop.clear()
+
+    def _run(self):
+        failures = 0
+        last_error = None
+        while not self._stop.is_set():
+            try:
+                judged = evaluate_pending()
+            except Exception as e:
+                # The claimed rows were queued again (or FAILED); retry after a growing pause.
+                # While e.g. the database stays down, only a change of error gets a traceback.
+                failures += 1
+                error = f"{type(e).__name__}: {e}"
+                if error != last_error:
+                    logger.exception("Background evaluation failed")
+                    last_error = error
+                else:
+                    logger.warning("Background evaluation failed %d times in a row: %s", failures, error)
+                delay = min(self.poll_interval * 2 ** min(failures - 1, 30), self.max_backoff)
+                # Answers saved meanwhile do not cut the pause short, stop does
+                self._stop.wait(delay)
+                continue
+            if failures:
+                logger.info("Background evaluation recovered after %d failures", failures)
+                failures, last_error = 0, None
+            if not judged:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Judge the relevance of pending answers")
+    parser.add_argument("--workers", type=int, default=max(SETTINGS.EVAL_WORKERS, 1))
+    parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+    args = parser.parse_args()
+
+    if args.once:
+        total = 0
+        while judged := evaluate_pending():
+            total += judged
+        logger.info("Judged %d pending conversations", total)
+        return
+
+    workers = JudgeWorkers(n_workers=args.workers).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        workers.stop()
+
+
+if __name__ == "__main__":
+    main()
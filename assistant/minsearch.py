@@ -1,25 +1,105 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic
+
 import pandas as pd
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.preprocessing import normalize
 
 import numpy as np
+import scipy.sparse as sp
+
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+
+# Number of filtered postings views kept per index (one per distinct filter_dict)
+FILTER_CACHE_SIZE = 16
+# Operators of a dict value in filter_dict
+FILTER_OPERATORS = ('$in', '$nin')
+
+# Scoring engines: TF-IDF cosine similarity, or Okapi BM25 over raw term counts
+SCORING_MODES = ('tfidf', 'bm25')
+BM25_DEFAULTS = {'k1': 1.2, 'b': 0.75}
+
+# Document storage: Python dicts, or compact columnar buffers with float32 postings
+STORAGE_MODES = ('dicts', 'columnar')
+
+# Documents vectorized together by Index.fit_stream
+STREAM_CHUNK_SIZE = 10_000
+
+# Fewer documents are counted in this process even with n_jobs > 1: starting the pool and
+# pickling the chunk counts costs more than the counting it spreads
+PARALLEL_FIT_MIN_DOCS = 10_000
+
+# Query-vector and result caches are off unless sized (entries per cache)
+QUERY_CACHE_SIZE = 0
+RESULT_CACHE_SIZE = 0
+
+# Pending add/update/delete operations that trigger a compaction of the delta segment
+COMPACTION_THRESHOLD = 1000
+
+# On-disk snapshot format written by Index.save; bump the version on layout changes
+SNAPSHOT_FORMAT = "minsearch-index"
+SNAPSHOT_VERSION = 4
+
+# Leading bytes of every lexicon term held in a fixed-width array; longer terms are compared in full
+LEXICON_PREFIX_BYTES = 16
+# Tokens whose ids each Lexicon keeps in a dict, so hot query terms skip the binary search
+LEXICON_CACHE_SIZE = 65_536
 
 
 class Index:
     """
     A simple search index using TF-IDF and cosine similarity for text fields and exact matching for keyword fields.
 
+    All text field matrices are stacked into a single term-major CSR matrix (``postings``)
+    at fit time, so a query is scored against every field with one sparse dot product.
+    With ``scoring='bm25'`` the postings hold precomputed BM25 term weights instead, and a
+    query sums the postings of its terms; filters, boosts and output ids work the same way.
+
+    Every field is analyzed with the same TfidfVectorizer settings, so the fitted field
+    vocabularies are kept as one shared ``Lexicon``: a query is tokenized once and its term
+    counts are sliced into each field's block and weighted with that field's IDF.
+
+    Documents added or updated after ``fit`` go to a small delta segment scored with the
+    fitted vocabulary and IDF, and deletions leave tombstones. Once enough changes pile up,
+    ``compact`` refits the statistics over the live documents and merges the segments.
+    Document positions (the '_id' of ``output_ids``) never change; deleted slots hold None.
+
+    With ``storage='columnar'`` documents are kept in a ``DocumentStore`` (one UTF-8 buffer
+    and offsets array per field), postings are float32 with int32 indices, and searches
+    return lazy ``DocumentView`` mappings instead of dicts.
+
+    Optional LRU caches map a normalized query to its vectorized form, and a (query, filter,
+    boosts, num_results) tuple to its ranked positions. Both are cleared by ``fit`` and
+    compaction, the result cache also by every add/update/delete; ``cache_info`` reports
+    hits and misses.
+
+    ``collapse_field`` groups results by a field's value (e.g. 'intent') and keeps the best
+    ``collapse_size`` hits of each group, selected from the score vector without ranking
+    every candidate.
+
     Attributes:
         text_fields (list): List of text field names to index.
         keyword_fields (list): List of keyword field names to index.
-        vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
+        analyzer (callable): Text -> list of terms, shared by all text fields.
+        lexicon (Lexicon): Shared term ids, each field's terms and IDF weights.
         keyword_df (pd.DataFrame): DataFrame containing keyword field data.
-        text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
-        docs (list): List of documents indexed.
+        keyword_index (dict): Per keyword field, a dict mapping each value to the sorted row ids holding it.
+        postings (scipy.sparse.csr_matrix): Stacked TF-IDF weights, one row per (field, term), one column per document.
+        field_offsets (dict): Row offset of each text field's term block in ``postings``.
+        field_stats (dict): With BM25 scoring, the fitted 'idf' vector and 'avgdl' of each text field.
+        docs (list or DocumentStore): Documents indexed, None for deleted documents.
     """
 
-    def __init__(self, text_fields, keyword_fields, vectorizer_params=None):
+    def __init__(self, text_fields, keyword_fields, vectorizer_params=None, scoring='tfidf', bm25_params=None,
+                 compaction_threshold=COMPACTION_THRESHOLD, background_compaction=True, storage='dicts',
+                 query_cache_size=QUERY_CACHE_SIZE, result_cache_size=RESULT_CACHE_SIZE, cache_ttl=None):
         """
         Initializes the Index with specified text and keyword fields.
 
@@ -27,9 +107,26 @@ class Index:
             text_fields (list): List of text field names to index.
             keyword_fields (list): List of keyword field names to index.
             vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            scoring (str): 'tfidf' (cosine similarity, default) or 'bm25'.
+            bm25_params (dict): BM25 'k1' and 'b', e.g. {'k1': 1.2, 'b': 0.75}. Keys named after a text
+                                field override them for that field, e.g. {'question': {'b': 0.3}}.
+            compaction_threshold (int): Number of pending document changes that triggers ``compact``.
+                                        None or 0 disables automatic compaction.
+            background_compaction (bool): If True, automatic compaction refits in a background thread
+                                          and swaps the result in. Defaults to True.
+            storage (str): 'dicts' (default) keeps documents as given with float64 postings;
+                           'columnar' stores them in a ``DocumentStore`` with float32 postings.
+            query_cache_size (int): Entries of the normalized query -> query vector cache; 0 disables it.
+            result_cache_size (int): Entries of the search -> ranked positions cache; 0 disables it.
+            cache_ttl (float): Seconds a cache entry stays valid; None keeps entries until evicted.
         """
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"scoring must be one of {SCORING_MODES}, got {scoring!r}")
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"storage must be one of {STORAGE_MODES}, got {storage!r}")
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
+        self.scoring = scoring
         if vectorizer_params is None:
             vectorizer_params = {}
 
@@ -42,105 +139,1873 @@ class Index:
         }
         # Update with user parameters, but ensure defaults are used if not specified
         vectorizer_params = {**default_params, **vectorizer_params}
+        if scoring == 'bm25':
+            # BM25 weights are computed from raw term counts
+            vectorizer_params = {**vectorizer_params, 'use_idf': False, 'norm': None}
+        self.vectorizer_params = vectorizer_params
+
+        bm25_params = bm25_params or {}
+        self.bm25_params = {
+            field: {**BM25_DEFAULTS, **{k: v for k, v in bm25_params.items() if k in BM25_DEFAULTS},
+                    **bm25_params.get(field, {})}
+            for field in text_fields
+        }
+
+        # Cosine similarity needs unit rows; the default 'l2' norm already provides them
+        self._normalize = scoring == 'tfidf' and vectorizer_params.get('norm', 'l2') != 'l2'
 
-        self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
-        self.keyword_df = None
-        self.text_matrices = {}
+        self.compaction_threshold = compaction_threshold
+        self.background_compaction = background_compaction
+        self.storage = storage
+        self.dtype = np.float32 if storage == 'columnar' else np.float64
+
+        # Tokenization and tf weighting settings shared by every field, as TfidfVectorizer applies them
+        template = TfidfVectorizer(**vectorizer_params)
+        self.analyzer = template.build_analyzer()
+        self._binary, self._sublinear_tf, self._norm = template.binary, template.sublinear_tf, template.norm
+
+        self.lexicon = None
+        self.keyword_index = {}
+        self.postings = None
+        self.field_offsets = {}
+        self.field_stats = {}
         self.docs = []
+        self._keyword_df = None
+        self._filter_cache = OrderedDict()
+        self._collapse_codes = {}
+        self._generation = 0
+        self.configure_cache(query_cache_size, result_cache_size, cache_ttl)
+
+        # Delta segment and tombstones for changes made since the last fit/compaction
+        self._lock = threading.RLock()
+        self._n_base = 0
+        self._base_live = None
+        self._delta = {}
+        self._delta_ids = np.empty(0, dtype=np.intp)
+        self._delta_postings = None
+        self._pending = 0
+        self._compaction_thread = None
+        self._dirty = None
+        # Bumped by every fit; a compaction started before it discards its refit
+        self._fit_epoch = 0
+
+    @property
+    def keyword_df(self):
+        """DataFrame containing keyword field data, one row per document position."""
+        if self._keyword_df is None:
+            self._keyword_df = self._build_keyword_df()
+        return self._keyword_df
+
+    def _build_keyword_df(self):
+        if isinstance(self.docs, DocumentStore):
+            return pd.DataFrame({field: self.docs.column(field, default='') for field in self.keyword_fields})
+        return pd.DataFrame({
+            field: [doc.get(field, '') if doc is not None else '' for doc in self.docs]
+            for field in self.keyword_fields
+        })
+
+    def _store(self, docs):
+        """Holds ``docs`` in the configured storage."""
+        if self.storage == 'columnar':
+            return docs if isinstance(docs, DocumentStore) and not docs._overlay else DocumentStore(docs)
+        return list(docs)
 
-    def fit(self, docs):
+    def configure_cache(self, query_cache_size=QUERY_CACHE_SIZE, result_cache_size=RESULT_CACHE_SIZE, cache_ttl=None):
+        """
+        Replaces the query-vector and result caches, e.g. after ``load``. ``generation``
+        keeps counting, so answers cached against it stay tied to the documents.
+
+        Args:
+            query_cache_size (int): Entries of the query vector cache; 0 disables it.
+            result_cache_size (int): Entries of the result cache; 0 disables it.
+            cache_ttl (float): Seconds a cache entry stays valid; None keeps entries until evicted.
+        """
+        self._query_cache = LRUCache(query_cache_size, cache_ttl) if query_cache_size else None
+        self._result_cache = LRUCache(result_cache_size, cache_ttl) if result_cache_size else None
+
+    @property
+    def cache_info(self):
+        """Hits, misses and size of the query-vector ('query') and result ('result') caches."""
+        return {
+            'query': self._query_cache.info() if self._query_cache is not None else None,
+            'result': self._result_cache.info() if self._result_cache is not None else None,
+        }
+
+    def _invalidate_caches(self, vocabulary=False):
+        """Drops cached results, and cached query vectors too when the vocabulary changed."""
+        self._generation += 1
+        self._filter_cache.clear()
+        self._collapse_codes = {}
+        if self._result_cache is not None:
+            self._result_cache.clear()
+        if vocabulary and self._query_cache is not None:
+            self._query_cache.clear()
+
+    @property
+    def generation(self):
+        """Counter bumped whenever documents or postings change; caches of answers built on results compare it."""
+        return self._generation
+
+    @property
+    def pending_changes(self):
+        """Number of document changes since the last fit or compaction."""
+        return self._pending
+
+    @property
+    def text_matrices(self):
+        """Per-field document-term matrices, as zero-copy views into ``postings``."""
+        if self.postings is None:
+            return {}
+        matrices = {}
+        for field in self.text_fields:
+            start = self.field_offsets[field]
+            stop = start + self.lexicon.field_size(field)
+            matrices[field] = self.postings[start:stop].T
+        return matrices
+
+    def fit(self, docs, n_jobs=None, chunk_size=STREAM_CHUNK_SIZE):
         """
         Fits the index with the provided documents.
 
+        With ``n_jobs`` > 1 every text field is split into chunks of ``chunk_size`` documents
+        that are tokenized and counted in a process pool, fields and chunks in parallel; the
+        chunk counts are merged into the same vocabulary, IDF and postings the serial fit builds.
+        Collections smaller than ``PARALLEL_FIT_MIN_DOCS`` are fitted serially.
+
         Args:
             docs (list of dict): List of documents to index. Each document is a dictionary.
+            n_jobs (int): Worker processes counting terms; None or 1 fits serially, -1 uses every CPU.
+            chunk_size (int): Documents per counting task when ``n_jobs`` > 1. Defaults to 10,000.
         """
-        self.docs = docs
-        keyword_data = {field: [] for field in self.keyword_fields}
+        with self._lock:
+            self.docs = self._store(docs)
+            self._reset_segments()
 
-        # Handle empty documents case
-        if not docs:
-            self.keyword_df = pd.DataFrame(keyword_data)
-            return self
+            # Handle empty documents case
+            if not self.docs:
+                return self
 
+            self.set_postings(*self.fit_postings(self.docs, n_jobs, chunk_size))
+
+        return self
+
+    def fit_stream(self, docs, chunk_size=STREAM_CHUNK_SIZE, n_jobs=None):
+        """
+        Fits the index from an iterable of documents, e.g. a generator parsing a large file,
+        without materializing every field's text for the whole collection at once.
+
+        The iterable is consumed once. The first pass tokenizes chunk by chunk, keeping each
+        chunk's documents (already columnar with ``storage='columnar'``) and term counts over a
+        chunk-local vocabulary while merging document frequencies. The second pass maps the
+        chunk counts onto the merged vocabulary, applies the IDF and stacks the chunk matrices,
+        without tokenizing again. Vocabulary, IDF and postings match ``fit`` exactly.
+
+        Args:
+            docs (iterable of dict): Documents to index.
+            chunk_size (int): Number of documents vectorized together. Defaults to 10,000.
+            n_jobs (int): Worker processes counting the chunks while the next ones are read;
+                          None or 1 counts them in this process, -1 uses every CPU. The pool
+                          starts once ``PARALLEL_FIT_MIN_DOCS`` documents have been read.
+        """
+        chunks = []
+
+        # Pass 1: store the chunks, their term counts and the document frequencies
+        with _CountPool(self.vectorizer_params, self.text_fields, n_jobs) as pool:
+            for chunk in _chunked(docs, chunk_size):
+                chunks.append(DocumentStore(chunk) if self.storage == 'columnar' else chunk)
+                for field in self.text_fields:
+                    pool.submit(field, _texts(chunks[-1], field))
+            counts, df, tf = pool.results()
+        n_docs = sum(len(chunk) for chunk in chunks)
+
+        with self._lock:
+            self.docs = DocumentStore.concat(chunks) if self.storage == 'columnar' else [d for c in chunks for d in c]
+            self._reset_segments()
+            if not n_docs:
+                return self
+
+            # Pass 2: weight the chunk counts with the collection-wide vocabulary and IDF
+            chunk_sizes = [len(chunk) for chunk in chunks]
+            del chunks
+            self.set_postings(*self._postings_from_counts(df, tf, counts, chunk_sizes, range(n_docs), n_docs))
+
+        return self
+
+    def _postings_from_counts(self, df, tf, counts, chunk_sizes, live, n_docs):
+        """
+        Fits the vocabularies and IDF from merged chunk counts and weights the counts into postings.
+
+        Args:
+            df (dict): Per text field, term -> document frequency over all chunks.
+            tf (dict): Per text field, term -> total occurrences over all chunks.
+            counts (dict): Per text field, the ``_count_terms`` output of every chunk; emptied.
+            chunk_sizes (list): Documents per chunk.
+            live (sequence): Position of each counted document, in chunk order.
+            n_docs (int): Number of positions; missing ones get empty columns.
+
+        Returns:
+            tuple: (lexicon, postings, field_offsets, field_stats)
+        """
+        vectorizers = {}
+        matrices = {}
         for field in self.text_fields:
-            texts = [doc.get(field, '') for doc in docs]
+            vectorizers[field] = vectorizer = self._vectorizer_from_counts(df[field], tf[field], len(live))
+            chunk_counts = counts.pop(field)
+            # df holds the terms in order of first occurrence over the chunks
+            rank = {term: i for i, term in enumerate(df[field])}
+            blocks = []
+            for i, n_rows in enumerate(chunk_sizes):
+                blocks.append(_remap_counts(chunk_counts[i], vectorizer.vocabulary_, rank, n_rows))
+                chunk_counts[i] = None
+            # Same weighting and normalization as TfidfVectorizer.transform
+            transformer = TfidfTransformer(
+                norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf,
+            )
+            if vectorizer.use_idf:
+                transformer.idf_ = vectorizer.idf_
+            else:
+                transformer.fit(sp.csr_matrix((1, len(vectorizer.vocabulary_))))
+            matrices[field] = transformer.transform(sp.vstack(blocks, format='csr'), copy=False)
+        lexicon = Lexicon.from_vectorizers(vectorizers)
+        del vectorizers
+        return (lexicon, *self._assemble_postings(matrices, live, n_docs))
+
+    def _vectorizer_from_counts(self, df, tf, n_docs):
+        """
+        A TfidfVectorizer fitted from merged term counts, as ``fit`` on all texts would fit it.
+
+        Args:
+            df (dict): Term -> number of documents containing it.
+            tf (dict): Term -> total occurrences, used by ``max_features``.
+            n_docs (int): Number of documents counted.
+        """
+        vectorizer = TfidfVectorizer(**self.vectorizer_params)
+        terms = np.array(sorted(df), dtype=object)
+        doc_freq = np.array([df[term] for term in terms], dtype=np.int64)
+
+        # Same pruning as CountVectorizer._limit_features
+        max_df, min_df = vectorizer.max_df, vectorizer.min_df
+        max_count = max_df if isinstance(max_df, (int, np.integer)) else max_df * n_docs
+        min_count = min_df if isinstance(min_df, (int, np.integer)) else min_df * n_docs
+        if max_count < min_count:
+            raise ValueError("max_df corresponds to < documents than min_df")
+        keep = np.flatnonzero((doc_freq <= max_count) & (doc_freq >= min_count))
+        if vectorizer.max_features is not None and len(keep) > vectorizer.max_features:
+            term_freq = np.array([tf[term] for term in terms[keep]], dtype=np.int64)
+            keep = np.sort(keep[np.argsort(-term_freq)[:vectorizer.max_features]])
+
+        if not len(keep):
+            # As in fit: fall back to a dummy vocabulary with a single term
+            return vectorizer.fit(["dummy_term"])
+
+        vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms[keep].tolist())}
+        if vectorizer.use_idf:
+            # Same IDF as TfidfTransformer.fit, which only needs each term's document frequency
+            smooth = int(vectorizer.smooth_idf)
+            vectorizer.idf_ = np.log((n_docs + smooth) / (doc_freq[keep] + smooth)) + 1
+        return vectorizer
+
+    def _reset_segments(self):
+        """Drops the delta segment, tombstones and derived state before a full fit."""
+        self._fit_epoch += 1
+        self._keyword_df = None
+        self._invalidate_caches(vocabulary=True)
+        self._delta = {}
+        self._delta_ids = np.empty(0, dtype=np.intp)
+        self._delta_postings = None
+        self._base_live = None
+        self._pending = 0
+        if not self.docs:
+            self.postings = None
+            self._n_base = 0
+            self.keyword_index = {field: {} for field in self.keyword_fields}
+
+    def set_postings(self, lexicon, postings, field_offsets, field_stats, docs=None):
+        """
+        Installs a fitted lexicon and postings instead of fitting them, e.g. one shard's
+        columns of postings fitted over a larger collection, so its scores stay comparable.
+
+        Args:
+            lexicon (Lexicon): Fitted terms and IDF weights of every text field.
+            postings (scipy.sparse.csr_matrix): Term-major postings, one column per document.
+            field_offsets (dict): Row offset of each text field's term block.
+            field_stats (dict): BM25 statistics per text field, empty with TF-IDF scoring.
+            docs (list of dict): Documents matching the postings columns; keeps ``docs`` if None.
+        """
+        with self._lock:
+            if docs is not None:
+                self.docs = self._store(docs)
+            # Changes scored against the previous vocabulary are replaced, as by a fit
+            self._reset_segments()
+            self.lexicon, self.postings = lexicon, postings
+            self.field_offsets, self.field_stats = field_offsets, field_stats
+            self._n_base = postings.shape[1]
+            self._build_keyword_index()
+        return self
+
+    def fit_postings(self, docs, n_jobs=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Fits fresh vectorizers on the live documents and builds the stacked postings, without
+        installing them: ``set_postings`` takes the result, e.g. one shard's columns of it.
+
+        Args:
+            docs (list): Documents by position; None entries are deleted and get empty columns.
+            n_jobs (int): Worker processes counting fields and chunks in parallel, as in ``fit``.
+            chunk_size (int): Documents per counting task when ``n_jobs`` > 1.
+
+        Returns:
+            tuple: (lexicon, postings, field_offsets, field_stats)
+        """
+        live = [i for i, doc in enumerate(docs) if doc is not None]
+        if _resolve_n_jobs(n_jobs) > 1 and len(live) >= PARALLEL_FIT_MIN_DOCS:
+            chunks = [live[start:start + chunk_size] for start in range(0, len(live), chunk_size)]
+            with _CountPool(self.vectorizer_params, self.text_fields, n_jobs, min_docs=0) as pool:
+                # Every (field, chunk) pair is one task, so even a single large field spreads over the workers
+                for field in self.text_fields:
+                    for chunk in chunks:
+                        pool.submit(field, [docs[i].get(field, '') for i in chunk])
+                counts, df, tf = pool.results()
+            return self._postings_from_counts(df, tf, counts, [len(chunk) for chunk in chunks], live, len(docs))
+
+        vectorizers = {field: TfidfVectorizer(**self.vectorizer_params) for field in self.text_fields}
+
+        matrices = {}
+        for field in self.text_fields:
+            texts = [docs[i].get(field, '') for i in live]
             try:
-                self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+                matrices[field] = vectorizers[field].fit_transform(texts)
             except ValueError as e:
                 if "no terms remain" in str(e) or "empty vocabulary" in str(e):
-                    # If no terms remain, create a dummy matrix with a single term
+                    # If no terms remain, fit a dummy vocabulary with a single term
                     dummy_text = "dummy_term"  # A term that won't be filtered out
-                    self.text_matrices[field] = self.vectorizers[field].fit_transform([dummy_text])
+                    vectorizers[field].fit([dummy_text])
+                    matrices[field] = vectorizers[field].transform(texts)
                 else:
                     raise
+        # The vectorizers' vocabulary dicts are dropped once merged into the lexicon
+        return (Lexicon.from_vectorizers(vectorizers), *self._assemble_postings(matrices, live, len(docs)))
 
-        for doc in docs:
+    def _assemble_postings(self, matrices, live, n_docs):
+        """
+        Weights the per-field document-term matrices and stacks them into term-major postings.
+
+        Args:
+            matrices (dict): Vectorizer output per text field, one row per live document; emptied.
+            live (sequence): Position of each matrix row.
+            n_docs (int): Number of positions; missing ones get empty columns.
+
+        Returns:
+            tuple: (postings, field_offsets, field_stats)
+        """
+        blocks = []
+        field_offsets = {}
+        field_stats = {}
+        offset = 0
+        for field in self.text_fields:
+            # Release each field's float64 matrix once it is weighted and cast
+            matrix = matrices.pop(field)
+            if self._normalize:
+                matrix = normalize(matrix)
+            if self.scoring == 'bm25':
+                matrix, field_stats[field] = _bm25_weights(matrix, **self.bm25_params[field])
+            blocks.append(matrix.astype(self.dtype, copy=False))
+            field_offsets[field] = offset
+            offset += matrix.shape[1]
+            del matrix
+
+        matrix = sp.hstack(blocks, format='csr')
+        del blocks
+        if len(live) < n_docs:
+            # Deleted documents keep their position as an all-zero row
+            scatter = sp.csr_matrix((np.ones(len(live)), (live, np.arange(len(live)))), shape=(n_docs, len(live)))
+            matrix = scatter @ matrix
+
+        # Term-major layout: each row is the posting list of one (field, term) pair,
+        # so scoring only touches the postings of the query's terms
+        return self._compact_csr(matrix.T.tocsr()), field_offsets, field_stats
+
+    def _transform(self, docs):
+        """Vectorizes documents with the fitted vocabulary into term-major postings columns."""
+        blocks = []
+        for field in self.text_fields:
+            matrix = self.vectorize([doc.get(field, '') for doc in docs], field)
+            if self._normalize:
+                matrix = normalize(matrix)
+            if self.scoring == 'bm25':
+                matrix, _ = _bm25_weights(matrix, **self.bm25_params[field], stats=self.field_stats[field])
+            blocks.append(matrix)
+        return self._compact_csr(sp.hstack(blocks, format='csr').T.tocsr())
+
+    def _compact_csr(self, matrix):
+        """Casts postings to the index dtype; columnar storage also narrows the indices to int32."""
+        matrix = matrix.astype(self.dtype, copy=False)
+        if self.storage == 'columnar' and matrix.nnz < np.iinfo(np.int32).max and matrix.shape[1] < np.iinfo(np.int32).max:
+            matrix.indices = matrix.indices.astype(np.int32, copy=False)
+            matrix.indptr = matrix.indptr.astype(np.int32, copy=False)
+        return matrix
+
+    def _build_keyword_index(self):
+        """Builds the posting list of row ids per keyword value, so filters never scan a column."""
+        if not self.keyword_fields:
+            self.keyword_index = {}
+            return
+        # Not cached: the posting lists replace the DataFrame, which is only rebuilt on demand
+        keyword_df = self._keyword_df if self._keyword_df is not None else self._build_keyword_df()
+        deleted = [i for i, doc in enumerate(self.docs) if doc is None]
+        if deleted:
+            keyword_df = keyword_df.drop(index=deleted)
+        self.keyword_index = build_keyword_index(keyword_df)
+        if self.storage == 'columnar' and len(self.docs) < np.iinfo(np.int32).max:
+            self.keyword_index = {
+                field: {value: rows.astype(np.int32) for value, rows in postings.items()}
+                for field, postings in self.keyword_index.items()
+            }
+
+    def _index_keywords(self, doc_id, doc, remove=False):
+        """Adds ``doc_id`` to, or removes it from, the keyword posting lists of ``doc``'s values."""
+        for field in self.keyword_fields:
+            value = doc.get(field, '')
+            postings = self.keyword_index[field]
+            rows = postings.get(value, np.empty(0, dtype=np.intp))
+            if remove:
+                rows = rows[rows != doc_id]
+            else:
+                rows = np.insert(rows, np.searchsorted(rows, doc_id), doc_id)
+            if len(rows):
+                postings[value] = rows
+            else:
+                postings.pop(value, None)
+
+    def add_documents(self, docs):
+        """
+        Adds documents without refitting; they are scored with the current vocabulary and IDF
+        until the next compaction.
+
+        Args:
+            docs (list of dict): Documents to add.
+
+        Returns:
+            list of int: The positions ('_id') assigned to the new documents.
+        """
+        docs = list(docs)
+        with self._lock:
+            doc_ids = list(range(len(self.docs), len(self.docs) + len(docs)))
+            if self.postings is None:
+                self.fit(list(self.docs) + docs)
+                return doc_ids
+
+            for doc_id, doc in zip(doc_ids, docs):
+                self.docs.append(doc)
+                self._delta[doc_id] = doc
+                self._index_keywords(doc_id, doc)
+            self._mark_changed(doc_ids)
+        self._maybe_compact()
+        return doc_ids
+
+    def update_document(self, doc_id, doc):
+        """
+        Replaces the document at position ``doc_id``, keeping its position.
+
+        Raises:
+            KeyError: If there is no live document at ``doc_id``.
+        """
+        with self._lock:
+            old_doc = self._live_doc(doc_id)
+            self._index_keywords(doc_id, old_doc, remove=True)
+            self.docs[doc_id] = doc
+            self._delta[doc_id] = doc
+            self._index_keywords(doc_id, doc)
+            self._mark_changed([doc_id])
+        self._maybe_compact()
+
+    def delete_document(self, doc_id):
+        """
+        Deletes the document at position ``doc_id``, leaving a tombstone in its slot.
+
+        Raises:
+            KeyError: If there is no live document at ``doc_id``.
+        """
+        with self._lock:
+            old_doc = self._live_doc(doc_id)
+            self._index_keywords(doc_id, old_doc, remove=True)
+            self.docs[doc_id] = None
+            self._delta.pop(doc_id, None)
+            self._mark_changed([doc_id])
+        self._maybe_compact()
+
+    def _live_doc(self, doc_id):
+        if not 0 <= doc_id < len(self.docs) or self.docs[doc_id] is None:
+            raise KeyError(f"No document with _id {doc_id}")
+        return self.docs[doc_id]
+
+    def _mark_changed(self, doc_ids):
+        """
+        Tombstones the base columns of changed documents and updates their delta columns.
+
+        Only the changed documents are vectorized: their old delta columns are dropped and
+        the live ones appended, keeping the delta columns in position order.
+        """
+        for doc_id in doc_ids:
+            if doc_id < self._n_base:
+                if self._base_live is None:
+                    self._base_live = np.ones(self._n_base, dtype=bool)
+                self._base_live[doc_id] = False
+        if self._dirty is not None:
+            self._dirty.update(doc_ids)
+        self._pending += len(doc_ids)
+
+        changed = np.array(sorted(set(doc_ids)), dtype=np.intp)
+        kept = np.flatnonzero(~np.isin(self._delta_ids, changed))
+        added = np.array([i for i in changed.tolist() if i in self._delta], dtype=np.intp)
+        blocks = []
+        if len(kept):
+            blocks.append(self._delta_postings if len(kept) == len(self._delta_ids) else self._delta_postings[:, kept])
+        if len(added):
+            blocks.append(self._transform([self.docs[i] for i in added]))
+        delta_ids = np.concatenate([self._delta_ids[kept], added])
+        if not blocks:
+            self._delta_postings = None
+        else:
+            delta_postings = blocks[0] if len(blocks) == 1 else sp.hstack(blocks, format='csr')
+            if np.any(np.diff(delta_ids) < 0):
+                # Updated documents sort before newer additions
+                order = np.argsort(delta_ids, kind='stable')
+                delta_ids, delta_postings = delta_ids[order], delta_postings[:, order]
+            self._delta_postings = self._compact_csr(delta_postings)
+        self._delta_ids = delta_ids
+        self._keyword_df = None
+        self._invalidate_caches()
+
+    def _maybe_compact(self):
+        if self.compaction_threshold and self._pending >= self.compaction_threshold:
+            self.compact(background=self.background_compaction)
+
+    def compact(self, background=False):
+        """
+        Refits the vocabulary and IDF over the live documents and merges the delta segment
+        into the base postings. Changes made while a compaction runs are kept in the new delta.
+
+        Args:
+            background (bool): If True, refit in a background thread and return immediately.
+        """
+        with self._lock:
+            running = self._compaction_thread
+        if running is not None:
+            if background:
+                return
+            running.join()
+
+        with self._lock:
+            if self._compaction_thread is not None or self.postings is None or not self._pending:
+                return
+            docs = list(self.docs)
+            self._dirty = set()
+            self._compaction_thread = threading.Thread(target=self._run_compaction, args=(docs, self._fit_epoch),
+                                                       daemon=True)
+            thread = self._compaction_thread
+
+        thread.start()
+        if not background:
+            thread.join()
+
+    def _run_compaction(self, docs, epoch):
+        try:
+            lexicon, postings, field_offsets, field_stats = self.fit_postings(docs)
+            with self._lock:
+                if epoch != self._fit_epoch:
+                    # The index was fitted on other documents while this refit ran
+                    return
+                self.lexicon, self.postings, self.field_offsets = lexicon, postings, field_offsets
+                self.field_stats = field_stats
+                self._invalidate_caches(vocabulary=True)
+                self._n_base = postings.shape[1]
+                self._base_live = None
+                self._pending = 0
+                if isinstance(self.docs, DocumentStore):
+                    # Fold changed documents back into the column buffers
+                    self.docs = DocumentStore(self.docs)
+
+                # Documents changed during the refit go back into the delta, against the new vocabulary
+                dirty, self._dirty = self._dirty, None
+                self._delta = {i: self.docs[i] for i in dirty if self.docs[i] is not None}
+                self._delta_ids = np.empty(0, dtype=np.intp)
+                self._delta_postings = None
+                self._mark_changed(sorted(dirty))
+        finally:
+            with self._lock:
+                self._dirty = None
+                self._compaction_thread = None
+
+    def save(self, path, metadata=None):
+        """
+        Writes the fitted index to a versioned snapshot directory.
+
+        The lexicon, IDF vectors, the CSR arrays of ``postings`` and the keyword columns are
+        stored as ``.npy`` files so ``load`` can memory-map them; documents go to ``docs.json``.
+        The directory is written next to ``path`` and renamed into place, so readers never see
+        a partial snapshot.
+
+        Args:
+            path (str): Snapshot directory to create or replace.
+            metadata (dict): Optional JSON-serializable values stored in the manifest,
+                             e.g. a content hash of the source data.
+        """
+        if self.postings is None:
+            raise ValueError("Cannot save an index that has not been fitted")
+        # Snapshots hold a single segment
+        self.compact()
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+        try:
+            def save_array(name, array):
+                np.save(os.path.join(tmp_path, f'{name}.npy'), array, allow_pickle=False)
+
+            save_array('lexicon.buffer', self.lexicon.buffer)
+            save_array('lexicon.offsets', self.lexicon.offsets)
+            save_array('lexicon.prefixes', self.lexicon.prefixes)
+            for field in self.text_fields:
+                save_array(f'terms.{field}', self.lexicon.field_terms[field])
+                if self.lexicon.field_idf[field] is not None:
+                    save_array(f'idf.{field}', self.lexicon.field_idf[field])
+                if field in self.field_stats:
+                    save_array(f'bm25_idf.{field}', self.field_stats[field]['idf'])
+
+            save_array('postings.data', self.postings.data)
+            save_array('postings.indices', self.postings.indices)
+            save_array('postings.indptr', self.postings.indptr)
+
+            keyword_values = {}
             for field in self.keyword_fields:
-                keyword_data[field].append(doc.get(field, ''))
+                codes, uniques = pd.factorize(self.keyword_df[field], use_na_sentinel=False)
+                save_array(f'keyword.{field}', codes)
+                keyword_values[field] = uniques.tolist()
 
-        self.keyword_df = pd.DataFrame(keyword_data)
+            docs = self.docs.to_list() if isinstance(self.docs, DocumentStore) else self.docs
+            with open(os.path.join(tmp_path, 'docs.json'), 'wt', encoding='utf-8') as f_out:
+                json.dump(docs, f_out, ensure_ascii=False)
 
-        return self
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'version': SNAPSHOT_VERSION,
+                'text_fields': self.text_fields,
+                'keyword_fields': self.keyword_fields,
+                'vectorizer_params': self.vectorizer_params,
+                'scoring': self.scoring,
+                'storage': self.storage,
+                'bm25_params': self.bm25_params,
+                'bm25_avgdl': {field: stats['avgdl'] for field, stats in self.field_stats.items()},
+                'field_offsets': self.field_offsets,
+                'postings_shape': list(self.postings.shape),
+                'keyword_values': keyword_values,
+                'metadata': metadata or {},
+            }
+            with open(os.path.join(tmp_path, 'manifest.json'), 'wt', encoding='utf-8') as f_out:
+                json.dump(manifest, f_out, ensure_ascii=False, indent=2)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def read_manifest(path):
+        """
+        Reads and validates the manifest of a snapshot written by ``save``.
+
+        Raises:
+            ValueError: If the directory is not a snapshot of a supported version.
+        """
+        with open(os.path.join(path, 'manifest.json'), 'rt', encoding='utf-8') as f_in:
+            manifest = json.load(f_in)
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported index snapshot at {path}: "
+                f"{manifest.get('format')} v{manifest.get('version')}, expected {SNAPSHOT_FORMAT} v{SNAPSHOT_VERSION}"
+            )
+        return manifest
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads an index written by ``save`` without refitting.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap (bool): If True, array files are memory-mapped read-only, so processes loading
+                         the same snapshot share its pages. Defaults to True.
+
+        Returns:
+            Index: The loaded index, ready for ``search``.
+        """
+        manifest = cls.read_manifest(path)
+        vectorizer_params = dict(manifest['vectorizer_params'])
+        if 'ngram_range' in vectorizer_params:
+            # JSON has no tuples, and sklearn rejects a list here when refitting
+            vectorizer_params['ngram_range'] = tuple(vectorizer_params['ngram_range'])
+        index = cls(manifest['text_fields'], manifest['keyword_fields'], vectorizer_params,
+                    scoring=manifest['scoring'], bm25_params=manifest['bm25_params'],
+                    storage=manifest.get('storage', 'dicts'))
+        mmap_mode = 'r' if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+
+        use_idf = TfidfVectorizer(**index.vectorizer_params).use_idf
+        index.lexicon = Lexicon(
+            load_array('lexicon.buffer'),
+            load_array('lexicon.offsets'),
+            load_array('lexicon.prefixes'),
+            {field: load_array(f'terms.{field}') for field in index.text_fields},
+            {field: np.asarray(load_array(f'idf.{field}')) if use_idf else None for field in index.text_fields},
+        )
+        for field in index.text_fields:
+            if field in manifest['bm25_avgdl']:
+                index.field_stats[field] = {
+                    'idf': np.asarray(load_array(f'bm25_idf.{field}')),
+                    'avgdl': manifest['bm25_avgdl'][field],
+                }
+
+        index.field_offsets = manifest['field_offsets']
+        index.postings = sp.csr_matrix(
+            (load_array('postings.data'), load_array('postings.indices'), load_array('postings.indptr')),
+            shape=tuple(manifest['postings_shape']),
+            copy=False,
+        )
+
+        keyword_data = {}
+        for field in index.keyword_fields:
+            uniques = np.empty(len(manifest['keyword_values'][field]), dtype=object)
+            uniques[:] = manifest['keyword_values'][field]
+            keyword_data[field] = uniques[load_array(f'keyword.{field}')]
+        index._keyword_df = pd.DataFrame(keyword_data)
+        index._n_base = index.postings.shape[1]
+
+        with open(os.path.join(path, 'docs.json'), 'rt', encoding='utf-8') as f_in:
+            index.docs = index._store(json.load(f_in))
+        index._build_keyword_index()
+
+        return index
 
-    def search(self, query, filter_dict=None, boost_dict=None, num_results=10, output_ids=False):
+    def search(self, query, filter_dict=None, boost_dict=None, num_results=10, output_ids=False, output_scores=False,
+               collapse_field=None, collapse_size=1):
         """
         Searches the index with the given query, filters, and boost parameters.
 
         Args:
             query (str): The search query string.
-            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by:
+                                a scalar for equality, a list/tuple/set for IN, or {'$in': [...]} / {'$nin': [...]}.
             boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
             num_results (int): The number of top results to return. Defaults to 10.
             output_ids (bool): If True, adds an '_id' field to each document containing its index. Defaults to False.
+            output_scores (bool): If True, adds a '_score' field to each document containing its relevance score. Defaults to False.
+            collapse_field (str): If set, returns at most ``collapse_size`` documents per distinct value of this
+                                  field, e.g. 'intent'. Documents without the field share one group.
+            collapse_size (int): Documents kept per ``collapse_field`` value. Defaults to 1.
 
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
                          If output_ids is True, each document will have an additional '_id' field.
         """
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_ids, output_scores,
+                                 collapse_field=collapse_field, collapse_size=collapse_size)[0]
+
+    def search_batch(self, queries, filter_dict=None, boost_dict=None, num_results=10, output_ids=False,
+                     output_scores=False, batch_size=256, collapse_field=None, collapse_size=1):
+        """
+        Searches the index with several queries at once, sharing the filter and boost parameters.
+
+        Each text field is vectorized with one ``transform`` call per batch and all queries in
+        the batch are scored with one sparse matrix-matrix product.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by, as in ``search``.
+            boost_dict (dict): Dictionary of boost scores for text fields, as in ``search``.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            output_ids (bool): If True, adds an '_id' field to each document containing its index. Defaults to False.
+            output_scores (bool): If True, adds a '_score' field to each document containing its relevance score. Defaults to False.
+            batch_size (int): Maximum number of queries scored together, bounding the dense
+                              ``batch_size x len(docs)`` score matrix. Defaults to 256.
+            collapse_field (str): Field whose values group the results, as in ``search``.
+            collapse_size (int): Documents kept per group, as in ``search``.
+
+        Returns:
+            list of list of dict: One ranked result list per query, in the order of ``queries``.
+        """
         if filter_dict is None:
             filter_dict = {}
         if boost_dict is None:
             boost_dict = {}
-            
+
+        queries = list(queries)
         if not self.docs:
-            return []
-            
-        query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
-        scores = np.zeros(len(self.docs))
-
-        # Compute cosine similarity for each text field and apply boost
-        for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
+            return [[] for _ in queries]
+
+        ranked = [None] * len(queries)
+        keys = None
+        generation = self._generation
+        if self._result_cache is not None:
+            search_key = (_filter_key(filter_dict), frozenset(boost_dict.items()), num_results,
+                          collapse_field, collapse_size if collapse_field else None)
+            keys = [(self._normalize_query(query), search_key) for query in queries]
+            ranked = [self._result_cache.get(key) for key in keys]
+        misses = [i for i, hit in enumerate(ranked) if hit is None]
+
+        for start in range(0, len(misses), batch_size):
+            batch = misses[start:start + batch_size]
+            scores, candidates = self._score([queries[i] for i in batch], filter_dict, boost_dict)
+            groups = None
+            if collapse_field:
+                # Positions only grow, so codes taken after scoring cover every scored column
+                groups = self._group_codes(collapse_field)
+                groups = groups if candidates is None else groups[candidates]
+            for i, row in zip(batch, scores):
+                ranked[i] = self._rank(row, candidates, num_results, groups, collapse_size)
+                if keys is not None:
+                    with self._lock:
+                        # Skip results scored against postings that changed meanwhile
+                        if generation == self._generation:
+                            self._result_cache.put(keys[i], ranked[i])
+
+        return [
+            self._results(top_indices, output_ids, top_scores if output_scores else None)
+            for top_indices, top_scores in ranked
+        ]
+
+    def _candidates(self, filter_dict):
+        """
+        Resolves keyword filters to the sorted row ids that pass all of them.
+
+        Args:
+            filter_dict (dict): Dictionary of keyword fields to filter by, as in ``search``.
+
+        Returns:
+            np.ndarray or None: Candidate row ids, or None when no filter applies.
+        """
+        return resolve_filter(self.keyword_index, len(self.docs), filter_dict)
+
+    def _score(self, queries, filter_dict, boost_dict):
+        """
+        Scores queries against the documents passing ``filter_dict``.
+
+        Returns:
+            tuple: (scores, candidates) where scores is a len(queries) x n_candidates array and
+                   candidates maps its columns back to document positions, or is None when the
+                   columns are all document positions in order.
+        """
+        # Take the segments and the query vectors under one lock, so a concurrent
+        # compaction cannot swap the vocabulary in between
+        with self._lock:
+            segments, candidates = self._filtered_segments(filter_dict)
+            query_matrix = self._query_matrix(queries, boost_dict)
+
+        # Cosine similarity of every text field with boost applied, one sparse product per segment
+        scores = [(query_matrix @ postings).toarray() for postings in segments]
+        if len(scores) == 1:
+            return scores[0], candidates
+        return np.hstack(scores), candidates
+
+    def _filtered_segments(self, filter_dict):
+        """
+        Returns the postings segments restricted to the live documents passing ``filter_dict``.
+
+        Only candidate documents are scored: the base postings are column-sliced to the
+        candidates and cached per distinct filter, so repeated filters such as the one
+        ``rag.search`` sends on every request pay for the slice once.
+
+        Returns:
+            tuple: (segments, candidates) where segments is a list of postings matrices whose
+                   concatenated columns map to the positions in candidates (None: all positions).
+        """
+        key = _filter_key(filter_dict)
+        if key in self._filter_cache:
+            self._filter_cache.move_to_end(key)
+            return self._filter_cache[key]
+
+        candidates = self._candidates(filter_dict)
+
+        # Base segment, without tombstoned columns
+        base_ids = None if candidates is None else candidates[candidates < self._n_base]
+        if self._base_live is not None:
+            base_ids = np.flatnonzero(self._base_live) if base_ids is None else base_ids[self._base_live[base_ids]]
+
+        if base_ids is None or len(base_ids) == self._n_base:
+            segments, ids = [self.postings], [np.arange(self._n_base)]
+        else:
+            segments, ids = [self.postings[:, base_ids]], [base_ids]
+
+        # Delta segment of documents added or updated since the last compaction
+        if len(self._delta_ids):
+            columns = np.arange(len(self._delta_ids))
+            if candidates is not None:
+                columns = columns[np.isin(self._delta_ids, candidates)]
+            segments.append(self._delta_postings[:, columns])
+            ids.append(self._delta_ids[columns])
+
+        if len(segments) == 1 and segments[0] is self.postings:
+            entry = (segments, None)
+        else:
+            entry = (segments, np.concatenate(ids))
+
+        self._filter_cache[key] = entry
+        if len(self._filter_cache) > FILTER_CACHE_SIZE:
+            self._filter_cache.popitem(last=False)
+        return entry
+
+    def _top_k(self, scores, num_results):
+        """Returns the indices of the highest non-zero scores, best first."""
+        return top_k(scores, num_results)
+
+    def _rank(self, scores, candidates, num_results, groups=None, group_size=1):
+        """
+        Selects the top documents of one query's score row.
+
+        Returns:
+            tuple: (positions, scores) of the top documents, best first; ``candidates``
+                   maps score columns to positions and ``groups``, if given, holds the
+                   collapse group of every column.
+        """
+        if groups is None:
+            top_columns = self._top_k(scores, num_results)
+        else:
+            top_columns = top_k_collapsed(scores, groups, num_results, group_size)
+        top_indices = top_columns if candidates is None else candidates[top_columns]
+        return top_indices, scores[top_columns]
+
+    def _group_codes(self, field):
+        """Integer group of every document position by its ``field`` value, cached until documents change."""
+        codes = self._collapse_codes.get(field)
+        if codes is None:
+            if isinstance(self.docs, DocumentStore):
+                values = self.docs.column(field)
+            else:
+                values = [doc.get(field) if doc is not None else None for doc in self.docs]
+            codes, _ = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+            self._collapse_codes[field] = codes
+        return codes
+
+    def _results(self, top_indices, output_ids, top_scores=None):
+        """Returns the documents at ``top_indices``, optionally tagged with their '_id' and '_score'."""
+        return format_results(self.docs, top_indices, output_ids, top_scores)
+
+    def _query_matrix(self, queries, boost_dict):
+        """
+        Builds the stacked query vectors, with each field's block scaled by its boost.
+
+        Args:
+            queries (list of str): The search query strings.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+
+        Returns:
+            scipy.sparse.csr_matrix: A len(queries) x n_terms matrix aligned with the rows of ``postings``.
+        """
+        if self._query_cache is not None:
+            matrix = self._cached_query_matrix(queries, boost_dict)
+        else:
+            matrix = self._vectorize_queries(queries, boost_dict)
+        # Match the postings dtype so the product does not upcast the postings
+        return matrix.astype(self.dtype, copy=False)
+
+    def _vectorize_queries(self, queries, boost_dict):
+        # Each query is tokenized once; every field's vector is a slice of the same term counts
+        term_counts = self._term_counts(queries)
+        blocks = []
+        for field in self.text_fields:
             boost = boost_dict.get(field, 1)
-            scores += sim * boost
-
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
-
-        # Get number of non-zero scores
-        non_zero_mask = scores > 0
-        non_zero_count = np.sum(non_zero_mask)
-        
-        if non_zero_count == 0:
-            return []
-            
-        # Ensure num_results doesn't exceed the number of non-zero scores
-        num_results = min(num_results, non_zero_count)
-        
-        # Get indices of non-zero scores
-        non_zero_indices = np.where(non_zero_mask)[0]
-        
-        # Sort non-zero scores in descending order
-        sorted_indices = non_zero_indices[np.argsort(-scores[non_zero_indices])]
-        
-        # Take top num_results
-        top_indices = sorted_indices[:num_results]
-        
-        # Return corresponding documents
+            if boost == 0:
+                blocks.append(sp.csr_matrix((len(queries), self.lexicon.field_size(field))))
+                continue
+            # TF-IDF query vectors, or raw query term counts with BM25 scoring
+            vecs = self._field_vectors(term_counts, len(queries), field)
+            if self._normalize:
+                vecs = normalize(vecs)
+            blocks.append(vecs * boost)
+        return sp.hstack(blocks, format='csr')
+
+    def _cached_query_matrix(self, queries, boost_dict):
+        """``_query_matrix`` with the unboosted query vectors taken from, or added to, the query cache."""
+        keys = [self._normalize_query(query) for query in queries]
+        rows = [self._query_cache.get(key) for key in keys]
+        misses = [i for i, row in enumerate(rows) if row is None]
+        if misses:
+            vecs = self._vectorize_queries([queries[i] for i in misses], {})
+            for j, i in enumerate(misses):
+                rows[i] = vecs[j]
+                self._query_cache.put(keys[i], rows[i])
+
+        matrix = sp.vstack(rows, format='csr')
+        boosts = [boost_dict.get(field, 1) for field in self.text_fields]
+        if any(boost != 1 for boost in boosts):
+            # Scale each field's block in place of the per-field multiply, keeping the entry order
+            sizes = [self.lexicon.field_size(field) for field in self.text_fields]
+            term_boosts = np.repeat(np.asarray(boosts, dtype=np.float64), sizes)
+            matrix.data = matrix.data * term_boosts[matrix.indices]
+        return matrix
+
+    def vectorize(self, texts, field):
+        """
+        Vectorizes texts with ``field``'s terms and weights, as its fitted TfidfVectorizer would transform them.
+
+        Returns:
+            scipy.sparse.csr_matrix: len(texts) x ``lexicon.field_size(field)`` weights.
+        """
+        texts = list(texts)
+        return self._field_vectors(self._term_counts(texts), len(texts), field)
+
+    def _term_counts(self, texts):
+        """
+        Tokenizes every text once and counts its terms in the shared lexicon.
+
+        Returns:
+            tuple: (rows, term_ids, counts) arrays sorted by row, then term id; terms missing
+                   from the lexicon are dropped.
+        """
+        tokens = []
+        lengths = np.zeros(len(texts), dtype=np.int64)
+        for row, text in enumerate(texts):
+            terms = self.analyzer(text)
+            tokens.extend(terms)
+            lengths[row] = len(terms)
+        term_ids = self.lexicon.lookup(tokens)
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        known = term_ids >= 0
+        keys, counts = np.unique(rows[known] * len(self.lexicon) + term_ids[known], return_counts=True)
+        return keys // len(self.lexicon), keys % len(self.lexicon), counts
+
+    def _field_vectors(self, term_counts, n_rows, field):
+        """
+        Slices ``field``'s terms out of ``_term_counts`` output and weights them like
+        TfidfVectorizer.transform: binary or sublinear tf, the field's IDF, then the norm.
+        """
+        rows, term_ids, counts = term_counts
+        field_terms = self.lexicon.field_terms[field]
+        # Field terms are sorted lexicon ids, so a term's column is its rank among them
+        columns = np.searchsorted(field_terms, term_ids)
+        found = columns < len(field_terms)
+        found[found] = field_terms[columns[found]] == term_ids[found]
+        rows, columns = rows[found], columns[found]
+
+        data = np.ones(len(columns)) if self._binary else counts[found].astype(np.float64)
+        if self._sublinear_tf:
+            np.log(data, out=data)
+            data += 1.0
+        idf = self.lexicon.field_idf[field]
+        if idf is not None:
+            data *= idf[columns]
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        matrix = sp.csr_matrix((data, columns, indptr), shape=(n_rows, len(field_terms)))
+        if self._norm is not None:
+            matrix = normalize(matrix, norm=self._norm, copy=False)
+        return matrix
+
+    def _normalize_query(self, query):
+        """Cache key of a query: whitespace collapsed, lowercased when the vectorizers lowercase."""
+        query = ' '.join(query.split())
+        if self.vectorizer_params.get('lowercase', True):
+            query = query.lower()
+        return query
+
+
+def format_results(docs, top_indices, output_ids=False, top_scores=None):
+    """
+    Returns ``docs`` at ``top_indices``, copied and tagged with '_id' and/or '_score' when requested.
+
+    Args:
+        docs (list): The indexed documents.
+        top_indices (np.ndarray): Ranked document positions.
+        output_ids (bool): Add each document's position as '_id'.
+        top_scores (np.ndarray): Scores aligned with ``top_indices``, added as '_score'.
+    """
+    if isinstance(docs, DocumentStore):
+        return docs.views(top_indices, output_ids, top_scores)
+    if not output_ids and top_scores is None:
+        return [docs[i] for i in top_indices]
+    results = []
+    for rank, i in enumerate(top_indices):
+        doc = dict(docs[i])
         if output_ids:
-            return [{**self.docs[i], '_id': int(i)} for i in top_indices]
-        return [self.docs[i] for i in top_indices]
\ No newline at end of file
+            doc['_id'] = int(i)
+        if top_scores is not None:
+            doc['_score'] = float(top_scores[rank])
+        results.append(doc)
+    return results
+
+
+class LRUCache:
+    """
+    Thread-safe bounded mapping with least-recently-used eviction and an optional TTL.
+
+    Attributes:
+        maxsize (int): Maximum number of entries.
+        ttl (float): Seconds an entry stays valid, or None.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that found no valid entry.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, monotonic())
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        """Counters and occupancy: {'hits', 'misses', 'size', 'maxsize'}."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+class Lexicon:
+    """
+    The vocabularies of all text fields as one sorted, array-backed term list.
+
+    Each distinct term has one id, its position in the sorted list. A field keeps the sorted
+    ids of its own terms, which is also the row order of its block in ``Index.postings``
+    (fitted vocabularies are sorted), so terms shared by several fields are stored once.
+
+    Terms live in one UTF-8 buffer with an offsets array, next to a fixed-width array of
+    their first ``LEXICON_PREFIX_BYTES`` bytes; UTF-8 byte order is ``sorted`` str order.
+    ``lookup`` binary-searches the prefixes for a whole batch of tokens with
+    ``np.searchsorted`` and compares full bytes only for longer tokens. There is no Python
+    object per term, and ``Index.load`` memory-maps all three arrays, so processes serving
+    the same snapshot share them.
+
+    Queries are a few tokens each, too few to amortize the array calls, so ``lookup`` keeps
+    the ids of up to ``cache_size`` recently seen tokens (unknown ones included) in a dict
+    and searches only the others; the dict is emptied when full. Query vocabularies are
+    small and skewed, so the cached lookup runs at dict speed.
+
+    Attributes:
+        buffer (np.ndarray): Concatenated UTF-8 bytes of the sorted terms (uint8).
+        offsets (np.ndarray): Start of every term in ``buffer``, plus the end (int64).
+        prefixes (np.ndarray): First bytes of every term, NUL-padded (``S{LEXICON_PREFIX_BYTES}``).
+        field_terms (dict): Field -> sorted int32 array of the ids of its terms.
+        field_idf (dict): Field -> IDF weight of each of its terms, or None without IDF.
+    """
+
+    def __init__(self, buffer, offsets, prefixes, field_terms, field_idf, cache_size=LEXICON_CACHE_SIZE):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.prefixes = prefixes
+        self.field_terms = field_terms
+        self.field_idf = field_idf
+        self.cache_size = cache_size
+        self._cache = {}
+
+    @classmethod
+    def from_terms(cls, terms, field_terms=None, field_idf=None):
+        """Builds the arrays of a sorted list of distinct terms."""
+        encoded = [term.encode('utf-8') for term in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        prefixes = np.array(encoded, dtype=f'S{LEXICON_PREFIX_BYTES}')
+        return cls(buffer, offsets, prefixes, field_terms or {}, field_idf or {})
+
+    @classmethod
+    def from_vectorizers(cls, vectorizers):
+        """Merges the vocabularies and IDF of fitted TfidfVectorizers, one per field."""
+        field_names = {field: vectorizer.get_feature_names_out().tolist() for field, vectorizer in vectorizers.items()}
+        lexicon = cls.from_terms(sorted(set().union(*field_names.values())))
+        for field, names in field_names.items():
+            # Whole vocabularies would only flush the cache of query tokens
+            term_ids = lexicon.search(names).astype(np.int32)
+            if np.any(np.diff(term_ids) <= 0):
+                raise ValueError(f"Vocabulary of field {field!r} is not in sorted term order")
+            lexicon.field_terms[field] = term_ids
+            lexicon.field_idf[field] = vectorizers[field].idf_ if vectorizers[field].use_idf else None
+        return lexicon
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def terms(self):
+        """All terms, decoded; for inspection, lookups never decode."""
+        data = self.buffer.tobytes()
+        return [data[start:stop].decode('utf-8') for start, stop in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+    def field_size(self, field):
+        """Number of terms of ``field``, i.e. rows of its postings block."""
+        return len(self.field_terms[field])
+
+    def lookup(self, tokens):
+        """
+        Term id of every token, -1 for tokens not in the lexicon; recently seen tokens are
+        answered from the cache and only the others are searched.
+
+        Args:
+            tokens (list of str): Tokens, e.g. the analyzer output of a batch of texts.
+
+        Returns:
+            np.ndarray: int64 ids aligned with ``tokens``.
+        """
+        if not self.cache_size:
+            return self.search(tokens)
+        cache = self._cache
+        ids = [cache.get(token) for token in tokens]
+        if None in ids:
+            misses = [token for token, term_id in zip(tokens, ids) if term_id is None]
+            found = dict(zip(misses, self.search(misses).tolist()))
+            if len(cache) + len(found) > self.cache_size:
+                cache.clear()
+            cache.update(found)
+            ids = [found[token] if term_id is None else term_id for token, term_id in zip(tokens, ids)]
+        return np.array(ids, dtype=np.int64)
+
+    def search(self, tokens):
+        """
+        Term id of every token by binary search over the term arrays, bypassing the cache.
+
+        Args:
+            tokens (list of str): Tokens, e.g. a whole vocabulary.
+
+        Returns:
+            np.ndarray: int64 ids aligned with ``tokens``, -1 for unknown tokens.
+        """
+        if not tokens or not len(self):
+            return np.full(len(tokens), -1, dtype=np.int64)
+        encoded = [token.encode('utf-8') for token in tokens]
+        # Distinct tokens in sorted order, so searchsorted walks the prefixes forwards
+        distinct = sorted(set(encoded))
+        keys = np.array(distinct, dtype=self.prefixes.dtype)
+        lengths = np.fromiter(map(len, distinct), dtype=np.int64, count=len(distinct))
+
+        # Among terms sharing a prefix the shortest sorts first, so a token that fits in the
+        # prefix matches only the first of them, and only if the lengths agree
+        found = np.searchsorted(self.prefixes, keys)
+        first = np.minimum(found, len(self) - 1)
+        prefixed = (found < len(self)) & (self.prefixes[first] == keys)
+        same_length = self.offsets[first + 1] - self.offsets[first] == lengths
+        distinct_ids = np.where(prefixed & same_length, found, -1)
+
+        # Longer tokens are compared byte for byte with the first term sharing their prefix,
+        # all at once; only a mismatch with more terms behind it needs a binary search
+        long_tokens = np.flatnonzero(prefixed & (lengths > LEXICON_PREFIX_BYTES))
+        if len(long_tokens):
+            compared = long_tokens[same_length[long_tokens]]
+            compared_lengths = lengths[compared]
+            starts = np.cumsum(compared_lengths) - compared_lengths
+            token_bytes = np.frombuffer(b''.join(distinct[i] for i in compared.tolist()), dtype=np.uint8)
+            within = np.arange(len(token_bytes)) - np.repeat(starts, compared_lengths)
+            differ = self.buffer[np.repeat(self.offsets[found[compared]], compared_lengths) + within] != token_bytes
+            equal = np.zeros(len(distinct), dtype=bool)
+            equal[compared] = np.add.reduceat(differ, starts) == 0 if len(compared) else []
+            mismatched = long_tokens[~equal[long_tokens]]
+            distinct_ids[mismatched] = -1
+            stops = np.searchsorted(self.prefixes, keys[mismatched], side='right')
+            for i, stop in zip(mismatched.tolist(), stops.tolist()):
+                if stop - found[i] > 1:
+                    distinct_ids[i] = self._find(distinct[i], int(found[i]) + 1, stop)
+
+        position = {token: i for i, token in enumerate(distinct)}
+        return distinct_ids[np.fromiter((position[token] for token in encoded), dtype=np.int64, count=len(encoded))]
+
+    def _find(self, token, start, stop):
+        """Binary search for the exact bytes of ``token`` among the terms [start, stop) sharing its prefix."""
+        data = memoryview(self.buffer)
+        while start < stop:
+            mid = (start + stop) // 2
+            term = data[self.offsets[mid]:self.offsets[mid + 1]].tobytes()
+            if term == token:
+                return mid
+            if term < token:
+                start = mid + 1
+            else:
+                stop = mid
+        return -1
+
+
+class DocumentStore:
+    """
+    Documents stored column-wise: per field one UTF-8 buffer plus an offsets array, instead
+    of one dict (and one str object per field) per document.
+
+    Indexing returns a ``DocumentView`` that decodes fields on access, or None for deleted
+    documents; a slice returns a list of them, as slicing a list of dicts would. Non-string field values are kept in an object array. Documents appended or
+    replaced after construction live in a small overlay as plain dicts until the store is
+    rebuilt with ``DocumentStore(store)``.
+    """
+
+    def __init__(self, docs=()):
+        docs = list(docs)
+        self._n = len(docs)
+        self._live = np.array([doc is not None for doc in docs], dtype=bool)
+        self._overlay = {}
+
+        fields = {}
+        for doc in docs:
+            if doc is not None:
+                fields.update(dict.fromkeys(doc))
+        self.fields = list(fields)
+
+        # field -> (buffer, offsets, present) for text columns, or (None, values, present)
+        self._columns = {}
+        for field in self.fields:
+            values = [doc.get(field) if doc is not None else None for doc in docs]
+            present = np.array([doc is not None and field in doc for doc in docs], dtype=bool)
+            if all(isinstance(v, str) for v, p in zip(values, present) if p):
+                encoded = [v.encode('utf-8') if p else b'' for v, p in zip(values, present)]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(b) for b in encoded], out=offsets[1:])
+                column = (b''.join(encoded), offsets, None if present.all() else present)
+            else:
+                objects = np.empty(len(values), dtype=object)
+                objects[:] = values
+                column = (None, objects, None if present.all() else present)
+            self._columns[field] = column
+
+    @classmethod
+    def concat(cls, stores):
+        """Joins stores (without pending overlay changes) end to end, without decoding text columns."""
+        store = cls()
+        stores = list(stores)
+        store._n = sum(part._n for part in stores)
+        store._live = np.concatenate([part._live for part in stores]) if stores else np.empty(0, dtype=bool)
+
+        fields = {}
+        for part in stores:
+            fields.update(dict.fromkeys(part.fields))
+        store.fields = list(fields)
+
+        for field in store.fields:
+            columns = [part._columns.get(field) for part in stores]
+            present = np.concatenate([
+                np.zeros(part._n, dtype=bool) if column is None
+                else np.ones(part._n, dtype=bool) if column[2] is None else column[2]
+                for part, column in zip(stores, columns)
+            ])
+            present = None if present.all() else present
+
+            if all(column is None or column[0] is not None for column in columns):
+                buffers, offsets, base = [], [np.zeros(1, dtype=np.int64)], 0
+                for part, column in zip(stores, columns):
+                    if column is None:
+                        offsets.append(np.full(part._n, base, dtype=np.int64))
+                        continue
+                    buffers.append(column[0])
+                    offsets.append(column[1][1:] + base)
+                    base += len(column[0])
+                store._columns[field] = (b''.join(buffers), np.concatenate(offsets), present)
+            else:
+                objects = np.empty(store._n, dtype=object)
+                start = 0
+                for part, column in zip(stores, columns):
+                    for i in range(part._n):
+                        objects[start + i] = part.value(i, field) if part.has(i, field) else None
+                    start += part._n
+                store._columns[field] = (None, objects, present)
+        return store
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        if i in self._overlay:
+            return self._overlay[i]
+        if not self._live[i]:
+            return None
+        return DocumentView(self, i)
+
+    def __setitem__(self, i, doc):
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        self._overlay[i] = doc
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def append(self, doc):
+        self._overlay[self._n] = doc
+        self._n += 1
+
+    def has(self, i, field):
+        """Whether the stored (non-overlay) document ``i`` has ``field``."""
+        column = self._columns.get(field)
+        return column is not None and (column[2] is None or column[2][i])
+
+    def value(self, i, field):
+        """Decodes ``field`` of stored document ``i``."""
+        if not self.has(i, field):
+            raise KeyError(field)
+        buffer, offsets, _ = self._columns[field]
+        if buffer is None:
+            return offsets[i]
+        return buffer[offsets[i]:offsets[i + 1]].decode('utf-8')
+
+    def column(self, field, default=None):
+        """All values of ``field`` as a list, ``default`` where missing or deleted."""
+        values = []
+        for i in range(self._n):
+            if i in self._overlay:
+                doc = self._overlay[i]
+                values.append(default if doc is None else doc.get(field, default))
+            elif self._live[i] and self.has(i, field):
+                values.append(self.value(i, field))
+            else:
+                values.append(default)
+        return values
+
+    def views(self, top_indices, output_ids=False, top_scores=None):
+        """Lazy result documents for ``format_results``."""
+        results = []
+        for rank, i in enumerate(top_indices):
+            extra = {}
+            if output_ids:
+                extra['_id'] = int(i)
+            if top_scores is not None:
+                extra['_score'] = float(top_scores[rank])
+            doc = self[int(i)]
+            if isinstance(doc, DocumentView):
+                results.append(DocumentView(self, doc._pos, extra) if extra else doc)
+            else:
+                results.append({**doc, **extra} if extra else doc)
+        return results
+
+    def to_list(self):
+        """Materializes every document as a dict (None for deleted ones)."""
+        return [dict(doc) if doc is not None else None for doc in self]
+
+
+class DocumentView(Mapping):
+    """Read-only mapping over one document of a ``DocumentStore``; fields are decoded on access."""
+
+    __slots__ = ('_store', '_pos', '_extra')
+
+    def __init__(self, store, pos, extra=None):
+        self._store = store
+        self._pos = pos
+        self._extra = extra or {}
+
+    def __getitem__(self, key):
+        if key in self._extra:
+            return self._extra[key]
+        return self._store.value(self._pos, key)
+
+    def __iter__(self):
+        for field in self._store.fields:
+            if self._store.has(self._pos, field):
+                yield field
+        yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # Pickles (e.g. across processes) as a plain dict, not the whole store
+        return (dict, (dict(self),))
+
+
+def _chunked(docs, chunk_size):
+    """Yields lists of up to ``chunk_size`` documents."""
+    chunk = []
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _texts(docs, field):
+    """The ``field`` text of every document in a list or ``DocumentStore``, '' where missing."""
+    if isinstance(docs, DocumentStore):
+        return docs.column(field, default='')
+    return [doc.get(field, '') for doc in docs]
+
+
+def _resolve_n_jobs(n_jobs):
+    """Worker processes for ``n_jobs``: None means 1, negative values count back from the CPU count."""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+# Analyzer and binary flag of a _CountPool worker process
+_worker_counter = None
+
+
+def _init_counter(vectorizer_params):
+    global _worker_counter
+    _worker_counter = _counter(vectorizer_params)
+
+
+def _counter(vectorizer_params):
+    vectorizer = TfidfVectorizer(**vectorizer_params)
+    return vectorizer.build_analyzer(), vectorizer.binary
+
+
+def _count_in_worker(texts):
+    analyzer, binary = _worker_counter
+    df, tf = {}, {}
+    return _count_terms(analyzer, binary, texts, df, tf), df, tf
+
+
+class _CountPool:
+    """
+    Counts the terms of every (field, chunk) batch of texts with ``_count_terms``, in a process
+    pool when ``n_jobs`` > 1 and in this process otherwise, and merges the chunk frequencies
+    into per-field ``df`` and ``tf`` dicts as results arrive.
+
+    The pool only starts once ``min_docs`` documents per field have been counted here, so
+    small inputs never pay for it. At most two batches per worker are in flight, so a
+    streaming producer never runs far ahead of the counting. ``results`` waits for the
+    remaining batches.
+    """
+
+    def __init__(self, vectorizer_params, fields, n_jobs=None, min_docs=PARALLEL_FIT_MIN_DOCS):
+        self.vectorizer_params = vectorizer_params
+        self.n_jobs = _resolve_n_jobs(n_jobs)
+        self.min_docs = min_docs
+        self.counts = {field: [] for field in fields}
+        self.df = {field: {} for field in fields}
+        self.tf = {field: {} for field in fields}
+        self._counted = 0
+        self._pending = deque()
+        self._executor = None
+
+    def __enter__(self):
+        self._analyzer, self._binary = _counter(self.vectorizer_params)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, field, texts):
+        """Counts ``texts`` as the next chunk of ``field``."""
+        self.counts[field].append(None)
+        chunk = len(self.counts[field]) - 1
+        if self._executor is None and self.n_jobs > 1 and self._counted >= self.min_docs * len(self.counts):
+            self._executor = ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_counter,
+                                                 initargs=(self.vectorizer_params,))
+        if self._executor is None:
+            self.counts[field][chunk] = _count_terms(self._analyzer, self._binary, texts, self.df[field], self.tf[field])
+            self._counted += len(texts)
+            return
+        self._pending.append((field, chunk, self._executor.submit(_count_in_worker, texts)))
+        while len(self._pending) > 2 * self.n_jobs:
+            self._collect(*self._pending.popleft())
+
+    def _collect(self, field, chunk, future):
+        self.counts[field][chunk], chunk_df, chunk_tf = future.result()
+        df, tf = self.df[field], self.tf[field]
+        for term, d in chunk_df.items():
+            df[term] = df.get(term, 0) + d
+        for term, t in chunk_tf.items():
+            tf[term] = tf.get(term, 0) + t
+
+    def results(self):
+        """
+        Returns:
+            tuple: (counts, df, tf) per field, counts holding every chunk's ``_count_terms`` output in order.
+        """
+        while self._pending:
+            self._collect(*self._pending.popleft())
+        return self.counts, self.df, self.tf
+
+
+def _count_terms(analyzer, binary, texts, df, tf):
+    """
+    Counts the terms of ``texts`` and adds their document and total frequencies to ``df`` and ``tf``.
+
+    Terms are numbered and added in order of first occurrence, the order in which
+    CountVectorizer lays out each row before normalization, so ``df`` keeps the
+    collection-wide first-occurrence order across chunks. ``fit_transform`` numbers them
+    alphabetically but keeps that order within each row, so the first occurrences are read
+    back from the matrix.
+
+    Returns:
+        tuple or None: (terms, counts) with counts over the chunk-local ``terms``, or None if
+                       the texts contain no terms.
+    """
+    # Counts are exact in int32 and half the size of the float64 weights they become
+    vectorizer = CountVectorizer(analyzer=analyzer, binary=binary, dtype=np.int32)
+    try:
+        matrix = vectorizer.fit_transform(texts)
+    except ValueError:
+        return None
+    _, first = np.unique(matrix.indices, return_index=True)
+    order = np.argsort(first)
+    terms = vectorizer.get_feature_names_out()[order].tolist()
+    renumber = np.empty(len(order), dtype=matrix.indices.dtype)
+    renumber[order] = np.arange(len(order), dtype=matrix.indices.dtype)
+    matrix.indices = renumber[matrix.indices]
+    doc_freq = np.bincount(matrix.indices, minlength=len(terms))
+    term_freq = np.bincount(matrix.indices, weights=matrix.data, minlength=len(terms)).astype(np.int64)
+    for term, d, t in zip(terms, doc_freq.tolist(), term_freq.tolist()):
+        df[term] = df.get(term, 0) + d
+        tf[term] = tf.get(term, 0) + t
+    return terms, matrix
+
+
+def _remap_counts(chunk_counts, vocabulary, rank, n_rows):
+    """
+    Re-indexes chunk-local counts onto ``vocabulary``, dropping pruned terms, as transform would count them.
+
+    Each row keeps its terms in order of collection-wide first occurrence (``rank``), as
+    ``fit`` stores them, so the row norms are summed in the same order and weights match bit for bit.
+    """
+    if chunk_counts is None:
+        return sp.csr_matrix((n_rows, len(vocabulary)))
+    terms, matrix = chunk_counts
+    mapping = np.array([vocabulary.get(term, -1) for term in terms], dtype=np.int64)
+    ranks = np.array([rank[term] for term in terms], dtype=np.int64)
+    columns = mapping[matrix.indices]
+    rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+    order = np.lexsort((ranks[matrix.indices], rows))
+    order = order[columns[order] >= 0]
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[order], minlength=n_rows), out=indptr[1:])
+    return sp.csr_matrix((matrix.data[order].astype(np.float64), columns[order], indptr), shape=(n_rows, len(vocabulary)))
+
+
+def collapse_results(docs, collapse_field, collapse_size=1, key=None):
+    """
+    Keeps the first ``collapse_size`` of each ``collapse_field`` value in an already ranked
+    list, e.g. when merging rankings that were collapsed separately.
+
+    Args:
+        docs (iterable): Ranked documents, or items holding them.
+        collapse_field (str): Field whose values group the documents.
+        collapse_size (int): Documents kept per value.
+        key (callable): Returns the document of an item; None if the items are documents.
+    """
+    counts = {}
+    results = []
+    for doc in docs:
+        value = (key(doc) if key else doc).get(collapse_field)
+        if counts.get(value, 0) < collapse_size:
+            counts[value] = counts.get(value, 0) + 1
+            results.append(doc)
+    return results
+
+
+def build_keyword_index(keyword_df):
+    """
+    Builds the posting lists of a keyword DataFrame.
+
+    Args:
+        keyword_df (pd.DataFrame): One column per keyword field, indexed by document position.
+
+    Returns:
+        dict: Per column, a dict mapping each value to the sorted positions holding it.
+    """
+    positions = keyword_df.index.to_numpy()
+    return {
+        field: {
+            value: positions[rows]
+            for value, rows in keyword_df.groupby(field, sort=False, dropna=False).indices.items()
+        }
+        for field in keyword_df.columns
+    }
+
+
+def resolve_filter(keyword_index, n_docs, filter_dict):
+    """
+    Resolves keyword filters to the sorted positions that pass all of them.
+
+    Args:
+        keyword_index (dict): Posting lists as built by ``build_keyword_index``.
+        n_docs (int): Number of document positions, the universe for NOT-IN filters.
+        filter_dict (dict): Filters as accepted by ``Index.search``; fields missing
+                            from ``keyword_index`` are ignored.
+
+    Returns:
+        np.ndarray or None: Candidate positions, or None when no filter applies.
+    """
+    candidates = None
+    for field, value in filter_dict.items():
+        values, negate = _filter_values(value)
+        if field not in keyword_index:
+            continue
+        postings = keyword_index[field]
+
+        rows = [postings[v] for v in values if v in postings]
+        rows = np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.intp)
+        if negate:
+            rows = np.setdiff1d(np.arange(n_docs), rows, assume_unique=True)
+
+        candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+    return candidates
+
+
+def _bm25_weights(counts, k1, b, stats=None):
+    """
+    Converts a document-term count matrix into BM25 term weights.
+
+    Args:
+        counts (scipy.sparse.csr_matrix): Raw term counts, one row per document.
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+        stats (dict): Fitted {'idf', 'avgdl'} to reuse; computed from ``counts`` if None.
+
+    Returns:
+        tuple: (weights, stats) with weights in the same sparsity pattern as ``counts``.
+    """
+    counts = sp.csr_matrix(counts, dtype=np.float64)
+    n_docs = counts.shape[0]
+    doc_len = np.asarray(counts.sum(axis=1)).ravel()
+
+    if stats is None:
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        stats = {'idf': idf, 'avgdl': avgdl or 1.0}
+
+    length_norm = k1 * (1 - b + b * doc_len / stats['avgdl'])
+    tf = counts.data
+    rows = np.repeat(np.arange(n_docs), np.diff(counts.indptr))
+    weights = stats['idf'][counts.indices] * tf * (k1 + 1) / (tf + length_norm[rows])
+    return sp.csr_matrix((weights, counts.indices, counts.indptr), shape=counts.shape), stats
+
+
+def _filter_values(value):
+    """
+    The values one filter_dict entry matches, and whether it excludes them.
+
+    A scalar matches itself, a list/tuple/set any of its items, and {'$in': ...} or
+    {'$nin': ...} any (or none) of the operand's items; a scalar operand counts as one item,
+    so {'$in': 'drama'} matches 'drama' rather than its characters.
+
+    Returns:
+        tuple: (values, negate)
+
+    Raises:
+        ValueError: If a dict value holds anything but a single '$in' or '$nin' operator.
+    """
+    negate = False
+    if isinstance(value, dict):
+        if len(value) != 1 or next(iter(value)) not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator in {value!r}: expected one of {FILTER_OPERATORS}")
+        (op, value), = value.items()
+        if isinstance(value, dict):
+            raise ValueError(f"Operand of {op!r} must be a value or a list of values, got {value!r}")
+        negate = op == '$nin'
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return value, negate
+    return [value], negate
+
+
+def _filter_key(filter_dict):
+    """Hashable, order-independent key for a filter_dict."""
+    items = []
+    for field, value in filter_dict.items():
+        values, negate = _filter_values(value)
+        items.append((field, frozenset(values), negate))
+    return frozenset(items)
+
+
+def top_k(scores, k):
+    """
+    Selects the indices of the ``k`` highest positive scores, best first.
+
+    Uses a linear-time partial selection instead of sorting every candidate; only the
+    selected block is sorted. Ties are broken by ascending index, so results do not
+    depend on the partitioning order.
+
+    Args:
+        scores (np.ndarray): One score per document.
+        k (int): Number of indices to return.
+
+    Returns:
+        np.ndarray: Up to ``k`` document indices, ordered by descending score.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    threshold = 0.0
+    if len(scores) > k:
+        # k-th largest score; everything tied with it stays in so ties resolve by index
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        threshold = max(kth, 0.0)
+
+    if threshold > 0:
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.flatnonzero(scores > 0)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def top_k_collapsed(scores, groups, k, group_size=1):
+    """
+    Like ``top_k``, but keeps at most ``group_size`` indices per value of ``groups``.
+
+    The best ``k * group_size`` scores are selected with ``top_k`` and ranked within their
+    groups in one vectorized pass; the pool only grows when collapsing left fewer than
+    ``k`` hits, so the full score vector is never sorted. Because the pool is a prefix of
+    the global ranking, the result equals collapsing the fully sorted ranking.
+
+    Args:
+        scores (np.ndarray): One score per document.
+        groups (np.ndarray): Integer group code per document, aligned with ``scores``.
+        k (int): Number of indices to return.
+        group_size (int): Indices kept per group.
+
+    Returns:
+        np.ndarray: Up to ``k`` document indices, ordered by descending score.
+    """
+    pool = k * max(group_size, 1)
+    while True:
+        top = top_k(scores, pool)
+        top_groups = groups[top]
+        # Rank of every hit within its group: a stable sort by group keeps the score order
+        order = np.argsort(top_groups, kind='stable')
+        sorted_groups = top_groups[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        ranks = np.empty(len(top), dtype=np.intp)
+        ranks[order] = np.arange(len(top)) - np.repeat(starts, np.diff(np.r_[starts, len(top)]))
+        kept = top[ranks < group_size]
+        # Fewer than pool hits means every positive score was considered
+        if len(kept) >= k or len(top) < pool:
+            return kept[:k]
+        pool *= 4
@@ -1,5 +1,7 @@
 import os
 import json
+import random
+import asyncio
 from time import time
 
 import logging
@@ -12,38 +14,90 @@ logger = logging.getLogger(__name__)
 # logger.setLevel(logging.INFO)
 
 # ---------------- Config ----------------
-from config import SETTINGS
+from config import SETTINGS, SEARCH_BOOST, SEARCH_FILTER
 
 import ingest
+import hybrid
+import chunking
+from answer_cache import SemanticAnswerCache
 index = ingest.load_index()
+# Dense retrieval replaces the lexical index when SEARCH_ENGINE=dense, or is fused with it when hybrid
+dense_index = ingest.load_dense_index() if SETTINGS.SEARCH_ENGINE in ('dense', 'hybrid') else None
+hybrid_index = None
+if SETTINGS.SEARCH_ENGINE == 'hybrid':
+    hybrid_index = hybrid.HybridRetriever(
+        {'lexical': index, 'dense': dense_index},
+        weights={'lexical': SETTINGS.HYBRID_LEXICAL_WEIGHT, 'dense': SETTINGS.HYBRID_DENSE_WEIGHT},
+        method=SETTINGS.HYBRID_FUSION,
+        rrf_k=SETTINGS.HYBRID_RRF_K,
+        pool_size=SETTINGS.HYBRID_POOL_SIZE,
+        id_field='passage_id',  # fuse passages; they are collapsed to documents afterwards
+    )
+
+
+# Paraphrases that retrieve the same documents reuse an earlier answer instead of calling the model;
+# questions are compared as TF-IDF vectors of the index's question field
+answer_cache = None
+if SETTINGS.ANSWER_CACHE_SIZE:
+    answer_cache = SemanticAnswerCache(
+        vectorize=lambda questions: index.vectorize(questions, 'question'),
+        version=lambda: index.generation,  # any change to the documents drops the cached answers
+    )
 
 
 # ---------------- OpenAI ----------------
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 if SETTINGS.LLM_PROVIDER in ['OLLAMA', 'HF']:
-    client = OpenAI(
-        base_url=SETTINGS.BASE_URL,  # Ollama API endpoint
-        api_key=SETTINGS.API_KEY,  # dummy key (ignored by Ollama)
-    )
+    CLIENT_PARAMS = {
+        "base_url": SETTINGS.BASE_URL,  # Ollama API endpoint
+        "api_key": SETTINGS.API_KEY,  # dummy key (ignored by Ollama)
+    }
 else:
-    client = OpenAI(api_key=SETTINGS.API_KEY)
+    CLIENT_PARAMS = {"api_key": SETTINGS.API_KEY}
+client = OpenAI(**CLIENT_PARAMS)
+async_client = AsyncOpenAI(**CLIENT_PARAMS)  # used by the asyncio service (app_async.py)
 logger.info(f"LLM_PROVIDER: {SETTINGS.LLM_PROVIDER}")
 
 
-def search(query):
-    boost = {'intent': 0.022894885883346205,
-        'question': 5.120311766582832,
-        'response': 5.035355456071596,
-        'category': 9.847893877170346}
+# Passages retrieved per requested document, so that collapsing still leaves enough documents
+PASSAGES_PER_RESULT = 3
+# At most SEARCH_COLLAPSE_SIZE passages per intent (or other field), selected inside the index
+SEARCH_COLLAPSE = {
+    'collapse_field': SETTINGS.SEARCH_COLLAPSE_FIELD or None,
+    'collapse_size': SETTINGS.SEARCH_COLLAPSE_SIZE,
+}
 
-    results = index.search(
+
+def retriever():
+    """The index selected by SEARCH_ENGINE; all share the search/search_batch interface."""
+    if hybrid_index is not None:
+        return hybrid_index
+    return dense_index if dense_index is not None else index
+
+
+def search(query):
+    """Top documents for ``query``, each holding only its passages that matched."""
+    passages = retriever().search(
         query=query,
-        filter_dict={'category': 'CONTENT'},
-        boost_dict=boost,
-        num_results=5
+        filter_dict=SEARCH_FILTER,
+        boost_dict=SEARCH_BOOST,
+        num_results=SETTINGS.SEARCH_NUM_RESULTS * PASSAGES_PER_RESULT,
+        **SEARCH_COLLAPSE,
     )
-    return results
+    return chunking.collapse_passages(passages, SETTINGS.SEARCH_NUM_RESULTS)
+
+
+def search_batch(queries, num_results=SETTINGS.SEARCH_NUM_RESULTS):
+    """Run ``search`` for many queries with one batched scoring pass."""
+    results = retriever().search_batch(
+        queries=queries,
+        filter_dict=SEARCH_FILTER,
+        boost_dict=SEARCH_BOOST,
+        num_results=num_results * PASSAGES_PER_RESULT,
+        **SEARCH_COLLAPSE,
+    )
+    return [chunking.collapse_passages(passages, num_results) for passages in results]
 
 
 PROMPT_TEMPLATE = """
@@ -67,7 +121,25 @@ CONTEXT: '''
 {context}
 '''
 """.strip()
+def cached_answer(query, search_results):
+    """The cached answer of a paraphrase of ``query`` that retrieved the same documents, or None."""
+    if answer_cache is None:
+        return None
+    hit = answer_cache.lookup(query, [doc['id'] for doc in search_results])
+    if hit is None:
+        return None
+    answer, similarity = hit
+    logger.info(f"Answer cache hit (similarity {similarity:.3f}, hit rate {answer_cache.info()['hit_rate']:.1%})")
+    return answer
+
+
+def remember_answer(query, search_results, answer):
+    if answer_cache is not None:
+        answer_cache.store(query, [doc['id'] for doc in search_results], answer)
+
+
 def build_prompt(query, search_results):
+    # Search results are collapsed passages: 'response' holds only the parts that matched
     context = ""
     for doc in search_results:
         context += (
@@ -102,6 +174,43 @@ def llm(prompt):
     return answer, token_stats
 
 
+def llm_stream(prompt):
+    """
+    Like ``llm``, but yields the answer while it is generated: (text, None) for every
+    content delta, then ("", token_stats) when the stream ends. Servers that do not report
+    usage on streams get the number of content deltas as completion_tokens.
+    """
+    logger.info(f"MODEL_CHAT: {SETTINGS.MODEL_CHAT}")
+    stream = client.chat.completions.create(
+        model=SETTINGS.MODEL_CHAT,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+
+    usage = None
+    n_deltas = 0
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            n_deltas += 1
+            yield chunk.choices[0].delta.content, None
+
+    yield "", stream_token_stats(usage, n_deltas)
+
+
+def stream_token_stats(usage, n_deltas):
+    """Token stats of a finished stream; without reported usage, one token per content delta."""
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": n_deltas, "total_tokens": n_deltas}
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+
 EVAL_PROMPT_TEMPLATE = """
 You are an expert evaluator for a Retrieval-Augmented Generation (RAG) system.
 Your task is to assess the **relevance** of the generated answer to the given question.
@@ -131,30 +240,230 @@ Output format:
 def evaluate_relevance(question, answer):
     prompt = EVAL_PROMPT_TEMPLATE.format(question=question, answer=answer)
     evaluation, tokens = llm(prompt) #, model="gpt-4o-mini")
+    return parse_evaluation(evaluation), tokens
+
 
+def parse_evaluation(evaluation):
     try:
-        json_eval = json.loads(evaluation)
-        return json_eval, tokens
+        return json.loads(evaluation)
     except json.JSONDecodeError:
-        result = {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
-        return result, tokens
+        return {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
+
+
+RELEVANCE_LABELS = ("NON_RELEVANT", "PARTLY_RELEVANT", "RELEVANT")
+
+BATCH_EVAL_PROMPT_TEMPLATE = """
+You are an expert evaluator for a Retrieval-Augmented Generation (RAG) system.
+Your task is to assess the **relevance** of each generated answer to its question.
+
+Evaluation Guidelines:
+1. Judge only on relevance between each QUESTION and its GENERATED ANSWER.
+2. Ignore style, grammar, tone, and fluency. They are not part of this evaluation.
+3. Choose exactly one of the following labels for each item:
+   - "NON_RELEVANT": The answer does not address the question at all.
+   - "PARTLY_RELEVANT": The answer addresses the question partially OR mixes relevant and irrelevant content.
+   - "RELEVANT": The answer fully and directly answers the question with no irrelevant content.
+4. Provide a short, factual explanation (maximum 2 sentences) for each item.
+5. Judge every item independently of the others, and judge all {count} items.
+6. The output must be strictly valid JSON, without code fences, without extra text, and without additional commentary.
+
+Evaluation Data:
+{items}
+
+Output format (a JSON array with one object per item, in item order):
+[
+  {{
+    "Id": <item number>,
+    "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+    "Explanation": "[Your brief explanation here]"
+  }}
+]
+""".strip()
+BATCH_EVAL_ITEM_TEMPLATE = """
+Item {id}:
+- Question: {question}
+- Generated Answer: '''
+{answer}
+'''
+""".strip()
+
+
+def parse_batch_evaluation(evaluation, n_items):
+    """
+    Verdicts of a batch judge response, by item.
+
+    Returns:
+        list: {"Relevance", "Explanation"} per item, None for items missing from the
+              response or with an invalid label.
+    """
+    verdicts = [None] * n_items
+    # Tolerate code fences or chatter around the array
+    start, stop = evaluation.find("["), evaluation.rfind("]")
+    try:
+        items = json.loads(evaluation[start:stop + 1]) if 0 <= start < stop else None
+    except json.JSONDecodeError:
+        items = None
+    if not isinstance(items, list):
+        return verdicts
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_id = item.get("Id")
+        if (isinstance(item_id, int) and 1 <= item_id <= n_items and verdicts[item_id - 1] is None
+                and item.get("Relevance") in RELEVANCE_LABELS):
+            verdicts[item_id - 1] = {
+                "Relevance": item["Relevance"],
+                "Explanation": str(item.get("Explanation", "")),
+            }
+    return verdicts
+
+
+def split_token_stats(token_stats, n):
+    """Shares of one call's token counts for ``n`` items, summing to the call's counts."""
+    shares = [{} for _ in range(n)]
+    for key, value in token_stats.items():
+        quotient, remainder = divmod(value, n)
+        for i, share in enumerate(shares):
+            share[key] = quotient + (i < remainder)
+    return shares
+
+
+def evaluate_relevance_batch(pairs):
+    """
+    Judge many (question, answer) pairs with one LLM call.
+
+    The pairs are numbered in a single prompt, so the instructions are paid for once per
+    batch instead of once per answer. Pairs whose verdict is missing or malformed in the
+    response are judged again one by one with ``evaluate_relevance``.
+
+    Args:
+        pairs (list of tuple): (question, answer) pairs.
+
+    Returns:
+        list of tuple: (relevance, token_stats) per pair, as ``evaluate_relevance`` returns
+                       them; token_stats is the pair's share of the batch call plus its fallback call.
+    """
+    pairs = list(pairs)
+    if len(pairs) <= 1:
+        return [evaluate_relevance(question, answer) for question, answer in pairs]
+
+    items = "\n\n".join(
+        BATCH_EVAL_ITEM_TEMPLATE.format(id=i, question=question, answer=answer)
+        for i, (question, answer) in enumerate(pairs, start=1)
+    )
+    prompt = BATCH_EVAL_PROMPT_TEMPLATE.format(count=len(pairs), items=items)
+    evaluation, tokens = llm(prompt)
+    verdicts = parse_batch_evaluation(evaluation, len(pairs))
+
+    results = []
+    for (question, answer), verdict, share in zip(pairs, verdicts, split_token_stats(tokens, len(pairs))):
+        if verdict is None:
+            verdict, own_tokens = evaluate_relevance(question, answer)
+            share = {key: share[key] + own_tokens[key] for key in share}
+        results.append((verdict, share))
+
+    n_failed = verdicts.count(None)
+    if n_failed:
+        logger.warning("Batch evaluation: %d of %d verdicts judged again one by one", n_failed, len(pairs))
+    return results
+
 
+# Relevance of answers waiting for a background judge, and of answers left out of the sample
+RELEVANCE_PENDING = "PENDING"
+RELEVANCE_SKIPPED = "SKIPPED"
+# Relevance of answers claimed by a judge, and of answers it gave up on (see judge.py)
+RELEVANCE_JUDGING = "JUDGING"
+RELEVANCE_FAILED = "FAILED"
+NO_TOKENS = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-def rag(query):
 
+def deferred_relevance():
+    """
+    Relevance of an answer that is not judged inline: PENDING for the background judge
+    (see judge.py) for a sample of EVAL_SAMPLE_RATE answers, SKIPPED for the rest.
+    """
+    if random.random() < SETTINGS.EVAL_SAMPLE_RATE:
+        return {"Relevance": RELEVANCE_PENDING, "Explanation": "Awaiting evaluation"}, NO_TOKENS
+    return {"Relevance": RELEVANCE_SKIPPED, "Explanation": "Not sampled for evaluation"}, NO_TOKENS
+
+
+def rag(query, evaluate=not SETTINGS.EVAL_ASYNC):
+    """
+    Answer ``query`` from the retrieved documents.
+
+    Args:
+        query (str): The user question.
+        evaluate (bool): Judge the answer before returning. Otherwise the answer is returned
+                         right after generation and its relevance is left PENDING (or SKIPPED)
+                         for the background judge. Defaults to ``not EVAL_ASYNC``.
+
+    A paraphrase of an earlier question that retrieves the same documents gets the earlier
+    answer from ``answer_cache`` without calling the model ('cached' is True, no tokens).
+    """
     t0 = time()
 
     search_results = search(query)
-    prompt = build_prompt(query, search_results)
-    answer, token_stats = llm(prompt)
-
-    relevance, rel_token_stats = evaluate_relevance(query, answer)
+    answer = cached_answer(query, search_results)
+    cached = answer is not None
+    token_stats = NO_TOKENS
+    if not cached:
+        prompt = build_prompt(query, search_results)
+        answer, token_stats = llm(prompt)
+        remember_answer(query, search_results, answer)
+
+    relevance, rel_token_stats = deferred_relevance()
+    if evaluate and relevance["Relevance"] == RELEVANCE_PENDING:
+        relevance, rel_token_stats = evaluate_relevance(query, answer)
 
     t1 = time()
     took = t1 - t0
 
-    answer_data = {
+    return answer_record(answer, took, relevance, token_stats, rel_token_stats, cached=cached)
+
+
+def rag_stream(query):
+    """
+    Streaming variant of ``rag``: yields ("token", text) for every piece of the answer as
+    the model produces it, then ("done", answer_data) with the fields ``rag`` returns plus
+    'first_token_time'. The answer is never judged inline; its relevance is left PENDING
+    (or SKIPPED) for the background judge.
+    """
+    t0 = time()
+
+    search_results = search(query)
+    answer = cached_answer(query, search_results)
+    cached = answer is not None
+    if not cached:
+        pieces = []
+        first_token_time = None
+        for text, token_stats in llm_stream(build_prompt(query, search_results)):
+            if text:
+                if first_token_time is None:
+                    first_token_time = time() - t0
+                pieces.append(text)
+                yield "token", text
+        answer = "".join(pieces)
+        remember_answer(query, search_results, answer)
+    else:
+        # A cached answer is sent whole, as one token event
+        token_stats = NO_TOKENS
+        first_token_time = time() - t0
+        yield "token", answer
+
+    relevance, rel_token_stats = deferred_relevance()
+    took = time() - t0
+
+    answer_data = answer_record(answer, took, relevance, token_stats, rel_token_stats, cached=cached)
+    answer_data["first_token_time"] = took if first_token_time is None else first_token_time
+    yield "done", answer_data
+
+
+def answer_record(answer, took, relevance, token_stats, rel_token_stats, cached=False):
+    """The answer_data dict stored by db.save_conversation; 'cached' marks answers from the answer cache."""
+    return {
         "answer": answer,
+        "cached": cached,
         # "model_used": "gpt-4o-mini",
         "model_used": SETTINGS.MODEL_CHAT,
         "response_time": took,
@@ -170,4 +479,124 @@ def rag(query):
         "eval_total_tokens": rel_token_stats["total_tokens"],
     }
 
-    return answer_data
+
+# ---------------- Async ----------------
+# The same pipeline for an event loop: the LLM calls await AsyncOpenAI, and the CPU-bound
+# search and answer-cache calls (which vectorize the question) run on ``executor`` (a thread
+# pool) so they do not stall other requests.
+
+async def llm_async(prompt):
+    logger.info(f"MODEL_CHAT: {SETTINGS.MODEL_CHAT}")
+    response = await async_client.chat.completions.create(
+        model=SETTINGS.MODEL_CHAT,
+        messages=[{"role": "user", "content": prompt}],
+    )
+
+    answer = response.choices[0].message.content
+
+    token_stats = {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+        "total_tokens": response.usage.total_tokens,
+    }
+
+    return answer, token_stats
+
+
+async def llm_stream_async(prompt):
+    """Async ``llm_stream``."""
+    logger.info(f"MODEL_CHAT: {SETTINGS.MODEL_CHAT}")
+    stream = await async_client.chat.completions.create(
+        model=SETTINGS.MODEL_CHAT,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+
+    usage = None
+    n_deltas = 0
+    async for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            n_deltas += 1
+            yield chunk.choices[0].delta.content, None
+
+    yield "", stream_token_stats(usage, n_deltas)
+
+
+async def evaluate_relevance_async(question, answer):
+    prompt = EVAL_PROMPT_TEMPLATE.format(question=question, answer=answer)
+    evaluation, tokens = await llm_async(prompt)
+    return parse_evaluation(evaluation), tokens
+
+
+async def search_async(query, executor=None):
+    """``search`` on ``executor`` (None: the loop's default thread pool)."""
+    return await asyncio.get_running_loop().run_in_executor(executor, search, query)
+
+
+async def cached_answer_async(query, search_results, executor=None):
+    """``cached_answer`` on ``executor``."""
+    if answer_cache is None:
+        return None
+    return await asyncio.get_running_loop().run_in_executor(executor, cached_answer, query, search_results)
+
+
+async def remember_answer_async(query, search_results, answer, executor=None):
+    """``remember_answer`` on ``executor``."""
+    if answer_cache is not None:
+        await asyncio.get_running_loop().run_in_executor(executor, remember_answer, query, search_results, answer)
+
+
+async def rag_async(query, executor=None, evaluate=not SETTINGS.EVAL_ASYNC):
+    """Async ``rag``; ``executor`` runs the search and the answer cache."""
+    t0 = time()
+
+    search_results = await search_async(query, executor)
+    answer = await cached_answer_async(query, search_results, executor)
+    cached = answer is not None
+    token_stats = NO_TOKENS
+    if not cached:
+        prompt = build_prompt(query, search_results)
+        answer, token_stats = await llm_async(prompt)
+        await remember_answer_async(query, search_results, answer, executor)
+
+    relevance, rel_token_stats = deferred_relevance()
+    if evaluate and relevance["Relevance"] == RELEVANCE_PENDING:
+        relevance, rel_token_stats = await evaluate_relevance_async(query, answer)
+
+    took = time() - t0
+
+    return answer_record(answer, took, relevance, token_stats, rel_token_stats, cached=cached)
+
+
+async def rag_stream_async(query, executor=None):
+    """Async ``rag_stream``; ``executor`` runs the search and the answer cache."""
+    t0 = time()
+
+    search_results = await search_async(query, executor)
+    answer = await cached_answer_async(query, search_results, executor)
+    cached = answer is not None
+    if not cached:
+        pieces = []
+        first_token_time = None
+        async for text, token_stats in llm_stream_async(build_prompt(query, search_results)):
+            if text:
+                if first_token_time is None:
+                    first_token_time = time() - t0
+                pieces.append(text)
+                yield "token", text
+        answer = "".join(pieces)
+        await remember_answer_async(query, search_results, answer, executor)
+    else:
+        token_stats = NO_TOKENS
+        first_token_time = time() - t0
+        yield "token", answer
+
+    relevance, rel_token_stats = deferred_relevance()
+    took = time() - t0
+
+    answer_data = answer_record(answer, took, relevance, token_stats, rel_token_stats, cached=cached)
+    answer_data["first_token_time"] = took if first_token_time is None else first_token_time
+    yield "done", answer_data
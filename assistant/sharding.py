@@ -0,0 +1,298 @@
+import os
+import json
+import heapq
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import minsearch
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# On-disk format written by ShardedIndex.save; each shard is a minsearch snapshot
+SNAPSHOT_FORMAT = "minsearch-sharded"
+SNAPSHOT_VERSION = 1
+
+# The shard held by this worker process
+_shard = None
+
+
+def _open_shard(params, state=None, path=None):
+    """Builds a shard from globally fitted state, or memory-maps it from a snapshot."""
+    if path is not None:
+        return minsearch.Index.load(path, mmap=True)
+    # Shards only serve searches, so the global statistics are never refitted locally
+    index = minsearch.Index(**params, compaction_threshold=None)
+    if state is None:
+        return index.fit([])
+    return index.set_postings(**state)
+
+
+def _init_worker(params, state, path):
+    global _shard
+    _shard = _open_shard(params, state, path)
+
+
+def _in_worker(fn, *args):
+    return fn(_shard, *args)
+
+
+def _search(shard, queries, filter_dict, boost_dict, num_results, collapse_field, collapse_size):
+    return shard.search_batch(queries, filter_dict, boost_dict, num_results, output_ids=True, output_scores=True,
+                              collapse_field=collapse_field, collapse_size=collapse_size)
+
+
+def _save(shard, path):
+    shard.save(path)
+
+
+class ShardedIndex:
+    """
+    A ``minsearch.Index`` partitioned by document into shards searched in parallel.
+
+    The vocabulary and IDF (or BM25 statistics) are fitted once over all documents and
+    shared by every shard, so shard scores are directly comparable: each shard holds the
+    postings columns of its documents, returns its local top-k, and the per-shard lists
+    are merged by score. Rankings are identical to an unsharded ``Index``.
+
+    With ``processes=True`` every shard lives in its own worker process, so a search uses
+    one core per shard instead of a single core under the GIL; otherwise the shards are
+    searched from a thread pool in this process. ``load`` memory-maps the shard snapshots,
+    so workers on one host share the pages of the postings.
+
+    Attributes:
+        n_shards (int): Number of shards.
+        offsets (list): Position of each shard's first document; '_id' values are global positions.
+    """
+
+    def __init__(self, text_fields, keyword_fields, vectorizer_params=None, scoring='tfidf', bm25_params=None,
+                 n_shards=None, processes=True):
+        """
+        Initializes the ShardedIndex.
+
+        Args:
+            text_fields (list): List of text field names to index.
+            keyword_fields (list): List of keyword field names to index.
+            vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            scoring (str): 'tfidf' or 'bm25', as in ``minsearch.Index``.
+            bm25_params (dict): BM25 parameters, as in ``minsearch.Index``.
+            n_shards (int): Number of shards. Defaults to the number of CPUs.
+            processes (bool): If True, each shard is searched in its own worker process,
+                              otherwise in a thread of this process. Defaults to True.
+        """
+        self.params = {
+            'text_fields': text_fields,
+            'keyword_fields': keyword_fields,
+            'vectorizer_params': vectorizer_params,
+            'scoring': scoring,
+            'bm25_params': bm25_params,
+        }
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.processes = processes
+        self.offsets = []
+        self.n_docs = 0
+        self._shards = []
+        self._executors = []
+
+    def fit(self, docs):
+        """
+        Fits the global statistics over ``docs`` and gives each shard a contiguous slice.
+
+        Args:
+            docs (list of dict): List of documents to index.
+        """
+        docs = list(docs)
+        bounds = np.linspace(0, len(docs), self.n_shards + 1).astype(int)
+
+        states = [None] * self.n_shards
+        if docs:
+            lexicon, postings, field_offsets, field_stats = minsearch.Index(**self.params).fit_postings(docs)
+            states = [
+                {
+                    'lexicon': lexicon,
+                    'postings': postings[:, start:stop],
+                    'field_offsets': field_offsets,
+                    'field_stats': field_stats,
+                    'docs': docs[start:stop],
+                }
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+
+        self._start(bounds, [(state, None) for state in states])
+        logger.info("Sharded %d documents over %d shards", len(docs), self.n_shards)
+        return self
+
+    def _start(self, bounds, sources):
+        """Opens one shard per (state, path) source, replacing any running shards."""
+        self.close()
+        self.offsets = [int(start) for start in bounds[:-1]]
+        self.n_docs = int(bounds[-1])
+        if self.processes:
+            self._executors = [
+                ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(self.params, state, path))
+                for state, path in sources
+            ]
+        else:
+            self._shards = [_open_shard(self.params, state, path) for state, path in sources]
+            self._executors = [ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='shard')]
+
+    def _submit(self, shard_id, fn, *args):
+        """Runs ``fn(shard, *args)`` where the shard lives; returns a future."""
+        if self.processes:
+            return self._executors[shard_id].submit(_in_worker, fn, *args)
+        return self._executors[0].submit(fn, self._shards[shard_id], *args)
+
+    def close(self):
+        """Shuts down the shard workers."""
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._executors = []
+        self._shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, query, filter_dict=None, boost_dict=None, num_results=10, output_ids=False, output_scores=False,
+               collapse_field=None, collapse_size=1):
+        """
+        Searches all shards with the given query, filters, and boost parameters.
+
+        Args:
+            query (str): The search query string.
+            filter_dict (dict): Keyword filters, as in ``minsearch.Index.search``.
+            boost_dict (dict): Boost scores for text fields, as in ``minsearch.Index.search``.
+            num_results (int): The number of top results to return. Defaults to 10.
+            output_ids (bool): If True, adds the document's global position as '_id'.
+            output_scores (bool): If True, adds the document's relevance score as '_score'.
+            collapse_field (str): Field whose values group the results, as in ``minsearch.Index.search``.
+            collapse_size (int): Documents kept per group. Defaults to 1.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by relevance.
+        """
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_ids, output_scores,
+                                 collapse_field, collapse_size)[0]
+
+    def search_batch(self, queries, filter_dict=None, boost_dict=None, num_results=10, output_ids=False,
+                     output_scores=False, collapse_field=None, collapse_size=1):
+        """
+        Fans a batch of queries out to every shard and merges the per-shard top-k lists.
+
+        With ``collapse_field`` every shard collapses its own list and the merge collapses
+        again: a group's best documents across shards are among the per-shard survivors.
+
+        Returns:
+            list of list of dict: One ranked result list per query, in the order of ``queries``.
+        """
+        queries = list(queries)
+        if not self.n_docs:
+            return [[] for _ in queries]
+
+        futures = [
+            self._submit(shard_id, _search, queries, filter_dict or {}, boost_dict or {}, num_results,
+                         collapse_field, collapse_size)
+            for shard_id in range(len(self.offsets))
+        ]
+        per_shard = [future.result() for future in futures]
+
+        results = []
+        for q in range(len(queries)):
+            # Each shard list is sorted by (-score, position), so a k-way merge yields the
+            # global ranking with the same tie-breaking as minsearch.top_k
+            ranked = heapq.merge(
+                *(
+                    [(-doc['_score'], offset + doc['_id'], doc) for doc in shard_results[q]]
+                    for offset, shard_results in zip(self.offsets, per_shard)
+                ),
+                key=lambda item: item[:2],
+            )
+            if collapse_field:
+                ranked = minsearch.collapse_results(ranked, collapse_field, collapse_size, key=lambda item: item[2])
+            merged = []
+            for negative_score, doc_id, doc in ranked:
+                if len(merged) == num_results:
+                    break
+                doc = dict(doc)
+                if output_ids:
+                    doc['_id'] = doc_id
+                else:
+                    del doc['_id']
+                if not output_scores:
+                    del doc['_score']
+                merged.append(doc)
+            results.append(merged)
+        return results
+
+    def save(self, path, metadata=None):
+        """
+        Writes every shard as a ``minsearch`` snapshot under ``path``, plus a manifest.
+
+        Args:
+            path (str): Snapshot directory to create or replace.
+            metadata (dict): Optional JSON-serializable values stored in the manifest.
+        """
+        if not self.n_docs:
+            raise ValueError("Cannot save an index that has not been fitted")
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+        try:
+            futures = [
+                self._submit(shard_id, _save, os.path.join(tmp_path, f'shard-{shard_id:03d}'))
+                for shard_id in range(len(self.offsets))
+            ]
+            for future in futures:
+                future.result()
+
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'version': SNAPSHOT_VERSION,
+                'params': self.params,
+                'bounds': self.offsets + [self.n_docs],
+                'metadata': metadata or {},
+            }
+            with open(os.path.join(tmp_path, 'manifest.json'), 'wt', encoding='utf-8') as f_out:
+                json.dump(manifest, f_out, ensure_ascii=False, indent=2)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def read_manifest(path):
+        """Reads and validates the manifest of a snapshot written by ``save``."""
+        with open(os.path.join(path, 'manifest.json'), 'rt', encoding='utf-8') as f_in:
+            manifest = json.load(f_in)
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported sharded index snapshot at {path}")
+        return manifest
+
+    @classmethod
+    def load(cls, path, processes=True):
+        """
+        Opens a snapshot written by ``save``; every shard memory-maps its own snapshot.
+
+        Args:
+            path (str): Snapshot directory.
+            processes (bool): As in ``__init__``.
+        """
+        manifest = cls.read_manifest(path)
+        bounds = manifest['bounds']
+        index = cls(**manifest['params'], n_shards=len(bounds) - 1, processes=processes)
+        index._start(bounds, [(None, os.path.join(path, f'shard-{i:03d}')) for i in range(index.n_shards)])
+        return index
@@ -1,5 +1,4 @@
 import os
-import json
 import uuid
 import argparse
 import logging
@@ -9,6 +8,8 @@ import questionary
 import pandas as pd
 # import backoff  # optional: if you want retries
 
+from sse_client import ask_question_stream
+
 # ----------------------------------------------------------------------
 # Logging
 # ----------------------------------------------------------------------
@@ -90,6 +91,11 @@ def main():
         action="store_true",
         help="Use random questions from the CSV file instead of manual input",
     )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for the whole answer from /question instead of streaming it",
+    )
     args = parser.parse_args()
 
     print("Welcome to the interactive question-answering app!")
@@ -107,8 +113,20 @@ def main():
                 break
 
         # Ask API
-        response = ask_question(BASE_URL, question)
-        print("\nAnswer:", response.get("answer", "No answer provided"))
+        if args.no_stream:
+            response = ask_question(BASE_URL, question)
+            print("\nAnswer:", response.get("answer", "No answer provided"))
+        else:
+            response = {}
+            print("\nAnswer: ", end="", flush=True)
+            for event, data in ask_question_stream(BASE_URL, question):
+                if event == "token":
+                    print(data["text"], end="", flush=True)
+                elif event == "done":
+                    response = data
+                elif event == "error":
+                    print(f"Error: {data['error']}", end="")
+            print()
 
         # Track conversation
         conversation_id = response.get("conversation_id", str(uuid.uuid4()))
@@ -18,8 +18,13 @@ CREATE TABLE IF NOT EXISTS public.conversations (
     eval_prompt_tokens INTEGER NOT NULL,
     eval_completion_tokens INTEGER NOT NULL,
     eval_total_tokens INTEGER NOT NULL,
+    eval_attempts INTEGER NOT NULL DEFAULT 0,
+    eval_claimed_at TIMESTAMP WITH TIME ZONE,
     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
 );
+-- Queue of answers awaiting the background judge
+CREATE INDEX IF NOT EXISTS conversations_pending_idx
+    ON public.conversations (timestamp) WHERE relevance IN ('PENDING', 'JUDGING');
 
 -- Drop tables if they exist
 DROP TABLE IF EXISTS public.feedback;
@@ -0,0 +1,53 @@
+"""
+Client of the streaming endpoint (/question/stream) shared by cli.py, app_st.py and app_gr.py.
+"""
+import json
+import logging
+
+import requests
+
+# ---------------- Logging ----------------
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+def parse_events(lines):
+    """
+    Server-sent events of a stream of text lines, as (event, data) with the JSON payload decoded.
+
+    A ``data:`` line that is not valid JSON yields an ('error', {'error': ...}) event instead,
+    and parsing goes on with the next event.
+    """
+    event = "message"
+    for line in lines:
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            try:
+                data = json.loads(line[len("data:"):])
+            except json.JSONDecodeError as e:
+                logger.error(f"Malformed '{event}' event from API: {e}")
+                yield "error", {"error": f"❌ Malformed response from API: {e}"}
+            else:
+                yield event, data
+            event = "message"
+
+
+def ask_question_stream(url, question):
+    """Send question to the streaming endpoint; yield (event, data) as server-sent events arrive."""
+    try:
+        with requests.post(
+            f"{url}/question/stream",
+            json={"question": question},
+            stream=True,
+        ) as resp:
+            resp.raise_for_status()
+            resp.encoding = "utf-8"
+            # chunk_size=None hands over each chunk as soon as it arrives
+            yield from parse_events(resp.iter_lines(chunk_size=None, decode_unicode=True))
+    except requests.exceptions.RequestException as e:
+        logger.exception("Error calling API")
+        yield "error", {"error": f"❌ API error: {e}"}
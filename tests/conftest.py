@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "Data")
+
+# config.Settings reads the environment on import: use the bundled data wherever pytest runs
+# from, and keep the tests from writing index snapshots next to it
+os.environ["DATA_PATH"] = os.path.join(DATA_DIR, "documents-with-ids.json")
+os.environ["INDEX_SNAPSHOT_PATH"] = ""
+os.environ["DENSE_INDEX_PATH"] = ""
+
+# The modules under test live in assistant/ and import each other by plain name
+sys.path.insert(0, os.path.join(ROOT, "assistant"))
+
+import minsearch  # noqa: E402
+# Same boost weights and filter rag.search sends on every request
+from config import SEARCH_BOOST as BOOST, SEARCH_FILTER as FILTER  # noqa: E402
+
+TEXT_FIELDS = ['intent', 'question', 'response']
+KEYWORD_FIELDS = ['id', 'category']
+
+
+def build_index(documents, **params):
+    return minsearch.Index(text_fields=TEXT_FIELDS, keyword_fields=KEYWORD_FIELDS, **params).fit(documents)
+
+
+@pytest.fixture(scope="session")
+def documents():
+    with open(os.path.join(DATA_DIR, "documents-with-ids.json"), 'rt', encoding='utf-8') as f_in:
+        return json.load(f_in)
+
+
+@pytest.fixture(scope="session")
+def questions():
+    """Ground-truth questions, a sample of the traffic rag.search answers."""
+    return pd.read_csv(os.path.join(DATA_DIR, "ground-truth-data.csv"))['question'].tolist()[::10]
+
+
+@pytest.fixture(scope="session")
+def index(documents):
+    return build_index(documents)
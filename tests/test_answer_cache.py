@@ -0,0 +1,83 @@
+import pytest
+
+import answer_cache
+from conftest import build_index
+
+
+@pytest.fixture
+def index(documents):
+    # Function-scoped: the tests change the documents
+    return build_index(documents[:400])
+
+
+@pytest.fixture
+def cache(index):
+    return answer_cache.SemanticAnswerCache(
+        vectorize=lambda questions: index.vectorize(questions, 'question'),
+        version=lambda: index.generation,
+        threshold=0.8, maxsize=3, ttl=None,
+    )
+
+
+QUESTION = "How can I cancel my subscription to the streaming service?"
+PARAPHRASE = "how can i cancel my subscription to the streaming service"
+
+
+def test_paraphrase_with_the_same_documents_hits(cache):
+    assert cache.lookup(QUESTION, ['a', 'b']) is None
+    cache.store(QUESTION, ['a', 'b'], "Open the account page.")
+
+    answer, similarity = cache.lookup(PARAPHRASE, ['a', 'b'])
+    assert answer == "Open the account page." and similarity == pytest.approx(1.0)
+    # Other retrieved documents, or another question, are misses
+    assert cache.lookup(PARAPHRASE, ['b', 'a']) is None
+    assert cache.lookup("Where do I report copyright infringement?", ['a', 'b']) is None
+    assert cache.info() == {'hits': 1, 'misses': 3, 'hit_rate': 0.25, 'invalidations': 0, 'size': 1, 'maxsize': 3}
+
+
+def test_least_recently_used_answers_are_evicted(cache):
+    for i in range(3):
+        cache.store(QUESTION, [i], f"answer {i}")
+    assert cache.lookup(QUESTION, [0])[0] == "answer 0"
+    cache.store(QUESTION, [3], "answer 3")  # evicts answer 1
+    assert len(cache) == 3
+    assert cache.lookup(QUESTION, [1]) is None
+    assert cache.lookup(QUESTION, [0])[0] == "answer 0"
+
+
+def test_answers_expire_after_ttl(monkeypatch, cache):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache, 'monotonic', lambda: now[0])
+    cache.ttl = 60
+    cache.store(QUESTION, ['a'], "answer")
+    now[0] += 59
+    assert cache.lookup(QUESTION, ['a'])[0] == "answer"
+    now[0] += 1
+    assert cache.lookup(QUESTION, ['a']) is None
+    assert len(cache) == 0
+
+
+def test_index_changes_drop_the_answers(cache, index, documents):
+    cache.store(QUESTION, ['a'], "answer")
+    index.add_documents(documents[400:401])
+    assert cache.lookup(QUESTION, ['a']) is None
+    assert cache.info()['invalidations'] == 1
+
+    cache.store(QUESTION, ['a'], "new answer")
+    index.compact()
+    assert cache.lookup(QUESTION, ['a']) is None
+    assert cache.info()['invalidations'] == 2
+
+
+def test_replacing_the_index_caches_keeps_the_answers_tied_to_the_documents(cache, index, documents):
+    cache.store(QUESTION, ['a'], "answer")
+    generation = index.generation
+    index.configure_cache(query_cache_size=8, result_cache_size=8)
+    assert index.generation == generation
+    assert cache.lookup(QUESTION, ['a'])[0] == "answer"
+
+    # As many changes as the generation had reached must not bring back its value
+    for doc in documents[400:400 + generation]:
+        index.add_documents([doc])
+    assert index.generation > generation
+    assert cache.lookup(QUESTION, ['a']) is None
@@ -0,0 +1,77 @@
+import pytest
+
+import chunking
+
+
+def passages_of(text, max_tokens, overlap_tokens, doc_id='doc'):
+    return [
+        {'id': doc_id, 'response': passage, 'chunk': chunk, 'passage_id': f"{doc_id}-{chunk}"}
+        for chunk, passage in enumerate(chunking.split_passages(text, max_tokens, overlap_tokens))
+    ]
+
+
+def test_split_passages_windows_and_overlap(documents):
+    text = max((doc['response'] for doc in documents), key=len)
+    passages = chunking.split_passages(text, max_tokens=40, overlap_tokens=8)
+    assert len(passages) > 2
+    for passage in passages:
+        assert passage in text
+        assert len(chunking.TOKEN_PATTERN.findall(passage)) <= 40
+    for first, second in zip(passages, passages[1:]):
+        assert chunking.TOKEN_PATTERN.findall(first)[-8:] == chunking.TOKEN_PATTERN.findall(second)[:8]
+    assert chunking.split_passages("short text", max_tokens=40) == ["short text"]
+
+
+@pytest.mark.parametrize("max_tokens, overlap_tokens", [(40, 8), (30, 29), (16, 1)])
+def test_join_passages_restores_the_document(documents, max_tokens, overlap_tokens):
+    for doc in documents[::20]:
+        text = doc['response']
+        passages = chunking.split_passages(text, max_tokens, overlap_tokens)
+        joined = passages[0]
+        for passage in passages[1:]:
+            joined = chunking.join_passages(joined, passage, overlap_tokens)
+        start = text.index(passages[0])
+        assert joined == text[start:start + len(joined)]
+        assert joined.endswith(passages[-1])
+
+
+def test_join_passages_without_overlap(documents):
+    assert chunking.join_passages("first part.", "Second part", overlap_tokens=4) == "first part. Second part"
+    # Without an overlap to cut, passages are joined with a space and no token is lost
+    text = documents[0]['response']
+    passages = chunking.split_passages(text, max_tokens=25, overlap_tokens=0)
+    joined = passages[0]
+    for passage in passages[1:]:
+        joined = chunking.join_passages(joined, passage, overlap_tokens=0)
+    assert chunking.TOKEN_PATTERN.findall(joined) == chunking.TOKEN_PATTERN.findall(text)
+
+
+def test_collapse_passages_merges_consecutive_chunks(documents):
+    text = max((doc['response'] for doc in documents), key=len)
+    passages = passages_of(text, max_tokens=30, overlap_tokens=6)
+    assert len(passages) >= 4
+    other = passages_of("An unrelated answer about billing.", 30, 6, doc_id='other')
+
+    # Ranked: chunks 2, 0, the other document, then 1 and 3
+    ranked = [passages[2], passages[0], other[0], passages[1], passages[3]]
+    results = chunking.collapse_passages(ranked, num_results=2, overlap_tokens=6)
+
+    assert [doc['id'] for doc in results] == ['doc', 'other']
+    assert 'chunk' not in results[0] and 'passage_id' not in results[0]
+    merged = results[0]['response']
+    start = text.index(passages[0]['response'])
+    assert merged == text[start:start + len(merged)]
+    assert merged.endswith(passages[3]['response'])
+    assert results[1]['response'] == other[0]['response']
+
+
+def test_collapse_passages_marks_gaps(documents):
+    text = max((doc['response'] for doc in documents), key=len)
+    passages = passages_of(text, max_tokens=30, overlap_tokens=6)
+    results = chunking.collapse_passages([passages[3], passages[0]], num_results=1, overlap_tokens=6)
+    assert results[0]['response'] == passages[0]['response'] + "\n...\n" + passages[3]['response']
+
+
+def test_collapse_passages_limits_parents():
+    ranked = [{'id': str(i), 'response': f"answer {i}", 'chunk': 0, 'passage_id': f"{i}-0"} for i in range(5)]
+    assert [doc['id'] for doc in chunking.collapse_passages(ranked, num_results=3)] == ['0', '1', '2']
@@ -0,0 +1,80 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import dedup
+
+
+def jaccard(a, b, size=3):
+    a, b = set(dedup.shingles(a, size).tolist()), set(dedup.shingles(b, size).tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_shingles():
+    assert len(dedup.shingles("One two three four", size=3)) == 2
+    assert len(dedup.shingles("One, two", size=3)) == 1
+    # Case and punctuation do not matter
+    np.testing.assert_array_equal(np.sort(dedup.shingles("One two THREE!", 2)), np.sort(dedup.shingles("one two three", 2)))
+    assert len(dedup.shingles("", size=3)) == 0
+    assert len(dedup.shingles(" ?! ", size=3)) == 0
+
+
+def test_signature_estimates_jaccard(documents):
+    hasher = dedup.MinHasher(num_perm=256)
+    responses = [doc['response'] for doc in documents[:40]]
+    for a, b in itertools.combinations(responses[:12], 2):
+        estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+        assert estimate == pytest.approx(jaccard(a, b), abs=0.12)
+    assert np.array_equal(hasher.signature(responses[0]), hasher.signature(responses[0].upper()))
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.9])
+def test_lsh_params_match_the_threshold(threshold):
+    bands, rows = dedup.lsh_params(threshold, 128)
+    assert bands * rows <= 128
+    assert (1 / bands) ** (1 / rows) == pytest.approx(threshold, abs=0.08)
+
+
+def test_find_near_duplicates_within_groups():
+    base = "To cancel your subscription open the account page and choose the cancel option at the bottom"
+    docs = [
+        {'id': 'a', 'intent': 'cancel', 'response': base},
+        {'id': 'b', 'intent': 'cancel', 'response': base + " today"},
+        {'id': 'c', 'intent': 'other', 'response': base},
+        {'id': 'd', 'intent': 'cancel', 'response': "Contact support to report a problem with a payment"},
+        {'id': 'e', 'intent': 'cancel', 'response': base.upper()},
+    ]
+    assert dedup.find_near_duplicates(docs, threshold=0.8) == {'a': ['b', 'e']}
+    assert dedup.find_near_duplicates(docs, threshold=0.8, group_field=None) == {'a': ['b', 'c', 'e']}
+
+
+def test_texts_without_words_are_not_near_duplicates():
+    assert dedup.MinHasher().signature("...") is None
+    docs = [{'id': 'a', 'intent': 'x', 'response': ''}, {'id': 'b', 'intent': 'x', 'response': ''},
+            {'id': 'c', 'intent': 'x', 'response': '?'}]
+    assert dedup.find_near_duplicates(docs, threshold=0.8) == {}
+
+
+def test_find_near_duplicates_agrees_with_exact_jaccard(documents):
+    threshold = 0.8
+    aliases = dedup.find_near_duplicates(documents, threshold=threshold)
+    by_id = {doc['id']: doc for doc in documents}
+    canonical_of = {alias: canonical for canonical, ids in aliases.items() for alias in ids}
+    for alias, canonical in canonical_of.items():
+        assert by_id[alias]['intent'] == by_id[canonical]['intent']
+        assert jaccard(by_id[alias]['response'], by_id[canonical]['response']) >= threshold - 0.15
+    # Of two copies with the same shingles, at most one stays canonical
+    copies = {}
+    for doc in documents:
+        key = (doc['intent'], frozenset(dedup.shingles(doc['response']).tolist()))
+        copies.setdefault(key, []).append(doc['id'])
+    for ids in copies.values():
+        assert sum(id_ not in canonical_of for id_ in ids) <= 1
+
+
+def test_collapse_duplicates():
+    docs = [{'id': id_} for id_ in 'abcd']
+    collapsed = list(dedup.collapse_duplicates(docs, {'a': ['c'], 'b': ['d']}))
+    assert collapsed == [{'id': 'a', dedup.ALIAS_FIELD: ['c']}, {'id': 'b', dedup.ALIAS_FIELD: ['d']}]
+    assert list(dedup.collapse_duplicates(docs, {})) == [{'id': id_, dedup.ALIAS_FIELD: []} for id_ in 'abcd']
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import dense
+import minsearch
+from conftest import FILTER, KEYWORD_FIELDS, TEXT_FIELDS
+
+
+@pytest.fixture(scope="module")
+def embedder():
+    return dense.HashingEmbedder(dim=256)
+
+
+@pytest.fixture(scope="module")
+def dense_index(embedder, documents):
+    return dense.DenseIndex(embedder, TEXT_FIELDS, KEYWORD_FIELDS).fit(documents)
+
+
+@pytest.fixture(scope="module")
+def cosine_scores(embedder, documents):
+    """Cosine similarity of a query with every document, computed from scratch in float64."""
+    texts = [" ".join(doc[field] for field in TEXT_FIELDS) for doc in documents]
+    matrix = embedder.embed_documents(texts).astype(np.float64)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    def scores(query, filter_dict):
+        query_vec = embedder.embed_queries([query])[0].astype(np.float64)
+        result = matrix @ (query_vec / np.linalg.norm(query_vec))
+        for field, value in filter_dict.items():
+            result *= np.array([doc[field] == value for doc in documents])
+        return result
+    return scores
+
+
+def assert_ranked(results, scores, num_results):
+    """``results`` are the best ``num_results`` positive ``scores``, up to float32 rounding of near ties."""
+    expected = np.sort(scores[scores > 0])[::-1][:num_results]
+    np.testing.assert_allclose(scores[[doc['_id'] for doc in results]], expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize("filter_dict", [{}, FILTER])
+def test_search_matches_cosine_similarity(dense_index, cosine_scores, questions, filter_dict):
+    for question in questions:
+        results = dense_index.search(question, filter_dict=filter_dict, num_results=5, output_ids=True)
+        assert_ranked(results, cosine_scores(question, filter_dict), 5)
+
+
+def test_search_batch_matches_cosine_similarity(dense_index, cosine_scores, questions):
+    batch = dense_index.search_batch(questions, filter_dict=FILTER, num_results=5, output_ids=True, batch_size=7)
+    assert len(batch) == len(questions)
+    for question, results in zip(questions, batch):
+        assert_ranked(results, cosine_scores(question, FILTER), 5)
+
+
+def test_filter_operators(dense_index, documents):
+    allowed = [doc['id'] for doc in documents[:30]]
+    results = dense_index.search("cancel my subscription", filter_dict={'id': {'$in': allowed}}, num_results=50)
+    assert results and {doc['id'] for doc in results} <= set(allowed)
+    results = dense_index.search("cancel my subscription", filter_dict={'id': {'$nin': allowed}}, num_results=50)
+    assert results and not {doc['id'] for doc in results} & set(allowed)
+    assert dense_index.search("cancel my subscription", filter_dict={'category': 'missing'}) == []
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, embedder, dense_index, questions, mmap):
+    path = str(tmp_path / "dense")
+    dense_index.save(path, metadata={'source': 'documents-with-ids.json'})
+
+    assert dense.DenseIndex.read_manifest(path)['metadata'] == {'source': 'documents-with-ids.json'}
+    loaded = dense.DenseIndex.load(path, embedder, mmap=mmap)
+    assert isinstance(loaded.embeddings, np.memmap) == mmap
+    assert loaded.docs == dense_index.docs
+    for question in questions:
+        assert loaded.search(question, filter_dict=FILTER, output_ids=True) == \
+               dense_index.search(question, filter_dict=FILTER, output_ids=True)
+
+    with pytest.raises(ValueError):
+        dense.DenseIndex.load(path, dense.HashingEmbedder(dim=128))
+
+
+def test_empty_index():
+    index = dense.DenseIndex(dense.HashingEmbedder(), TEXT_FIELDS, KEYWORD_FIELDS).fit([])
+    assert index.search("anything") == []
+    assert index.search_batch(["anything", "else"]) == [[], []]
+
+
+def test_collapse_keeps_best_hit_per_group(dense_index, questions):
+    for question in questions:
+        full = dense_index.search(question, num_results=len(dense_index.docs), output_ids=True, output_scores=True)
+        collapsed = dense_index.search(question, num_results=5, output_ids=True, output_scores=True,
+                                       collapse_field='intent')
+        assert collapsed == minsearch.collapse_results(full, 'intent')[:5]
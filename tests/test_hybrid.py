@@ -0,0 +1,70 @@
+import pytest
+
+import dense
+import hybrid
+from conftest import BOOST, FILTER, KEYWORD_FIELDS, TEXT_FIELDS, build_index
+
+
+def pool(*scored):
+    """A ranked retriever result: (id, score) pairs, best first."""
+    return [{'id': id_, '_id': position, '_score': score} for position, (id_, score) in enumerate(scored)]
+
+
+def test_rrf_sums_reciprocal_ranks():
+    pools = {
+        'lexical': pool(('x', 9.0), ('y', 5.0), ('z', 1.0)),
+        'dense': pool(('y', 0.9), ('w', 0.8)),
+    }
+    results = hybrid.fuse(pools, rrf_k=60, output_scores=True)
+    assert [doc['id'] for doc in results] == ['y', 'x', 'w', 'z']
+    assert [doc['_score'] for doc in results] == pytest.approx([1 / 62 + 1 / 61, 1 / 61, 1 / 62, 1 / 63])
+    assert all('_id' not in doc for doc in results)
+
+    # Weights scale each retriever's contribution; weight 0 drops the retriever
+    results = hybrid.fuse(pools, weights={'lexical': 3.0}, rrf_k=60)
+    assert [doc['id'] for doc in results] == ['y', 'x', 'z', 'w']
+    results = hybrid.fuse(pools, weights={'dense': 0}, num_results=2)
+    assert [doc['id'] for doc in results] == ['x', 'y']
+
+
+def test_weighted_blends_min_max_normalized_scores():
+    pools = {
+        'lexical': pool(('x', 10.0), ('y', 6.0), ('z', 2.0)),
+        'dense': pool(('z', 0.9), ('y', 0.6), ('w', 0.3)),
+    }
+    results = hybrid.fuse(pools, weights={'lexical': 1.0, 'dense': 2.0}, method='weighted', output_scores=True)
+    # lexical: x 1, y 0.5, z 0; dense: z 1, y 0.5, w 0
+    assert [doc['id'] for doc in results] == ['z', 'y', 'x', 'w']
+    assert [doc['_score'] for doc in results] == pytest.approx([2.0, 1.5, 1.0, 0.0])
+
+
+def test_fuse_breaks_ties_by_first_appearance():
+    pools = {'a': pool(('x', 1.0), ('y', 1.0)), 'b': pool(('y', 1.0), ('x', 1.0))}
+    assert [doc['id'] for doc in hybrid.fuse(pools, method='rrf')] == ['x', 'y']
+    assert hybrid.fuse({'a': [], 'b': []}) == []
+
+
+def test_unknown_method_raises():
+    with pytest.raises(ValueError):
+        hybrid.HybridRetriever({}, method='max')
+
+
+def test_retriever_fuses_the_pools_of_each_index(documents, questions):
+    retrievers = {
+        'lexical': build_index(documents),
+        'dense': dense.DenseIndex(dense.HashingEmbedder(dim=256), TEXT_FIELDS, KEYWORD_FIELDS).fit(documents),
+    }
+    retriever = hybrid.HybridRetriever(retrievers, weights={'dense': 0.5}, pool_size=10)
+    params = dict(filter_dict=FILTER, boost_dict=BOOST, num_results=5, output_ids=True, output_scores=True)
+    batch = retriever.search_batch(questions, **params)
+    pools = {name: index.search_batch(questions, filter_dict=FILTER, boost_dict=BOOST, num_results=10,
+                                      output_ids=True, output_scores=True)
+             for name, index in retrievers.items()}
+    for i, results in enumerate(batch):
+        expected = hybrid.fuse({name: pool[i] for name, pool in pools.items()}, weights={'dense': 0.5},
+                               num_results=5, output_ids=True, output_scores=True)
+        assert results == expected
+    assert retriever.search(questions[0], **params) == hybrid.fuse(
+        {name: index.search(questions[0], filter_dict=FILTER, boost_dict=BOOST, num_results=10,
+                            output_ids=True, output_scores=True) for name, index in retrievers.items()},
+        weights={'dense': 0.5}, num_results=5, output_ids=True, output_scores=True)
@@ -0,0 +1,44 @@
+import os
+import json
+
+import pytest
+
+import ingest
+from conftest import DATA_DIR
+
+DOCUMENTS_PATH = os.path.join(DATA_DIR, "documents-with-ids.json")
+
+
+@pytest.mark.parametrize("buffer_size", [1, 7, 100, 4096, 1 << 20])
+def test_iter_documents_matches_json_load(documents, buffer_size):
+    assert list(ingest.iter_documents(DOCUMENTS_PATH, buffer_size=buffer_size)) == documents
+
+
+@pytest.mark.parametrize("buffer_size", [3, 64, 1 << 20])
+def test_iter_documents_reads_ndjson(tmp_path, documents, buffer_size):
+    path = tmp_path / "documents.ndjson"
+    path.write_text("".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in documents[:50]), encoding='utf-8')
+    assert list(ingest.iter_documents(str(path), buffer_size=buffer_size)) == documents[:50]
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("[]", []),
+    ("[ {\"a\": 1} , {\"a\": \"]\"} ]  ", [{'a': 1}, {'a': ']'}]),
+    # Leading whitespace longer than the buffer
+    ("  [ {\"a\": 1} , {\"a\": \"]\"} ]  ", [{'a': 1}, {'a': ']'}]),
+    ("     \n  {\"a\": 1}\n{\"a\": 2}\n", [{'a': 1}, {'a': 2}]),
+    ("    ", []),
+    ("", []),
+])
+def test_iter_documents_edge_cases(tmp_path, content, expected):
+    path = tmp_path / "documents.json"
+    path.write_text(content, encoding='utf-8')
+    assert list(ingest.iter_documents(str(path), buffer_size=2)) == expected
+
+
+def test_iter_documents_rejects_truncated_files(tmp_path):
+    text = open(DOCUMENTS_PATH, encoding='utf-8').read()
+    path = tmp_path / "truncated.json"
+    path.write_text(text[:len(text) // 2], encoding='utf-8')
+    with pytest.raises(json.JSONDecodeError):
+        list(ingest.iter_documents(str(path), buffer_size=4096))
@@ -0,0 +1,449 @@
+import re
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+import minsearch
+from conftest import BOOST, FILTER, KEYWORD_FIELDS, TEXT_FIELDS, build_index
+
+
+def per_field_scores(index, query, filter_dict, boost_dict):
+    """The original scoring path: one cosine_similarity per field plus pandas filters."""
+    scores = np.zeros(len(index.docs))
+    for field, matrix in index.text_matrices.items():
+        query_vec = index.vectorize([query], field)
+        scores += cosine_similarity(query_vec, matrix).flatten() * boost_dict.get(field, 1)
+    for field, value in filter_dict.items():
+        if field in index.keyword_fields:
+            scores = scores * (index.keyword_df[field] == value).to_numpy()
+    return scores
+
+
+def assert_ranked(results, scores, num_results, rtol=1e-7):
+    """``results`` are the best ``num_results`` positive ``scores``, best first (ties in any order)."""
+    expected = np.sort(scores[scores > 0])[::-1][:num_results]
+    assert len(results) == len(expected)
+    np.testing.assert_allclose([doc['_score'] for doc in results], expected, rtol=rtol)
+    np.testing.assert_allclose([scores[doc['_id']] for doc in results], expected, rtol=rtol)
+
+
+def bm25_scores(documents, query, filter_dict, boost_dict, k1=1.2, b=0.75):
+    """Okapi BM25 written out term by term, summed over the boosted text fields."""
+    def tokenize(text):
+        return re.findall(r'(?u)\b\w\w+\b', text.lower())
+
+    scores = np.zeros(len(documents))
+    for field in TEXT_FIELDS:
+        counts = [Counter(tokenize(doc.get(field, ''))) for doc in documents]
+        avgdl = sum(sum(c.values()) for c in counts) / len(counts)
+        df = Counter(term for c in counts for term in c)
+        for i, c in enumerate(counts):
+            dl = sum(c.values())
+            for term in tokenize(query):
+                if term in c:
+                    idf = math.log(1 + (len(documents) - df[term] + 0.5) / (df[term] + 0.5))
+                    tf = c[term]
+                    scores[i] += boost_dict.get(field, 1) * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    for field, value in filter_dict.items():
+        scores *= np.array([doc.get(field) == value for doc in documents])
+    return scores
+
+
+def is_memory_mapped(array):
+    """True if ``array`` is, or is a view of, a memory-mapped file."""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def search(index, query, **params):
+    return index.search(query, filter_dict=FILTER, boost_dict=BOOST, num_results=5,
+                        output_ids=True, output_scores=True, **params)
+
+
+@pytest.mark.parametrize("storage, rtol", [('dicts', 1e-7), ('columnar', 1e-5)])
+def test_search_matches_per_field_cosine(documents, questions, storage, rtol):
+    index = build_index(documents, storage=storage)
+    for question in questions:
+        scores = per_field_scores(index, question, FILTER, BOOST)
+        assert_ranked(search(index, question), scores, 5, rtol)
+
+
+def test_bm25_matches_reference_scoring(documents, questions):
+    index = build_index(documents, scoring='bm25')
+    for question in questions[:20]:
+        assert_ranked(search(index, question), bm25_scores(documents, question, FILTER, BOOST), 5)
+
+
+@pytest.mark.parametrize("vectorizer_params", [
+    {},
+    {'sublinear_tf': True, 'norm': 'l1'},
+    {'binary': True, 'ngram_range': (1, 2)},
+])
+def test_vectorize_matches_tfidf_vectorizer(documents, questions, vectorizer_params):
+    index = build_index(documents, vectorizer_params=vectorizer_params)
+    for field in TEXT_FIELDS:
+        vectorizer = TfidfVectorizer(token_pattern=r'(?u)\b\w\w+\b', **vectorizer_params)
+        vectorizer.fit([doc[field] for doc in documents])
+        expected = vectorizer.transform(questions)
+        actual = index.vectorize(questions, field)
+        assert actual.shape == expected.shape
+        np.testing.assert_allclose(actual.toarray(), expected.toarray(), rtol=1e-12)
+
+
+def test_search_batch_matches_search(index, questions):
+    batch = index.search_batch(questions, filter_dict=FILTER, boost_dict=BOOST, num_results=5,
+                               output_ids=True, output_scores=True, batch_size=16)
+    assert batch == [search(index, q) for q in questions]
+
+
+def test_collapse_keeps_best_hits_per_group(index, questions):
+    for question in questions:
+        full = index.search(question, filter_dict=FILTER, boost_dict=BOOST, num_results=len(index.docs),
+                            output_ids=True, output_scores=True)
+        for collapse_size in (1, 2):
+            collapsed = search(index, question, collapse_field='intent', collapse_size=collapse_size)
+            expected = minsearch.collapse_results(full, 'intent', collapse_size)[:5]
+            assert collapsed == expected
+
+
+def test_search_without_matches(index):
+    assert index.search("zzzz qqqq") == []
+    assert index.search_batch([]) == []
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("storage", ['dicts', 'columnar'])
+def test_snapshot_round_trip(tmp_path, documents, questions, storage, mmap):
+    index = build_index(documents, storage=storage)
+    path = str(tmp_path / "snapshot")
+    index.save(path, metadata={'source': 'documents-with-ids.json'})
+
+    assert minsearch.Index.read_manifest(path)['metadata'] == {'source': 'documents-with-ids.json'}
+    loaded = minsearch.Index.load(path, mmap=mmap)
+    assert is_memory_mapped(loaded.postings.data) == mmap
+    assert is_memory_mapped(loaded.lexicon.buffer) == mmap
+    assert loaded.lexicon.terms == index.lexicon.terms
+    assert [dict(doc) for doc in loaded.docs] == [dict(doc) for doc in index.docs]
+    for question in questions:
+        assert search(loaded, question) == search(index, question)
+
+
+def test_load_rejects_other_snapshot_versions(tmp_path, index):
+    path = str(tmp_path / "snapshot")
+    index.save(path)
+    manifest_path = tmp_path / "snapshot" / "manifest.json"
+    manifest_path.write_text(manifest_path.read_text().replace(
+        f'"version": {minsearch.SNAPSHOT_VERSION}', '"version": 0'))
+    with pytest.raises(ValueError):
+        minsearch.Index.load(path)
+
+
+@pytest.mark.parametrize("storage", ['dicts', 'columnar'])
+def test_delta_segment_tombstones_and_compact(documents, questions, storage):
+    index = build_index(documents[:300], storage=storage, compaction_threshold=None)
+    added = index.add_documents(documents[300:])
+    assert added == list(range(300, len(documents)))
+
+    # A copy of document 200's text, so every term is in the fitted vocabulary
+    updated = {**documents[10], 'question': documents[200]['question'], 'response': documents[200]['response']}
+    index.update_document(10, updated)
+    index.delete_document(20)
+    assert index.pending_changes == len(added) + 2
+    with pytest.raises(KeyError):
+        index.delete_document(20)
+
+    # Until compaction, changed documents are scored against the fitted vocabulary
+    hits = index.search(documents[200]['question'], num_results=2, output_ids=True, output_scores=True)
+    assert {doc['_id'] for doc in hits} == {10, 200}
+    assert hits[0]['_score'] == pytest.approx(hits[1]['_score'])
+    assert all(doc['response'] == updated['response'] for doc in hits)
+    assert index.search(documents[400]['question'], num_results=1, output_ids=True)[0]['_id'] == 400
+    assert index.search(documents[400]['question'], filter_dict={'id': documents[400]['id']}, output_ids=True)
+    for question in questions:
+        assert all(doc['_id'] != 20 for doc in search(index, question))
+    assert not index.search(documents[20]['question'], filter_dict={'id': documents[20]['id']})
+
+    # Compaction refits over the live documents; positions of the others do not change
+    index.compact()
+    assert index.pending_changes == 0
+    live = [doc for doc in index.docs if doc is not None]
+    positions = [i for i, doc in enumerate(index.docs) if doc is not None]
+    fresh = build_index([dict(doc) for doc in live], storage=storage)
+    rtol = 1e-5 if storage == 'columnar' else 1e-7
+    for question in questions:
+        compacted = search(index, question)
+        expected = search(fresh, question)
+        assert [doc['id'] for doc in compacted] == [doc['id'] for doc in expected]
+        assert [doc['_id'] for doc in compacted] == [positions[doc['_id']] for doc in expected]
+        np.testing.assert_allclose([doc['_score'] for doc in compacted], [doc['_score'] for doc in expected],
+                                   rtol=rtol)
+
+
+def test_automatic_compaction(documents):
+    index = build_index(documents[:300], compaction_threshold=50, background_compaction=False)
+    index.add_documents(documents[300:])
+    assert index.pending_changes == 0
+    index.delete_document(0)
+    assert index.pending_changes == 1
+    assert index.docs[0] is None
+    assert index.search(documents[0]['question'], filter_dict={'id': documents[0]['id']}) == []
+
+
+@pytest.mark.parametrize("storage", ['dicts', 'columnar'])
+def test_delta_columns_match_vectorizing_the_whole_delta(documents, storage):
+    index = build_index(documents[:300], storage=storage, compaction_threshold=None)
+    index.add_documents(documents[300:320])
+    index.update_document(310, documents[5])
+    index.update_document(10, documents[6])
+    index.add_documents(documents[320:330])
+    index.delete_document(305)
+    index.update_document(10, documents[7])
+    index.delete_document(20)
+
+    expected_ids = [10] + [i for i in range(300, 330) if i != 305]
+    assert index._delta_ids.tolist() == expected_ids
+    expected = index._transform([index.docs[i] for i in expected_ids])
+    np.testing.assert_array_equal(index._delta_postings.toarray(), expected.toarray())
+
+
+def test_set_postings_installs_fit_postings(documents, index, questions):
+    fitted = minsearch.Index(TEXT_FIELDS, KEYWORD_FIELDS).fit_postings(documents)
+    installed = minsearch.Index(TEXT_FIELDS, KEYWORD_FIELDS).set_postings(*fitted, docs=documents)
+    for question in questions:
+        assert search(installed, question) == search(index, question)
+
+
+def test_fit_during_background_compaction_wins(documents, questions):
+    index = build_index(documents, compaction_threshold=None)
+    index.add_documents([documents[0]])
+    # Holding the lock lets the refit finish computing but not install its postings before the fit
+    with index._lock:
+        index.compact(background=True)
+        index.fit(documents[:10])
+    index.compact()
+
+    fresh = build_index(documents[:10])
+    assert index.postings.shape == fresh.postings.shape
+    for question in questions:
+        assert search(index, question) == search(fresh, question)
+
+
+@pytest.mark.parametrize("filter_dict, expected", [
+    ({'id': 'a'}, [0]),
+    ({'id': ['a', 'c']}, [0, 2]),
+    ({'id': ('a', 'missing')}, [0]),
+    ({'id': {'$in': ['b', 'c']}}, [1, 2]),
+    ({'id': {'$in': 'b'}}, [1]),
+    ({'id': {'$nin': ['b', 'c']}}, [0, 3]),
+    ({'id': {'$nin': 'a'}}, [1, 2, 3]),
+    # A scalar operand is one value, not the characters of a string
+    ({'id': {'$in': 'ab'}}, []),
+    ({'id': {'$nin': 'ab'}}, [0, 1, 2, 3]),
+    ({'id': {'$in': []}}, []),
+    ({'id': {'$nin': ['a']}, 'category': 'X'}, [2]),
+    ({'unknown': 'a'}, [0, 1, 2, 3]),
+    ({}, [0, 1, 2, 3]),
+])
+def test_filter_operators(filter_dict, expected):
+    docs = [{'text': 'same text', 'id': id_, 'category': category}
+            for id_, category in zip('abcd', 'XYXY')]
+    index = minsearch.Index(text_fields=['text'], keyword_fields=['id', 'category']).fit(docs)
+    results = index.search("text", filter_dict=filter_dict, output_ids=True)
+    assert sorted(doc['_id'] for doc in results) == expected
+
+
+@pytest.mark.parametrize("filter_dict", [
+    {'id': {'$eq': 'a'}},
+    {'id': {'$in': ['a'], '$nin': ['b']}},
+    {'id': {}},
+    {'id': {'$in': {'$in': ['a']}}},
+])
+def test_unsupported_filters_raise(index, filter_dict):
+    with pytest.raises(ValueError):
+        minsearch.resolve_filter(index.keyword_index, len(index.docs), filter_dict)
+    with pytest.raises(ValueError):
+        index.search("cancel my subscription", filter_dict=filter_dict)
+
+
+def test_result_cache_respects_filter_operators(documents):
+    index = build_index(documents, result_cache_size=16)
+    ids = [doc['id'] for doc in documents]
+    included = index.search("cancel subscription", filter_dict={'id': {'$in': ids[:10]}})
+    excluded = index.search("cancel subscription", filter_dict={'id': {'$nin': ids[:10]}})
+    assert {doc['id'] for doc in included} <= set(ids[:10])
+    assert not {doc['id'] for doc in excluded} & set(ids[:10])
+    assert index.search("cancel subscription", filter_dict={'id': {'$in': ids[:10]}}) == included
+
+
+def test_search_applies_filter_operators(index, documents):
+    ids = [doc['id'] for doc in documents]
+    filters = [
+        ({'id': ids[:50]}, set(ids[:50])),
+        ({'id': {'$in': ids[100:120]}}, set(ids[100:120])),
+        ({'id': {'$nin': ids[:400]}, 'category': 'CONTENT'}, set(ids[400:])),
+        ({'id': {'$in': ids[5]}}, {ids[5]}),
+    ]
+    for filter_dict, allowed in filters:
+        results = index.search("how do I report a problem", filter_dict=filter_dict, num_results=len(ids))
+        assert results and {doc['id'] for doc in results} <= allowed
+        assert all(doc['category'] == filter_dict.get('category', doc['category']) for doc in results)
+
+
+def test_top_k_breaks_ties_by_position():
+    scores = np.array([0.0, 0.5, 0.9, 0.5, 0.1, 0.9, 0.5])
+    assert minsearch.top_k(scores, 3).tolist() == [2, 5, 1]
+    assert minsearch.top_k(scores, 10).tolist() == [2, 5, 1, 3, 6, 4]
+    assert minsearch.top_k(scores, 0).tolist() == []
+
+
+def test_top_k_matches_a_full_sort():
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.random(1000), 2) * (rng.random(1000) > 0.3)
+    ranked = sorted(np.flatnonzero(scores > 0).tolist(), key=lambda i: (-scores[i], i))
+    for k in (1, 5, 100, 1000):
+        assert minsearch.top_k(scores, k).tolist() == ranked[:k]
+
+
+def test_columnar_storage_matches_dicts(documents, questions):
+    dicts = build_index(documents)
+    columnar = build_index(documents, storage='columnar')
+    assert columnar.postings.dtype == np.float32
+    for question in questions:
+        expected = search(dicts, question)
+        actual = search(columnar, question)
+        assert [doc['_id'] for doc in actual] == [doc['_id'] for doc in expected]
+        assert [{k: v for k, v in doc.items() if k != '_score'} for doc in actual] == \
+               [{k: v for k, v in doc.items() if k != '_score'} for doc in expected]
+
+
+def test_document_store_indexing_matches_a_list(documents):
+    docs = [dict(doc) for doc in documents[:20]]
+    docs[3] = None
+    store = minsearch.DocumentStore(docs)
+    store[5] = {'id': 'replaced'}
+    docs[5] = {'id': 'replaced'}
+
+    def as_dicts(items):
+        return [dict(doc) if doc is not None else None for doc in items]
+
+    for key in [slice(None, 1), slice(2, 7), slice(-3, None), slice(None, None, -4), slice(30, 40)]:
+        assert as_dicts(store[key]) == docs[key]
+    assert dict(store[-1]) == docs[-1]
+    with pytest.raises(IndexError):
+        store[20]
+
+
+def test_lru_cache_evicts_and_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(minsearch, 'monotonic', lambda: now[0])
+    cache = minsearch.LRUCache(2, ttl=10)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # 'b' is the least recently used
+    assert cache.get('b') is None
+    now[0] += 10
+    assert cache.get('a') is None and cache.get('c') is None
+    assert cache.info() == {'hits': 1, 'misses': 3, 'size': 0, 'maxsize': 2}
+
+
+def test_caches_return_fresh_results(documents, questions):
+    uncached = build_index(documents[:400], query_cache_size=0, result_cache_size=0)
+    cached = build_index(documents[:400], query_cache_size=256, result_cache_size=256)
+    for _ in range(2):
+        for question in questions:
+            assert search(cached, question) == search(uncached, question)
+    info = cached.cache_info
+    assert info['result']['hits'] == len(questions) and info['result']['misses'] == len(questions)
+    assert uncached.cache_info == {'query': None, 'result': None}
+
+    # Changed documents drop the cached results
+    for index in (cached, uncached):
+        index.add_documents(documents[400:])
+        index.delete_document(documents.index(next(d for d in documents if d['category'] == 'CONTENT')))
+    for question in questions:
+        assert search(cached, question) == search(uncached, question)
+    cached.compact()
+    uncached.compact()
+    for question in questions:
+        assert search(cached, question) == search(uncached, question)
+
+
+@pytest.mark.parametrize("scoring", ['tfidf', 'bm25'])
+def test_fit_stream_matches_fit(documents, questions, scoring):
+    fitted = build_index(documents, scoring=scoring)
+    streamed = minsearch.Index(TEXT_FIELDS, KEYWORD_FIELDS, scoring=scoring).fit_stream(iter(documents), chunk_size=64)
+    assert streamed.lexicon.terms == fitted.lexicon.terms
+    assert streamed.field_offsets == fitted.field_offsets
+    np.testing.assert_array_equal(streamed.postings.indptr, fitted.postings.indptr)
+    np.testing.assert_array_equal(streamed.postings.indices, fitted.postings.indices)
+    np.testing.assert_allclose(streamed.postings.data, fitted.postings.data, rtol=1e-12)
+    for question in questions:
+        assert [doc['_id'] for doc in search(streamed, question)] == [doc['_id'] for doc in search(fitted, question)]
+
+
+def test_top_k_collapsed_matches_collapsing_the_full_ranking():
+    rng = np.random.default_rng(0)
+    scores = rng.random(1000) * (rng.random(1000) > 0.3)
+    groups = rng.integers(0, 20, size=1000)
+    for k, group_size in [(5, 1), (10, 2), (50, 1), (100, 3)]:
+        ranked = minsearch.top_k(scores, len(scores))
+        counts = {}
+        expected = []
+        for i in ranked.tolist():
+            if counts.get(groups[i], 0) < group_size:
+                counts[groups[i]] = counts.get(groups[i], 0) + 1
+                expected.append(i)
+        assert minsearch.top_k_collapsed(scores, groups, k, group_size).tolist() == expected[:k]
+
+
+@pytest.mark.parametrize("scoring", ['tfidf', 'bm25'])
+def test_parallel_fit_matches_serial_fit(monkeypatch, documents, questions, scoring):
+    # Small inputs are counted serially; lower the cutoff so the worker processes run
+    monkeypatch.setattr(minsearch, 'PARALLEL_FIT_MIN_DOCS', 0)
+    serial = build_index(documents, scoring=scoring)
+    parallel = minsearch.Index(TEXT_FIELDS, KEYWORD_FIELDS, scoring=scoring).fit(documents, n_jobs=2, chunk_size=100)
+    assert parallel.lexicon.terms == serial.lexicon.terms
+    assert parallel.field_offsets == serial.field_offsets
+    np.testing.assert_array_equal(parallel.postings.indptr, serial.postings.indptr)
+    np.testing.assert_array_equal(parallel.postings.indices, serial.postings.indices)
+    np.testing.assert_allclose(parallel.postings.data, serial.postings.data, rtol=1e-12)
+    for question in questions:
+        assert [doc['_id'] for doc in search(parallel, question)] == [doc['_id'] for doc in search(serial, question)]
+
+
+def test_lexicon_lookup_matches_vocabulary(index):
+    terms = index.lexicon.terms
+    vocabulary = {term: i for i, term in enumerate(terms)}
+    assert terms == sorted(terms)
+
+    tokens = terms[::7] + ['', 'zzzzzz', 'a' * 40, terms[0] + 'x', terms[-1] * 3] + terms[::7]
+    expected = [vocabulary.get(token, -1) for token in tokens]
+    assert index.lexicon.search(tokens).tolist() == expected
+    # Cold lookup fills the cache, the warm one is answered from it
+    assert index.lexicon.lookup(tokens).tolist() == expected
+    assert index.lexicon.lookup(tokens).tolist() == expected
+
+    # A cache smaller than the batch is emptied and refilled without changing the answers
+    small = minsearch.Lexicon(index.lexicon.buffer, index.lexicon.offsets, index.lexicon.prefixes, {}, {},
+                              cache_size=4)
+    assert small.lookup(tokens).tolist() == expected
+    assert small.lookup(tokens[:3]).tolist() == expected[:3]
+    uncached = minsearch.Lexicon(index.lexicon.buffer, index.lexicon.offsets, index.lexicon.prefixes, {}, {},
+                                 cache_size=0)
+    assert uncached.lookup(tokens).tolist() == expected
+
+
+def test_lexicon_long_terms_sharing_a_prefix():
+    prefix = 'p' * minsearch.LEXICON_PREFIX_BYTES
+    terms = sorted([prefix, prefix + 'a', prefix + 'ab', prefix + 'b', prefix + 'ba', 'q', 'éclair'])
+    lexicon = minsearch.Lexicon.from_terms(terms)
+    tokens = terms + [prefix + 'c', prefix + 'aa', 'p', 'éclairs']
+    assert lexicon.lookup(tokens).tolist() == list(range(len(terms))) + [-1, -1, -1, -1]
@@ -0,0 +1,110 @@
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rag
+
+
+def verdict(item_id, relevance="RELEVANT", explanation="Answers the question."):
+    return {"Id": item_id, "Relevance": relevance, "Explanation": explanation}
+
+
+def test_parse_batch_evaluation():
+    evaluation = json.dumps([verdict(2, "PARTLY_RELEVANT"), verdict(1)])
+    assert rag.parse_batch_evaluation(evaluation, 2) == [
+        {"Relevance": "RELEVANT", "Explanation": "Answers the question."},
+        {"Relevance": "PARTLY_RELEVANT", "Explanation": "Answers the question."},
+    ]
+
+
+def test_parse_batch_evaluation_tolerates_chatter_around_the_array():
+    evaluation = "Here are the verdicts:\n```json\n" + json.dumps([verdict(1)]) + "\n```"
+    assert rag.parse_batch_evaluation(evaluation, 1)[0]["Relevance"] == "RELEVANT"
+
+
+def test_parse_batch_evaluation_drops_invalid_items():
+    evaluation = json.dumps([
+        verdict(1, "MOSTLY_RELEVANT"),        # unknown label
+        verdict(2), verdict(2, "NON_RELEVANT"),  # duplicate id: the first verdict wins
+        verdict(0), verdict(5), verdict("3"),  # ids out of range or not integers
+        "RELEVANT",
+    ])
+    verdicts = rag.parse_batch_evaluation(evaluation, 4)
+    assert verdicts[0] is None and verdicts[2] is None and verdicts[3] is None
+    assert verdicts[1]["Relevance"] == "RELEVANT"
+
+
+@pytest.mark.parametrize("evaluation", ["", "not json", "[{\"Id\": 1,", "{\"Id\": 1}", "[] trailing ["])
+def test_parse_batch_evaluation_of_malformed_responses(evaluation):
+    assert rag.parse_batch_evaluation(evaluation, 3) == [None, None, None]
+
+
+@pytest.mark.parametrize("n", [1, 3, 7])
+def test_split_token_stats_sums_to_the_call(n):
+    tokens = {"prompt_tokens": 1000, "completion_tokens": 101, "total_tokens": 1101}
+    shares = rag.split_token_stats(tokens, n)
+    assert len(shares) == n
+    for key, value in tokens.items():
+        assert sum(share[key] for share in shares) == value
+        assert max(share[key] for share in shares) - min(share[key] for share in shares) <= 1
+
+
+def test_evaluate_relevance_batch_judges_missing_items_again(monkeypatch):
+    calls = []
+
+    def llm(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            # The batch call answers items 1 and 3 only
+            response = json.dumps([verdict(1), verdict(3, "NON_RELEVANT")])
+        else:
+            response = json.dumps({"Relevance": "PARTLY_RELEVANT", "Explanation": "Single."})
+        return response, {"prompt_tokens": 30, "completion_tokens": 9, "total_tokens": 39}
+
+    monkeypatch.setattr(rag, "llm", llm)
+    pairs = [("q1", "a1"), ("q2", "a2"), ("q3", "a3")]
+    results = rag.evaluate_relevance_batch(pairs)
+
+    assert len(calls) == 2 and "Item 3:" in calls[0] and "q2" in calls[1]
+    assert [relevance["Relevance"] for relevance, _ in results] == ["RELEVANT", "PARTLY_RELEVANT", "NON_RELEVANT"]
+    assert [tokens["total_tokens"] for _, tokens in results] == [13, 13 + 39, 13]
+
+
+def test_async_pipeline_runs_the_answer_cache_off_the_event_loop(monkeypatch):
+    calls = []
+
+    class AnswerCache:
+        def lookup(self, question, doc_ids):
+            calls.append(("lookup", threading.current_thread().name))
+            return None
+
+        def store(self, question, doc_ids, answer):
+            calls.append(("store", threading.current_thread().name))
+
+    async def llm_async(prompt):
+        return "Open the account page.", rag.NO_TOKENS
+
+    async def llm_stream_async(prompt):
+        yield "Open the account page.", None
+        yield "", rag.NO_TOKENS
+
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache())
+    monkeypatch.setattr(rag, "search", lambda query: [{"id": "a"}])
+    monkeypatch.setattr(rag, "build_prompt", lambda query, search_results: query)
+    monkeypatch.setattr(rag, "llm_async", llm_async)
+    monkeypatch.setattr(rag, "llm_stream_async", llm_stream_async)
+
+    async def run(executor):
+        answer_data = await rag.rag_async("How do I cancel?", executor, evaluate=False)
+        events = [event async for event, _ in rag.rag_stream_async("How do I cancel?", executor)]
+        return answer_data, events
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="search") as executor:
+        answer_data, events = asyncio.run(run(executor))
+
+    assert answer_data["answer"] == "Open the account page." and events == ["token", "done"]
+    assert [call for call, _ in calls] == ["lookup", "store", "lookup", "store"]
+    assert all(thread.startswith("search") for _, thread in calls)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import sharding
+from conftest import BOOST, FILTER, KEYWORD_FIELDS, TEXT_FIELDS, build_index
+
+
+def ranking(results):
+    return [doc['_id'] for doc in results], [doc['_score'] for doc in results]
+
+
+def assert_same_rankings(sharded, index, questions, **params):
+    params = dict(filter_dict=FILTER, boost_dict=BOOST, num_results=10, output_ids=True, output_scores=True,
+                  **params)
+    for results, question in zip(sharded.search_batch(questions, **params), questions):
+        expected_ids, expected_scores = ranking(index.search(question, **params))
+        ids, scores = ranking(results)
+        assert ids == expected_ids
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-12)
+
+
+@pytest.mark.parametrize("scoring", ['tfidf', 'bm25'])
+@pytest.mark.parametrize("n_shards", [1, 3])
+def test_sharded_rankings_match_index(documents, questions, scoring, n_shards):
+    index = build_index(documents, scoring=scoring)
+    with sharding.ShardedIndex(TEXT_FIELDS, KEYWORD_FIELDS, scoring=scoring, n_shards=n_shards,
+                               processes=False).fit(documents) as sharded:
+        assert sharded.offsets[0] == 0 and sharded.n_docs == len(documents)
+        assert_same_rankings(sharded, index, questions)
+        assert_same_rankings(sharded, index, questions, collapse_field='intent', collapse_size=2)
+
+
+def test_worker_processes_and_snapshots(tmp_path, documents, questions):
+    index = build_index(documents)
+    path = str(tmp_path / "sharded")
+    with sharding.ShardedIndex(TEXT_FIELDS, KEYWORD_FIELDS, n_shards=2).fit(documents) as sharded:
+        assert_same_rankings(sharded, index, questions)
+        sharded.save(path, metadata={'source': 'documents-with-ids.json'})
+
+    assert sharding.ShardedIndex.read_manifest(path)['metadata'] == {'source': 'documents-with-ids.json'}
+    with sharding.ShardedIndex.load(path, processes=False) as loaded:
+        assert loaded.n_shards == 2
+        assert_same_rankings(loaded, index, questions)
+
+
+def test_empty_sharded_index(questions):
+    with sharding.ShardedIndex(TEXT_FIELDS, KEYWORD_FIELDS, n_shards=2, processes=False).fit([]) as sharded:
+        assert sharded.search(questions[0]) == []
+        with pytest.raises(ValueError):
+            sharded.save("unused")
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("requests")
+
+# sse_client.py lives in the project root, next to the apps that use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sse_client  # noqa: E402
+
+
+def test_parse_events():
+    lines = [
+        'event: token',
+        'data: {"delta": "Hel"}',
+        '',
+        'event: token',
+        'data: {"delta": "lo"}',
+        '',
+        ': keep-alive comment',
+        'data: {"note": "no event line"}',
+        '',
+        'event: done',
+        'data: {"conversation_id": "abc"}',
+    ]
+    assert list(sse_client.parse_events(lines)) == [
+        ('token', {'delta': 'Hel'}),
+        ('token', {'delta': 'lo'}),
+        ('message', {'note': 'no event line'}),
+        ('done', {'conversation_id': 'abc'}),
+    ]
+
+
+def test_parse_events_reports_malformed_data_and_goes_on():
+    lines = ['event: token', 'data: {"delta": ', '', 'event: done', 'data: {}']
+    events = list(sse_client.parse_events(lines))
+    assert [event for event, _ in events] == ['error', 'done']
+    assert events[0][1]['error'].startswith("❌ Malformed response from API")
+    assert events[1] == ('done', {})
+    assert list(sse_client.parse_events([])) == []